@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+建立 system_record_batteries 表，每顆電池一筆記錄，使用數值欄位。
+
+system_records 的電池欄位是文字（雙電池機器為 "44000, 40000"），
+數值篩選和統計（例如 battery_health < 60、各型號平均循環次數）需要逐筆解析。
+此表由 system_records 上的觸發器在寫入時自動填充，可以直接建立索引和查詢：
+
+    SELECT r.model, AVG(b.cycle_count)
+    FROM system_record_batteries b JOIN system_records r ON r.id = b.record_id
+    GROUP BY r.model
+
+預覽和標籤仍然使用 system_records 的文字欄位顯示 "a / b"；
+分頁記錄 API 以 batteries=1 返回此表的數值資料（Database.get_batteries）。
+"""
+
+import sys
+import logging
+from sqldb import Database
+
+logger = logging.getLogger('add_battery_table')
+
+# 一筆 system_records 拆成每顆電池一列，{source} 為 system_records 或觸發器的轉換表
+BATTERY_ROWS_SQL = """
+    SELECT r.id AS record_id, i AS battery_index,
+           round(v.design[i])::bigint AS design_capacity,
+           round(v.full_charge[i])::bigint AS full_charge_capacity,
+           round(v.cycles[i])::bigint AS cycle_count,
+           v.health[i] AS health
+    FROM {source} r
+    CROSS JOIN LATERAL (
+        SELECT battery_values(r.design_capacity::text) AS design,
+               battery_values(r.full_charge_capacity::text) AS full_charge,
+               battery_values(r.cycle_count::text) AS cycles,
+               battery_values(r.battery_health::text) AS health
+    ) v
+    CROSS JOIN LATERAL generate_series(1, GREATEST(cardinality(v.design), cardinality(v.full_charge),
+                                                   cardinality(v.cycles), cardinality(v.health))) AS i
+"""
+
+BATTERY_COLUMNS = "record_id, battery_index, design_capacity, full_charge_capacity, cycle_count, health"
+
+# 表、解析函數和觸發器，create_tables 也使用同一份定義
+BATTERY_TABLE_SQL = f"""
+    CREATE TABLE IF NOT EXISTS system_record_batteries (
+        record_id INTEGER NOT NULL,
+        battery_index SMALLINT NOT NULL,
+        design_capacity BIGINT,
+        full_charge_capacity BIGINT,
+        cycle_count BIGINT,
+        health NUMERIC,
+        PRIMARY KEY (record_id, battery_index)
+    );
+
+    CREATE INDEX IF NOT EXISTS idx_system_record_batteries_health
+        ON system_record_batteries (health);
+    CREATE INDEX IF NOT EXISTS idx_system_record_batteries_cycle_count
+        ON system_record_batteries (cycle_count);
+
+    -- "44000, 40000" -> {{44000, 40000}}，無法解析的值為 NULL，空值返回 NULL
+    CREATE OR REPLACE FUNCTION battery_values(value TEXT) RETURNS NUMERIC[] AS $$
+        SELECT array_agg(
+                   CASE WHEN trim(part) ~ '^[0-9]{{1,15}}(\\.[0-9]+)?$' THEN trim(part)::numeric END
+                   ORDER BY n)
+        FROM unnest(string_to_array(NULLIF(trim(value), ''), ',')) WITH ORDINALITY AS t(part, n)
+    $$ LANGUAGE sql IMMUTABLE;
+
+    CREATE OR REPLACE FUNCTION system_record_batteries_insert() RETURNS trigger AS $$
+    BEGIN
+        INSERT INTO system_record_batteries ({BATTERY_COLUMNS})
+        {BATTERY_ROWS_SQL.format(source='new_rows')}
+        ON CONFLICT (record_id, battery_index) DO UPDATE
+        SET design_capacity = EXCLUDED.design_capacity,
+            full_charge_capacity = EXCLUDED.full_charge_capacity,
+            cycle_count = EXCLUDED.cycle_count,
+            health = EXCLUDED.health;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    -- 只有電池欄位改變的記錄需要重建（例如同步狀態的更新不需要）
+    CREATE OR REPLACE FUNCTION system_record_batteries_update() RETURNS trigger AS $$
+    DECLARE
+        changed INTEGER[];
+    BEGIN
+        SELECT array_agg(n.id) INTO changed
+        FROM old_rows o
+        JOIN new_rows n ON n.id = o.id
+        WHERE (o.design_capacity::text, o.full_charge_capacity::text, o.cycle_count::text, o.battery_health::text)
+              IS DISTINCT FROM
+              (n.design_capacity::text, n.full_charge_capacity::text, n.cycle_count::text, n.battery_health::text);
+
+        IF changed IS NULL THEN
+            RETURN NULL;
+        END IF;
+
+        DELETE FROM system_record_batteries WHERE record_id = ANY(changed);
+        INSERT INTO system_record_batteries ({BATTERY_COLUMNS})
+        {BATTERY_ROWS_SQL.format(source='(SELECT * FROM new_rows WHERE id = ANY(changed))')};
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE OR REPLACE FUNCTION system_record_batteries_delete() RETURNS trigger AS $$
+    BEGIN
+        DELETE FROM system_record_batteries b USING old_rows o WHERE b.record_id = o.id;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE OR REPLACE FUNCTION system_record_batteries_truncate() RETURNS trigger AS $$
+    BEGIN
+        TRUNCATE system_record_batteries;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    DROP TRIGGER IF EXISTS system_record_batteries_insert ON system_records;
+    CREATE TRIGGER system_record_batteries_insert
+        AFTER INSERT ON system_records
+        REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION system_record_batteries_insert();
+
+    DROP TRIGGER IF EXISTS system_record_batteries_update ON system_records;
+    CREATE TRIGGER system_record_batteries_update
+        AFTER UPDATE ON system_records
+        REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION system_record_batteries_update();
+
+    DROP TRIGGER IF EXISTS system_record_batteries_delete ON system_records;
+    CREATE TRIGGER system_record_batteries_delete
+        AFTER DELETE ON system_records
+        REFERENCING OLD TABLE AS old_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION system_record_batteries_delete();
+
+    DROP TRIGGER IF EXISTS system_record_batteries_truncate ON system_records;
+    CREATE TRIGGER system_record_batteries_truncate
+        AFTER TRUNCATE ON system_records
+        FOR EACH STATEMENT EXECUTE FUNCTION system_record_batteries_truncate();
+"""
+
+# 從現有記錄重新填充
+BATTERY_BACKFILL_SQL = f"""
+    INSERT INTO system_record_batteries ({BATTERY_COLUMNS})
+    {BATTERY_ROWS_SQL.format(source='system_records')}
+"""
+
+def create_battery_table(db_name):
+    """
+    在指定的資料庫中建立 system_record_batteries 表和觸發器，並從現有記錄填充
+
+    Args:
+        db_name: 資料庫名稱
+
+    Returns:
+        bool: 操作是否成功
+    """
+    logger.info(f"正在處理資料庫: {db_name}")
+
+    try:
+        with Database(db_name=db_name) as db:
+            # 鎖表，避免填充期間有新記錄寫入
+            db.cursor.execute("LOCK TABLE system_records IN SHARE ROW EXCLUSIVE MODE")
+            db.cursor.execute(BATTERY_TABLE_SQL)
+
+            db.cursor.execute("TRUNCATE system_record_batteries")
+            db.cursor.execute(BATTERY_BACKFILL_SQL)
+            logger.info(f"已填充 {db.cursor.rowcount} 筆電池記錄")
+
+            # 提交更改
+            db.connection.commit()
+            db.cursor.execute("ANALYZE system_record_batteries")
+            db.connection.commit()
+            logger.info(f"成功在 {db_name} 建立 system_record_batteries")
+            return True
+
+    except Exception as e:
+        logger.error(f"建立 system_record_batteries 時發生錯誤: {str(e)}")
+        return False
+
+def main():
+    """
+    主函數：為兩個資料庫建立 system_record_batteries
+    """
+    try:
+        # 首先處理主資料庫
+        success_main = create_battery_table('zerodb')
+
+        # 然後處理開發資料庫
+        success_dev = create_battery_table('zerodev')
+
+        if success_main and success_dev:
+            logger.info("成功為兩個資料庫建立 system_record_batteries")
+            return 0
+        else:
+            if not success_main:
+                logger.error("更新 zerodb 失敗")
+            if not success_dev:
+                logger.error("更新 zerodev 失敗")
+            return 1
+
+    except Exception as e:
+        logger.error(f"執行過程中發生錯誤: {str(e)}")
+        return 1
+
+if __name__ == "__main__":
+    # 設置日誌（只在直接執行時設置，被匯入時不影響應用程式的日誌）
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    sys.exit(main())
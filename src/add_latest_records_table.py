@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+建立 system_records_latest 表，記錄每個序號最新一筆 system_records 的 ID。
+由 system_records 上的觸發器自動維護，預覽、查詢和打印只需讀取每個序號的一筆索引記錄，
+不必掃描全部歷史記錄。
+"""
+
+import sys
+import logging
+from sqldb import Database
+
+logger = logging.getLogger('add_latest_records_table')
+
+# 表、觸發器函數和觸發器，create_tables 也使用同一份定義
+LATEST_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS system_records_latest (
+        serialnumber VARCHAR(100) PRIMARY KEY,
+        record_id INTEGER NOT NULL,
+        created_at TIMESTAMP
+    );
+    
+    CREATE INDEX IF NOT EXISTS idx_system_records_latest_created_at
+        ON system_records_latest (created_at DESC);
+    
+    -- 同一序號以 created_at 最新（相同時取 id 最大）的記錄為準
+    CREATE OR REPLACE FUNCTION system_records_latest_upsert() RETURNS trigger AS $$
+    BEGIN
+        INSERT INTO system_records_latest AS l (serialnumber, record_id, created_at)
+        SELECT DISTINCT ON (serialnumber) serialnumber, id, created_at
+        FROM new_rows
+        WHERE serialnumber IS NOT NULL
+        ORDER BY serialnumber, created_at DESC NULLS LAST, id DESC
+        ON CONFLICT (serialnumber) DO UPDATE
+        SET record_id = EXCLUDED.record_id, created_at = EXCLUDED.created_at
+        WHERE (EXCLUDED.created_at, EXCLUDED.record_id) >= (l.created_at, l.record_id)
+           OR l.created_at IS NULL;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+    
+    -- 刪除或修改序號/時間後，重新計算受影響序號的最新記錄
+    CREATE OR REPLACE FUNCTION system_records_latest_refresh() RETURNS trigger AS $$
+    DECLARE
+        changed VARCHAR[];
+    BEGIN
+        IF TG_OP = 'DELETE' THEN
+            SELECT array_agg(DISTINCT serialnumber) INTO changed FROM old_rows;
+        ELSE
+            -- 只有序號或時間改變的記錄需要重新計算（例如 is_current 的更新不需要）
+            SELECT array_agg(DISTINCT v.serialnumber) INTO changed
+            FROM old_rows o
+            JOIN new_rows n ON n.id = o.id
+            CROSS JOIN LATERAL (VALUES (o.serialnumber), (n.serialnumber)) AS v(serialnumber)
+            WHERE (o.serialnumber, o.created_at) IS DISTINCT FROM (n.serialnumber, n.created_at);
+        END IF;
+        
+        IF changed IS NULL THEN
+            RETURN NULL;
+        END IF;
+        
+        DELETE FROM system_records_latest WHERE serialnumber = ANY(changed);
+        INSERT INTO system_records_latest (serialnumber, record_id, created_at)
+        SELECT DISTINCT ON (serialnumber) serialnumber, id, created_at
+        FROM system_records
+        WHERE serialnumber = ANY(changed)
+        ORDER BY serialnumber, created_at DESC NULLS LAST, id DESC;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+    
+    CREATE OR REPLACE FUNCTION system_records_latest_truncate() RETURNS trigger AS $$
+    BEGIN
+        TRUNCATE system_records_latest;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+    
+    DROP TRIGGER IF EXISTS system_records_latest_insert ON system_records;
+    CREATE TRIGGER system_records_latest_insert
+        AFTER INSERT ON system_records
+        REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION system_records_latest_upsert();
+    
+    DROP TRIGGER IF EXISTS system_records_latest_update ON system_records;
+    CREATE TRIGGER system_records_latest_update
+        AFTER UPDATE ON system_records
+        REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION system_records_latest_refresh();
+    
+    DROP TRIGGER IF EXISTS system_records_latest_delete ON system_records;
+    CREATE TRIGGER system_records_latest_delete
+        AFTER DELETE ON system_records
+        REFERENCING OLD TABLE AS old_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION system_records_latest_refresh();
+    
+    DROP TRIGGER IF EXISTS system_records_latest_truncate ON system_records;
+    CREATE TRIGGER system_records_latest_truncate
+        AFTER TRUNCATE ON system_records
+        FOR EACH STATEMENT EXECUTE FUNCTION system_records_latest_truncate();
+"""
+
+def create_latest_table(db_name):
+    """
+    在指定的資料庫中建立 system_records_latest 表和觸發器，並從現有記錄填充
+    
+    Args:
+        db_name: 資料庫名稱
+    
+    Returns:
+        bool: 操作是否成功
+    """
+    logger.info(f"正在處理資料庫: {db_name}")
+    
+    try:
+        with Database(db_name=db_name) as db:
+            # 鎖表，避免填充期間有新記錄寫入
+            db.cursor.execute("LOCK TABLE system_records IN SHARE ROW EXCLUSIVE MODE")
+            db.cursor.execute(LATEST_TABLE_SQL)
+            
+            # 從現有記錄重新填充
+            db.cursor.execute("TRUNCATE system_records_latest")
+            db.cursor.execute("""
+                INSERT INTO system_records_latest (serialnumber, record_id, created_at)
+                SELECT DISTINCT ON (serialnumber) serialnumber, id, created_at
+                FROM system_records
+                WHERE serialnumber IS NOT NULL
+                ORDER BY serialnumber, created_at DESC NULLS LAST, id DESC
+            """)
+            logger.info(f"已填充 {db.cursor.rowcount} 個序號的最新記錄")
+            
+            # 提交更改
+            db.connection.commit()
+            logger.info(f"成功在 {db_name} 建立 system_records_latest")
+            return True
+            
+    except Exception as e:
+        logger.error(f"建立 system_records_latest 時發生錯誤: {str(e)}")
+        return False
+
+def main():
+    """
+    主函數：為兩個資料庫建立 system_records_latest
+    """
+    try:
+        # 首先處理主資料庫
+        success_main = create_latest_table('zerodb')
+        
+        # 然後處理開發資料庫
+        success_dev = create_latest_table('zerodev')
+        
+        if success_main and success_dev:
+            logger.info("成功為兩個資料庫建立 system_records_latest")
+            return 0
+        else:
+            if not success_main:
+                logger.error("更新 zerodb 失敗")
+            if not success_dev:
+                logger.error("更新 zerodev 失敗")
+            return 1
+    
+    except Exception as e:
+        logger.error(f"執行過程中發生錯誤: {str(e)}")
+        return 1
+
+if __name__ == "__main__":
+    # 設置日誌（只在直接執行時設置，被匯入時不影響應用程式的日誌）
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    sys.exit(main())
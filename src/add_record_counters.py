@@ -0,0 +1,233 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+建立 record_counters 表，保存 system_records（總數及各 sync_status）、system_records_latest
+和 product_keys 的記錄數。
+
+計數由觸發器在每個 INSERT/UPDATE/DELETE/TRUNCATE 語句後更新，
+同步統計、預覽和檢查工具讀取計數器（Database.get_counters），不必每次 COUNT(*) 整張表。
+"""
+
+import sys
+import logging
+from sqldb import Database
+
+logger = logging.getLogger('add_record_counters')
+
+# 表、觸發器函數和觸發器，create_tables 也使用同一份定義
+# 計數器名稱: system_records, system_records:<sync_status>, system_records_latest, product_keys
+COUNTERS_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS record_counters (
+        name VARCHAR(100) PRIMARY KEY,
+        count BIGINT NOT NULL DEFAULT 0
+    );
+
+    -- 按名稱排序更新，同時寫入的交易以相同順序鎖定計數器
+    CREATE OR REPLACE FUNCTION record_counters_add(names TEXT[], deltas BIGINT[]) RETURNS void AS $$
+        INSERT INTO record_counters AS c (name, count)
+        SELECT name, SUM(delta)
+        FROM unnest(names, deltas) AS d(name, delta)
+        GROUP BY name
+        HAVING SUM(delta) <> 0
+        ORDER BY name
+        ON CONFLICT (name) DO UPDATE SET count = c.count + EXCLUDED.count
+    $$ LANGUAGE sql;
+
+    CREATE OR REPLACE FUNCTION system_records_counters() RETURNS trigger AS $$
+    DECLARE
+        names TEXT[];
+        deltas BIGINT[];
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            SELECT array_agg(name), array_agg(delta) INTO names, deltas FROM (
+                SELECT 'system_records' AS name, COUNT(*) AS delta FROM new_rows
+                UNION ALL
+                SELECT 'system_records:' || COALESCE(sync_status, ''), COUNT(*) FROM new_rows GROUP BY sync_status
+            ) d;
+        ELSIF TG_OP = 'DELETE' THEN
+            SELECT array_agg(name), array_agg(delta) INTO names, deltas FROM (
+                SELECT 'system_records' AS name, -COUNT(*) AS delta FROM old_rows
+                UNION ALL
+                SELECT 'system_records:' || COALESCE(sync_status, ''), -COUNT(*) FROM old_rows GROUP BY sync_status
+            ) d;
+        ELSE
+            -- 只有 sync_status 改變的記錄影響計數
+            SELECT array_agg(name), array_agg(delta) INTO names, deltas FROM (
+                SELECT 'system_records:' || COALESCE(o.sync_status, '') AS name, -1 AS delta
+                FROM old_rows o JOIN new_rows n ON n.id = o.id
+                WHERE o.sync_status IS DISTINCT FROM n.sync_status
+                UNION ALL
+                SELECT 'system_records:' || COALESCE(n.sync_status, ''), 1
+                FROM old_rows o JOIN new_rows n ON n.id = o.id
+                WHERE o.sync_status IS DISTINCT FROM n.sync_status
+            ) d;
+        END IF;
+
+        IF names IS NOT NULL THEN
+            PERFORM record_counters_add(names, deltas);
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    -- 只保存總數的表，計數器名稱為表名
+    CREATE OR REPLACE FUNCTION table_row_counters() RETURNS trigger AS $$
+    DECLARE
+        delta BIGINT;
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            SELECT COUNT(*) INTO delta FROM new_rows;
+        ELSE
+            SELECT -COUNT(*) INTO delta FROM old_rows;
+        END IF;
+        PERFORM record_counters_add(ARRAY[TG_TABLE_NAME::TEXT], ARRAY[delta]);
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE OR REPLACE FUNCTION record_counters_truncate() RETURNS trigger AS $$
+    BEGIN
+        UPDATE record_counters SET count = 0
+        WHERE name = TG_TABLE_NAME OR name LIKE TG_TABLE_NAME || ':%';
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    -- 重新計算全部計數器（建立時，以及分區分離等不觸發觸發器的操作之後）
+    CREATE OR REPLACE FUNCTION record_counters_refresh() RETURNS void AS $$
+        DELETE FROM record_counters;
+        INSERT INTO record_counters (name, count)
+        SELECT 'system_records', COUNT(*) FROM system_records
+        UNION ALL
+        SELECT 'system_records:' || COALESCE(sync_status, ''), COUNT(*) FROM system_records GROUP BY sync_status
+        UNION ALL
+        SELECT 'system_records_latest', COUNT(*) FROM system_records_latest
+        UNION ALL
+        SELECT 'product_keys', COUNT(*) FROM product_keys;
+    $$ LANGUAGE sql;
+
+    DROP TRIGGER IF EXISTS system_records_counters_insert ON system_records;
+    CREATE TRIGGER system_records_counters_insert
+        AFTER INSERT ON system_records
+        REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION system_records_counters();
+
+    DROP TRIGGER IF EXISTS system_records_counters_update ON system_records;
+    CREATE TRIGGER system_records_counters_update
+        AFTER UPDATE ON system_records
+        REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION system_records_counters();
+
+    DROP TRIGGER IF EXISTS system_records_counters_delete ON system_records;
+    CREATE TRIGGER system_records_counters_delete
+        AFTER DELETE ON system_records
+        REFERENCING OLD TABLE AS old_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION system_records_counters();
+
+    DROP TRIGGER IF EXISTS system_records_counters_truncate ON system_records;
+    CREATE TRIGGER system_records_counters_truncate
+        AFTER TRUNCATE ON system_records
+        FOR EACH STATEMENT EXECUTE FUNCTION record_counters_truncate();
+
+    DROP TRIGGER IF EXISTS product_keys_counters_insert ON product_keys;
+    CREATE TRIGGER product_keys_counters_insert
+        AFTER INSERT ON product_keys
+        REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION table_row_counters();
+
+    DROP TRIGGER IF EXISTS product_keys_counters_delete ON product_keys;
+    CREATE TRIGGER product_keys_counters_delete
+        AFTER DELETE ON product_keys
+        REFERENCING OLD TABLE AS old_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION table_row_counters();
+
+    DROP TRIGGER IF EXISTS product_keys_counters_truncate ON product_keys;
+    CREATE TRIGGER product_keys_counters_truncate
+        AFTER TRUNCATE ON product_keys
+        FOR EACH STATEMENT EXECUTE FUNCTION record_counters_truncate();
+
+    DROP FUNCTION IF EXISTS product_keys_counters();
+
+    DROP TRIGGER IF EXISTS system_records_latest_counters_insert ON system_records_latest;
+    CREATE TRIGGER system_records_latest_counters_insert
+        AFTER INSERT ON system_records_latest
+        REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION table_row_counters();
+
+    DROP TRIGGER IF EXISTS system_records_latest_counters_delete ON system_records_latest;
+    CREATE TRIGGER system_records_latest_counters_delete
+        AFTER DELETE ON system_records_latest
+        REFERENCING OLD TABLE AS old_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION table_row_counters();
+
+    DROP TRIGGER IF EXISTS system_records_latest_counters_truncate ON system_records_latest;
+    CREATE TRIGGER system_records_latest_counters_truncate
+        AFTER TRUNCATE ON system_records_latest
+        FOR EACH STATEMENT EXECUTE FUNCTION record_counters_truncate();
+"""
+
+def create_counters_table(db_name):
+    """
+    在指定的資料庫中建立 record_counters 表和觸發器，並計算目前的記錄數
+
+    Args:
+        db_name: 資料庫名稱
+
+    Returns:
+        bool: 操作是否成功
+    """
+    logger.info(f"正在處理資料庫: {db_name}")
+
+    try:
+        with Database(db_name=db_name) as db:
+            # 鎖表，避免計算期間有新記錄寫入
+            db.cursor.execute("LOCK TABLE system_records, system_records_latest, product_keys IN SHARE ROW EXCLUSIVE MODE")
+            db.cursor.execute(COUNTERS_TABLE_SQL)
+            db.cursor.execute("SELECT record_counters_refresh()")
+
+            # 提交更改
+            db.connection.commit()
+            counters = db.get_counters()
+            logger.info(f"{db_name}: system_records {counters['system_records']} 筆 "
+                        f"(pending {counters['pending']}, synced {counters['synced']})，"
+                        f"{counters['latest']} 個序號，"
+                        f"product_keys {counters['product_keys']} 筆")
+            return True
+
+    except Exception as e:
+        logger.error(f"建立 record_counters 時發生錯誤: {str(e)}")
+        return False
+
+def main():
+    """
+    主函數：為兩個資料庫建立 record_counters
+    """
+    try:
+        # 首先處理主資料庫
+        success_main = create_counters_table('zerodb')
+
+        # 然後處理開發資料庫
+        success_dev = create_counters_table('zerodev')
+
+        if success_main and success_dev:
+            logger.info("成功為兩個資料庫建立 record_counters")
+            return 0
+        else:
+            if not success_main:
+                logger.error("更新 zerodb 失敗")
+            if not success_dev:
+                logger.error("更新 zerodev 失敗")
+            return 1
+
+    except Exception as e:
+        logger.error(f"執行過程中發生錯誤: {str(e)}")
+        return 1
+
+if __name__ == "__main__":
+    # 設置日誌（只在直接執行時設置，被匯入時不影響應用程式的日誌）
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    sys.exit(main())
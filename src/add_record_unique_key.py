@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+為 system_records 加上 (serialnumber, created_at) 唯一鍵。
+先刪除重複的記錄（保留最早插入的一筆），再建立唯一約束，
+之後寫入可以直接使用 INSERT ... ON CONFLICT DO NOTHING。
+"""
+
+import sys
+import logging
+from sqldb import Database
+
+# 設置日誌
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger('add_record_unique_key')
+
+CONSTRAINT_NAME = 'system_records_unique_key'
+
+def add_unique_key(db_name):
+    """
+    在指定的資料庫中刪除重複記錄並建立唯一約束
+    
+    Args:
+        db_name: 資料庫名稱
+    
+    Returns:
+        bool: 操作是否成功
+    """
+    logger.info(f"正在處理資料庫: {db_name}")
+    
+    try:
+        with Database(db_name=db_name) as db:
+            db.cursor.execute("""
+                SELECT 1 FROM pg_constraint
+                WHERE conname = %s AND conrelid = 'system_records'::regclass
+            """, (CONSTRAINT_NAME,))
+            if db.cursor.fetchone():
+                logger.info(f"{db_name} 已有唯一約束 {CONSTRAINT_NAME}，跳過")
+                return True
+            
+            # 鎖表，避免刪除重複記錄後、建立約束前又寫入新的重複記錄
+            db.cursor.execute("LOCK TABLE system_records IN SHARE ROW EXCLUSIVE MODE")
+            
+            # 保留每組 (serialnumber, created_at) 中 id 最小的記錄，
+            # 若被刪除的重複記錄是 current，則保留的記錄也標記為 current
+            db.cursor.execute("""
+                WITH ranked AS (
+                    SELECT id, is_current,
+                           MIN(id) OVER (PARTITION BY serialnumber, created_at) AS keep_id
+                    FROM system_records
+                    WHERE serialnumber IS NOT NULL AND created_at IS NOT NULL
+                ), removed AS (
+                    DELETE FROM system_records r
+                    USING ranked d
+                    WHERE r.id = d.id AND d.id <> d.keep_id
+                    RETURNING d.keep_id, d.is_current
+                ), current AS (
+                    UPDATE system_records r
+                    SET is_current = TRUE
+                    FROM (SELECT DISTINCT keep_id FROM removed WHERE is_current) c
+                    WHERE r.id = c.keep_id
+                )
+                SELECT COUNT(*) AS removed FROM removed
+            """)
+            removed = db.cursor.fetchone()['removed']
+            logger.info(f"已刪除 {removed} 筆重複記錄")
+            
+            db.cursor.execute(f"""
+                ALTER TABLE system_records
+                ADD CONSTRAINT {CONSTRAINT_NAME} UNIQUE (serialnumber, created_at)
+            """)
+            
+            # 提交更改
+            db.connection.commit()
+            logger.info(f"成功在 {db_name} 建立唯一約束 {CONSTRAINT_NAME}")
+            return True
+            
+    except Exception as e:
+        logger.error(f"建立唯一約束時發生錯誤: {str(e)}")
+        return False
+
+def main():
+    """
+    主函數：為兩個資料庫建立唯一約束
+    """
+    try:
+        # 首先處理主資料庫
+        success_main = add_unique_key('zerodb')
+        
+        # 然後處理開發資料庫
+        success_dev = add_unique_key('zerodev')
+        
+        if success_main and success_dev:
+            logger.info("成功為兩個資料庫建立唯一約束")
+            return 0
+        else:
+            if not success_main:
+                logger.error("更新 zerodb 失敗")
+            if not success_dev:
+                logger.error("更新 zerodev 失敗")
+            return 1
+    
+    except Exception as e:
+        logger.error(f"執行過程中發生錯誤: {str(e)}")
+        return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,7 @@
+import os
 from flask import Flask, request, jsonify, send_from_directory
 from print_label_html import app as label_app, print_label_for_record
+from template_env import precompile_templates
 from sqldb import Database
 from datetime import datetime
 from flask_httpauth import HTTPBasicAuth
@@ -74,4 +76,7 @@ def after_request(response):
     return response
 
 if __name__ == '__main__':
+    # Compile the label template before the first print request needs it
+    if os.getenv('PRECOMPILE_TEMPLATES', '1') == '1':
+        precompile_templates()
     app.run(host='0.0.0.0', port=5000, debug=True) 
\ No newline at end of file
@@ -4,11 +4,9 @@ def check_counts():
     """檢查兩個數據庫的記錄數量"""
     # 檢查主數據庫
     with Database() as db:
-        db.cursor.execute("SELECT COUNT(*) as count FROM system_records")
-        prod_system_count = db.cursor.fetchone()['count']
-        
-        db.cursor.execute("SELECT COUNT(*) as count FROM product_keys")
-        prod_product_count = db.cursor.fetchone()['count']
+        counters = db.get_counters()
+        prod_system_count = counters['system_records']
+        prod_product_count = counters['product_keys']
         
         print("\n主數據庫 (zerodb):")
         print(f"System Records: {prod_system_count}")
@@ -16,11 +14,9 @@ def check_counts():
     
     # 檢查開發數據庫
     with Database(db_name='zerodev') as db:
-        db.cursor.execute("SELECT COUNT(*) as count FROM system_records")
-        dev_system_count = db.cursor.fetchone()['count']
-        
-        db.cursor.execute("SELECT COUNT(*) as count FROM product_keys")
-        dev_product_count = db.cursor.fetchone()['count']
+        counters = db.get_counters()
+        dev_system_count = counters['system_records']
+        dev_product_count = counters['product_keys']
         
         print("\n開發數據庫 (zerodev):")
         print(f"System Records: {dev_system_count}")
@@ -0,0 +1,279 @@
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, Optional, Set, Tuple
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Without pyarrow the cache is disabled and files are read directly
+    pa = None
+    pq = None
+
+def file_month(file_path: str) -> Optional[datetime]:
+    """Month of a monthly CSV file named like system_records_Jan2025.csv"""
+    name = os.path.splitext(os.path.basename(file_path))[0]
+    try:
+        return datetime.strptime(name.split('_')[-1], '%b%Y')
+    except ValueError:
+        return None
+
+def is_closed_month(file_path: str, now: Optional[datetime] = None) -> bool:
+    """Whether the file belongs to a month before the current one, so nothing is appended anymore"""
+    month = file_month(file_path)
+    if month is None:
+        return False
+    now = now or datetime.now()
+    return (month.year, month.month) < (now.year, now.month)
+
+# Normalizes one chunk of CSV rows, its output is what the cache stores
+Normalizer = Callable[[pd.DataFrame], pd.DataFrame]
+
+# Entries being written by a thread of this process, see CSVCache._claim
+_populating: Set[str] = set()
+_populating_lock = threading.Lock()
+
+def file_sha256(file_path: str, block_size: int = 1024 * 1024) -> str:
+    """SHA-256 of the file content"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+class CSVCache:
+    def __init__(self, cache_dir: Optional[str] = None, closed_only: bool = True):
+        """Local Parquet cache of parsed and normalized monthly CSV files
+
+        Each file is stored, after the caller's normalize function, as a
+        Parquet file next to a JSON manifest holding the source path, size,
+        mtime and SHA-256 of the CSV. While size and mtime are unchanged the
+        cached copy is loaded without reading the CSV on the network share
+        or normalizing it again; when only the mtime changed the content
+        hash decides. The normalizer version is part of the cache key, so
+        bumping it when the normalization changes invalidates old entries.
+
+        Only one thread of the process fills an entry; another thread
+        reading the same file meanwhile reads the CSV directly.
+
+        Args:
+            cache_dir: Cache directory, defaults to cache/csv in the project root
+            closed_only: Only cache months before the current one (the current month is still appended to)
+        """
+        if cache_dir is None:
+            cache_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "cache", "csv")
+        self.cache_dir = cache_dir
+        self.closed_only = closed_only
+
+    @property
+    def enabled(self) -> bool:
+        return pq is not None
+
+    def cacheable(self, file_path: str) -> bool:
+        return self.enabled and (not self.closed_only or is_closed_month(file_path))
+
+    def _entry_paths(self, file_path: str, read_csv_kwargs: Dict[str, Any],
+                     version: Optional[str] = None) -> Tuple[str, str]:
+        """Data and manifest paths of a file read with the given options and normalizer version"""
+        source = os.path.normcase(os.path.abspath(file_path))
+        options = json.dumps(read_csv_kwargs, sort_keys=True, default=str)
+        digest = hashlib.sha1(f"{source}|{options}|{version}".encode('utf-8')).hexdigest()[:16]
+        name = f"{os.path.splitext(os.path.basename(file_path))[0]}.{digest}"
+        return os.path.join(self.cache_dir, f"{name}.parquet"), os.path.join(self.cache_dir, f"{name}.json")
+
+    def lookup(self, file_path: str, read_csv_kwargs: Dict[str, Any],
+               version: Optional[str] = None) -> Optional[str]:
+        """Path of a valid cached copy, None when the source changed or was never cached"""
+        data_path, manifest_path = self._entry_paths(file_path, read_csv_kwargs, version)
+        if not os.path.exists(data_path) or not os.path.exists(manifest_path):
+            return None
+
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            stat = os.stat(file_path)
+        except (OSError, ValueError):
+            return None
+
+        if stat.st_size != manifest['size']:
+            return None
+        if stat.st_mtime == manifest['mtime']:
+            return data_path
+
+        # Same size but touched or copied, compare the content
+        if file_sha256(file_path) != manifest['sha256']:
+            return None
+        manifest['mtime'] = stat.st_mtime
+        self._write_manifest(manifest_path, manifest)
+        return data_path
+
+    def _write_manifest(self, manifest_path: str, manifest: Dict[str, Any]) -> None:
+        with open(manifest_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2)
+
+    @staticmethod
+    def _claim(data_path: str) -> bool:
+        """Reserve an entry for writing, False when another thread is already writing it"""
+        with _populating_lock:
+            if data_path in _populating:
+                return False
+            _populating.add(data_path)
+            return True
+
+    @staticmethod
+    def _release(data_path: str) -> None:
+        with _populating_lock:
+            _populating.discard(data_path)
+
+    @staticmethod
+    def _tmp_path(data_path: str) -> str:
+        """Temporary file of one writer, other threads and processes use their own"""
+        return f"{data_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+    @staticmethod
+    def _read_chunks(file_path: str, chunksize: int, normalize: Optional[Normalizer],
+                     read_csv_kwargs: Dict[str, Any]) -> Iterator[pd.DataFrame]:
+        """Read and normalize a CSV file in chunks without the cache"""
+        with pd.read_csv(file_path, chunksize=chunksize, **read_csv_kwargs) as reader:
+            for chunk in reader:
+                yield normalize(chunk) if normalize is not None else chunk
+
+    def _store(self, file_path: str, read_csv_kwargs: Dict[str, Any], version: Optional[str],
+               tmp_path: str, stat: os.stat_result, rows: int) -> None:
+        """Publish a written Parquet file if the source did not change while it was read"""
+        data_path, manifest_path = self._entry_paths(file_path, read_csv_kwargs, version)
+        current = os.stat(file_path)
+        if (current.st_size, current.st_mtime) != (stat.st_size, stat.st_mtime):
+            os.remove(tmp_path)
+            return
+
+        os.replace(tmp_path, data_path)
+        self._write_manifest(manifest_path, {
+            'source': file_path,
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+            'sha256': file_sha256(file_path),
+            'rows': rows,
+            'read_csv_kwargs': json.loads(json.dumps(read_csv_kwargs, default=str)),
+            'version': version,
+            'cached_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        })
+
+    def read(self, file_path: str, normalize: Optional[Normalizer] = None, version: Optional[str] = None,
+             **read_csv_kwargs) -> pd.DataFrame:
+        """Read and normalize a CSV file, from the cache when it is unchanged
+
+        Args:
+            file_path: Path to CSV file
+            normalize: Optional function applied to the parsed rows before they are cached
+            version: Version of normalize, part of the cache key
+            read_csv_kwargs: Keyword arguments passed to pd.read_csv, part of the cache key
+
+        Returns:
+            pd.DataFrame: Parsed (and normalized) rows
+        """
+        if not self.cacheable(file_path):
+            df = pd.read_csv(file_path, **read_csv_kwargs)
+            return normalize(df) if normalize is not None else df
+
+        data_path = self.lookup(file_path, read_csv_kwargs, version)
+        if data_path is not None:
+            return pd.read_parquet(data_path)
+
+        stat = os.stat(file_path)
+        df = pd.read_csv(file_path, **read_csv_kwargs)
+        if normalize is not None:
+            df = normalize(df)
+
+        data_path = self._entry_paths(file_path, read_csv_kwargs, version)[0]
+        if not self._claim(data_path):
+            return df
+        tmp_path = self._tmp_path(data_path)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            df.to_parquet(tmp_path, index=False)
+            self._store(file_path, read_csv_kwargs, version, tmp_path, stat, len(df))
+        except Exception as e:
+            print(f"Warning: could not cache {os.path.basename(file_path)}: {str(e)}")
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            self._release(data_path)
+        return df
+
+    def iter_chunks(self, file_path: str, chunksize: int, normalize: Optional[Normalizer] = None,
+                    version: Optional[str] = None, **read_csv_kwargs) -> Iterator[pd.DataFrame]:
+        """Read and normalize a CSV file in chunks, from the cache when it is unchanged
+
+        On a miss the normalized chunks are written to the cache as they are
+        yielded, so memory stays bounded by the chunk size.
+
+        Args:
+            file_path: Path to CSV file
+            chunksize: Rows per chunk
+            normalize: Optional function applied to every chunk before it is cached
+            version: Version of normalize, part of the cache key
+            read_csv_kwargs: Keyword arguments passed to pd.read_csv, part of the cache key
+
+        Yields:
+            pd.DataFrame: Next chunk, with an index continuing across chunks
+        """
+        if not self.cacheable(file_path):
+            yield from self._read_chunks(file_path, chunksize, normalize, read_csv_kwargs)
+            return
+
+        data_path = self.lookup(file_path, read_csv_kwargs, version)
+        if data_path is not None:
+            start = 0
+            for batch in pq.ParquetFile(data_path).iter_batches(batch_size=chunksize):
+                chunk = batch.to_pandas()
+                chunk.index = pd.RangeIndex(start, start + len(chunk))
+                start += len(chunk)
+                yield chunk
+            return
+
+        data_path = self._entry_paths(file_path, read_csv_kwargs, version)[0]
+        if not self._claim(data_path):
+            # Another thread is filling this entry, read the CSV instead of waiting for it
+            yield from self._read_chunks(file_path, chunksize, normalize, read_csv_kwargs)
+            return
+
+        stat = os.stat(file_path)
+        tmp_path = self._tmp_path(data_path)
+        writer = None
+        caching = True
+        rows = 0
+        try:
+            for chunk in self._read_chunks(file_path, chunksize, normalize, read_csv_kwargs):
+                if caching:
+                    try:
+                        table = pa.Table.from_pandas(chunk, preserve_index=False)
+                        if writer is None:
+                            os.makedirs(self.cache_dir, exist_ok=True)
+                            # A column that is empty in the first chunk holds text in later ones
+                            schema = pa.schema([field.with_type(pa.string()) if pa.types.is_null(field.type)
+                                                else field for field in table.schema])
+                            writer = pq.ParquetWriter(tmp_path, schema)
+                        writer.write_table(table.cast(writer.schema))
+                        rows += len(chunk)
+                    except Exception as e:
+                        # e.g. a column inferred as int in one chunk and float in the next
+                        print(f"Warning: could not cache {os.path.basename(file_path)}: {str(e)}")
+                        caching = False
+                yield chunk
+
+            if writer is not None:
+                writer.close()
+                writer = None
+                if caching:
+                    self._store(file_path, read_csv_kwargs, version, tmp_path, stat, rows)
+        finally:
+            # Not fully read (or failed), drop the partial file
+            if writer is not None:
+                writer.close()
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            self._release(data_path)
@@ -0,0 +1,154 @@
+import io
+import os
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterator, Optional
+import pandas as pd
+
+# Rows per chunk for backfills and reimports, bounds the memory used per file
+CSV_CHUNK_SIZE = 5000
+
+def iter_csv_chunks(file_path: str, chunksize: int = CSV_CHUNK_SIZE, cache=None,
+                    normalize: Optional[Callable[[pd.DataFrame], pd.DataFrame]] = None,
+                    version: Optional[str] = None, **read_csv_kwargs) -> Iterator[pd.DataFrame]:
+    """Read a CSV file as DataFrames of at most chunksize rows
+
+    Only one chunk is held in memory at a time, so peak memory depends on
+    the chunk size and not on the size of the file.
+
+    Args:
+        file_path: Path to CSV file
+        chunksize: Rows per chunk
+        cache: Optional CSVCache serving unchanged closed months from local Parquet files
+        normalize: Optional function applied to every chunk, the cache stores its output
+        version: Version of normalize, part of the cache key
+        read_csv_kwargs: Extra keyword arguments passed to pd.read_csv
+
+    Yields:
+        pd.DataFrame: Next chunk, with an index continuing across chunks
+    """
+    if cache is not None:
+        yield from cache.iter_chunks(file_path, chunksize, normalize, version, **read_csv_kwargs)
+        return
+
+    with pd.read_csv(file_path, chunksize=chunksize, **read_csv_kwargs) as reader:
+        for chunk in reader:
+            yield normalize(chunk) if normalize is not None else chunk
+
+@dataclass
+class TailState:
+    """Read position of a monitored CSV file"""
+    offset: int = 0        # Byte offset just after the last complete line parsed
+    header: bytes = b''    # Raw header line, re-used to parse appended bytes
+    size: int = 0          # File size when the offset was recorded
+    inode: int = 0         # st_ino, used to detect a replaced file
+    mtime: float = 0.0     # st_mtime when the offset was recorded
+
+@dataclass
+class TailRead:
+    """Result of one incremental read"""
+    frame: pd.DataFrame
+    state: TailState
+    full_read: bool
+
+class CSVTailReader:
+    def __init__(self, state_store=None, **read_csv_kwargs):
+        """Incremental reader for append-only CSV files
+
+        The intake station only ever appends lines to the monthly
+        system_records CSV, so after the first pass only the bytes written
+        since the last read need to be parsed. The file is read again from
+        the start when it was truncated, replaced or its header changed.
+
+        Args:
+            state_store: Optional IngestStateStore keeping the positions across restarts
+            read_csv_kwargs: Extra keyword arguments passed to pd.read_csv
+        """
+        self.state_store = state_store
+        self.read_csv_kwargs = read_csv_kwargs
+        self.states: Dict[str, TailState] = {}
+
+    @staticmethod
+    def _key(file_path: str) -> str:
+        return os.path.normcase(os.path.abspath(file_path))
+
+    def get_state(self, file_path: str) -> Optional[TailState]:
+        """Get the committed read position of a file"""
+        key = self._key(file_path)
+        if key not in self.states and self.state_store is not None:
+            state = self.state_store.load_watermark(key)
+            if state is not None:
+                self.states[key] = state
+        return self.states.get(key)
+
+    def commit(self, file_path: str, state: TailState) -> None:
+        """Store the read position once every row has been written
+
+        Rows of a read that is not committed are parsed again by the next
+        read, which is how rows that failed to write are retried.
+
+        Args:
+            file_path: Path to CSV file
+            state: State returned by read_new_rows
+        """
+        key = self._key(file_path)
+        self.states[key] = state
+        if self.state_store is not None:
+            self.state_store.save_watermark(key, state)
+
+    def reset(self, file_path: str) -> None:
+        """Forget the read position so the next read parses the whole file"""
+        key = self._key(file_path)
+        self.states.pop(key, None)
+        if self.state_store is not None:
+            self.state_store.delete_watermark(key)
+
+    def _needs_full_read(self, state: Optional[TailState], stat: os.stat_result, header: bytes) -> bool:
+        """Check whether the file was truncated or rotated since the last read"""
+        if state is None or state.offset == 0:
+            return True
+        if stat.st_size < state.offset:
+            return True  # Truncated
+        if state.inode and stat.st_ino and stat.st_ino != state.inode:
+            return True  # Replaced by a new file
+        return header != state.header
+
+    def read_new_rows(self, file_path: str) -> TailRead:
+        """Parse the rows appended since the last committed read
+
+        Only complete lines are parsed; a partially written last line is
+        left for the next read. The returned state must be passed to
+        commit() only after all rows were written successfully.
+
+        Args:
+            file_path: Path to CSV file
+
+        Returns:
+            TailRead: New rows, the state to commit and whether the whole file was read
+        """
+        state = self.get_state(file_path)
+
+        with open(file_path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            header = f.readline()
+            if not header.endswith(b'\n'):
+                # Header not completely written yet
+                return TailRead(pd.DataFrame(), state or TailState(), False)
+
+            full_read = self._needs_full_read(state, stat, header)
+            start = len(header) if full_read else state.offset
+            f.seek(start)
+            data = f.read(max(0, stat.st_size - start))
+
+        # Keep a trailing partial line for the next read
+        data = data[:data.rfind(b'\n') + 1]
+
+        new_state = TailState(
+            offset=start + len(data),
+            header=header,
+            size=stat.st_size,
+            inode=stat.st_ino,
+            mtime=stat.st_mtime
+        )
+
+        frame = pd.read_csv(io.BytesIO(header + data), **self.read_csv_kwargs)
+        return TailRead(frame, new_state, full_read)
@@ -1,5 +1,7 @@
 import os
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from typing import Optional, Dict, List
 import pandas as pd
@@ -7,28 +9,53 @@ from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 from test_api import APIConnection, prepare_request_data
 from sqldb import Database
+from csv_reader import CSVTailReader
+from event_queue import CoalescingEventQueue
+from ingest_state import IngestStateStore
+from timestamp_parser import TimestampParser
+from record_normalizer import SYSTEM_RECORD_COLUMNS, normalize_system_records, record_timestamps, to_insert_rows
+from system_record_writer import IngestReport, SystemRecordWriter, WriteResult
+from partitioning import ensure_partitions
 import json
 import logging
-from html_preview import generate_html_preview
+from preview_scheduler import mark_preview_dirty
+
+# Every intake row is written to both databases
+TARGET_DATABASES = ('zerodb', 'zerodev')
 
 class CSVSyncManager:
-    def __init__(self, base_path: str):
+    def __init__(self, base_path: str, write_mode: str = 'bulk', commit_mode: str = 'batch'):
         """Initialize sync manager
         
         Args:
             base_path: Base path for CSV files
+            write_mode: 'bulk' (COPY + single INSERT per batch) or 'row' (one INSERT per record)
+            commit_mode: 'batch' (one commit per batch, savepoint per row) or 'row' (commit every insert)
         """
         self.base_path = base_path
+        self.write_mode = write_mode
+        self.commit_mode = commit_mode
+        self.ingest_reports: Dict[str, IngestReport] = {}  # Last ingest report per file
+        self.write_pool = ThreadPoolExecutor(max_workers=len(TARGET_DATABASES), thread_name_prefix="db_write")
         self.api = None
         
         # 為日誌系統增加日期跟踪
         self.log_date = datetime.now().strftime('%Y%m%d')
         self.log_handlers = {}
+        self.log_lock = threading.Lock()
         
         self.setup_logging()
         self.last_printed_sn = None  # Record last printed serial number
         self.last_print_time = None  # Record last printed time
         
+        # Only parse the lines appended to each CSV file since the last event,
+        # keeping the read positions and ingested keys in a local state store
+        self.state_store = IngestStateStore()
+        self.tail_reader = CSVTailReader(state_store=self.state_store)
+        self.last_csv_records = {}  # Last parsed row per file, used for reprinting
+        self.timestamp_parser = TimestampParser()  # Timestamp format detected once per file
+        self.partition_months = {}  # Month whose partitions were last ensured, per database
+        
     def setup_logging(self):
         """Setup logging configuration"""
         self.logger = logging.getLogger("csv_sync")
@@ -69,7 +96,13 @@ class CSVSyncManager:
     def check_log_date(self):
         """檢查日期是否變化，如果是則更新日誌文件"""
         current_date = datetime.now().strftime('%Y%m%d')
-        if current_date != self.log_date:
+        if current_date == self.log_date:
+            return
+        
+        # 兩個資料庫的寫入在不同線程中記錄日誌, 切換時加鎖
+        with self.log_lock:
+            if current_date == self.log_date:
+                return
             # 日期已變化，需要切換到新的日誌文件
             self.log_date = current_date
             
@@ -148,9 +181,17 @@ class CSVSyncManager:
                     self.log_error("API connection failed")
                     return False
             
-            # Read CSV file
-            df = pd.read_csv(file_path)
-            self.log_info(f"Found {len(df)} records")
+            # Read rows appended since the last processed event
+            tail = self.tail_reader.read_new_rows(file_path)
+            df = tail.frame
+            if tail.full_read:
+                self.log_info(f"Found {len(df)} records (full read)")
+            else:
+                self.log_info(f"Found {len(df)} appended records")
+            
+            if df.columns.empty:
+                self.log_warning("CSV header not completely written yet")
+                return True
             
             # Process timestamp
             try:
@@ -159,38 +200,20 @@ class CSVSyncManager:
                     # Save original Timestamp data
                     df['original_timestamp'] = df['Timestamp']
                     
-                    # Clean up timestamp format
-                    df['Timestamp'] = df['Timestamp'].apply(
-                        lambda x: str(x).strip() if pd.notna(x) else None
+                    # Parse with the format detected for this file, only rows
+                    # that don't match it go through the slower mixed parser
+                    df['created_at'] = self.timestamp_parser.parse(
+                        df['Timestamp'], key=file_path, fingerprint=(tail.state.inode, tail.state.header)
                     )
-                    
-                    # Convert to datetime, keeping original format
-                    df['created_at'] = pd.to_datetime(
-                        df['Timestamp'],
-                        format='mixed',
-                        errors='coerce'
-                    )
-                    
-                    # If conversion fails, try other formats
-                    mask = pd.isna(df['created_at'])
-                    if mask.any():
-                        self.log_warning("Some timestamps failed to parse, trying alternative formats")
-                        for fmt in ['%m/%d/%Y %H:%M', '%Y-%m-%d %H:%M:%S', '%d/%m/%Y %H:%M']:
-                            try:
-                                df.loc[mask, 'created_at'] = pd.to_datetime(
-                                    df.loc[mask, 'Timestamp'],
-                                    format=fmt,
-                                    errors='coerce'
-                                )
-                                mask = pd.isna(df['created_at'])
-                                if not mask.any():
-                                    break
-                            except:
-                                continue
+                    if self.timestamp_parser.last_fallback_count:
+                        self.log_warning(f"{self.timestamp_parser.last_fallback_count} timestamps did not match "
+                                         f"the file format, parsed individually")
                 
                 elif 'Date' in df.columns:
                     self.log_warning("Using Date column instead of Timestamp")
-                    df['created_at'] = pd.to_datetime(df['Date'], format='mixed', errors='coerce')
+                    df['created_at'] = self.timestamp_parser.parse(
+                        df['Date'], key=file_path, fingerprint=(tail.state.inode, tail.state.header)
+                    )
                     df['original_timestamp'] = df['Date']
                 else:
                     self.log_warning("No Timestamp or Date column found, using current time")
@@ -217,56 +240,21 @@ class CSVSyncManager:
                 return False
             
             # Save last record
-            latest_csv_record = df.iloc[-1] if not df.empty else None
+            if not df.empty:
+                self.last_csv_records[file_path] = df.iloc[-1]
+            latest_csv_record = self.last_csv_records.get(file_path)
             if latest_csv_record is not None:
                 self.log_info(f"Latest record: {latest_csv_record.get('SerialNumber', '')}")
             
-            # Get last processed time from both databases
-            with Database() as zerodb, Database(db_name='zerodev') as zerodev:
-                # Get all existing serial numbers from both databases
-                zerodb.cursor.execute("SELECT serialnumber FROM system_records")
-                zerodev.cursor.execute("SELECT serialnumber FROM system_records")
-                
-                zerodb_serials = {r['serialnumber'] for r in zerodb.cursor.fetchall()}
-                zerodev_serials = {r['serialnumber'] for r in zerodev.cursor.fetchall()}
-                
-                # Get the last processed timestamps
-                zerodb.cursor.execute("SELECT MAX(created_at) as last_timestamp FROM system_records")
-                zerodev.cursor.execute("SELECT MAX(created_at) as last_timestamp FROM system_records")
-                
-                zerodb_last = zerodb.cursor.fetchone()['last_timestamp'] or pd.Timestamp.min
-                zerodev_last = zerodev.cursor.fetchone()['last_timestamp'] or pd.Timestamp.min
-                
-                # Use the earlier timestamp as a baseline
-                last_processed_time = min(zerodb_last, zerodev_last)
-                
-                self.log_info(f"Last processed time: {last_processed_time}")
-                
-                # Check record counts in both databases
-                zerodb.cursor.execute("SELECT COUNT(*) as count FROM system_records")
-                zerodev.cursor.execute("SELECT COUNT(*) as count FROM system_records")
-                
-                zerodb_count = zerodb.cursor.fetchone()['count']
-                zerodev_count = zerodev.cursor.fetchone()['count']
-                
-                self.log_info(f"Current record count - main database: {zerodb_count}, development database: {zerodev_count}")
-                
-                if zerodb_count != zerodev_count:
-                    self.log_warning(f"Database record count mismatch!")
-
-            # Process records that are either:
-            # 1. Newer than the last processed time, or
-            # 2. Have a serial number that doesn't exist in either database
-            existing_serials = zerodb_serials.union(zerodev_serials)
-            new_records = df[
-                (df['created_at'] > last_processed_time) | 
-                (~df['SerialNumber'].isin(existing_serials))
-            ]
+            # Skip rows already ingested, using the local state store instead
+            # of loading every serial number from both databases
+            new_records = self.state_store.filter_unseen(df)
             self.log_info(f"Found {len(new_records)} new records to process")
             
             # Print latest label even if no new records
             if len(new_records) == 0:
                 self.log_info("No new records to process")
+                self.tail_reader.commit(file_path, tail.state)
                 # If there's a latest record, check if label needs printing
                 if latest_csv_record is not None:
                     try:
@@ -285,14 +273,7 @@ class CSVSyncManager:
                         
                         # Find matching record in database
                         with Database() as db:
-                            db.cursor.execute("""
-                                SELECT id, created_at 
-                                FROM system_records 
-                                WHERE serialnumber = %s
-                                ORDER BY created_at DESC 
-                                LIMIT 1
-                            """, (serialnumber,))
-                            record = db.cursor.fetchone()
+                            record = db.get_latest_record(serialnumber, "r.id, r.created_at")
                             
                             if record:
                                 self.log_info(f"Found matching record in database - ID: {record['id']}, Created: {record['created_at']}")
@@ -314,29 +295,51 @@ class CSVSyncManager:
                         traceback.print_exc()
                 return True
             
-            # Update both databases
-            success_main = self._update_database(new_records, 'zerodb')
-            success_dev = self._update_database(new_records, 'zerodev')
+            # Normalize once, then write both databases concurrently
+            timestamps, rows = self._prepare_rows(new_records)
+            report = IngestReport(file_path, rows_read=len(df), new_rows=len(new_records))
+            self.ingest_reports[file_path] = report
+            futures = {
+                db_name: self.write_pool.submit(self._update_database, rows, timestamps, db_name, report)
+                for db_name in TARGET_DATABASES
+            }
             
-            # Verify updated record count
-            with Database() as zerodb, Database(db_name='zerodev') as zerodev:
-                zerodb.cursor.execute("SELECT COUNT(*) as count FROM system_records")
-                zerodev.cursor.execute("SELECT COUNT(*) as count FROM system_records")
-                
-                new_zerodb_count = zerodb.cursor.fetchone()['count']
-                new_zerodev_count = zerodev.cursor.fetchone()['count']
-                
-                self.log_info(f"Updated record counts - zerodb: {new_zerodb_count}, zerodev: {new_zerodev_count}")
-                
-                if new_zerodb_count != new_zerodev_count:
-                    self.log_error(f"Database sync failed! Record counts still mismatch after update!")
-                    self.log_error(f"zerodb: {new_zerodb_count}, zerodev: {new_zerodev_count}")
-                    return False
+            # Label printing and API upload only wait for zerodb, zerodev keeps writing meanwhile
+            main_result = futures['zerodb'].result()
+            if main_result is not None:
+                self._handle_new_records(main_result, rows)
+            dev_result = futures['zerodev'].result()
+            
+            success_main = main_result is not None
+            success_dev = dev_result is not None
+            self._log_ingest_report(report)
+            
+            # Failed rows are read again on the next event: the rows both databases
+            # wrote (or already had) are marked seen, and the read position only
+            # moves past these rows once none of them failed
+            if success_main and success_dev:
+                failed = main_result.failed_indexes | dev_result.failed_indexes
+                self.state_store.mark_seen(new_records, failed=failed)
+                if failed:
+                    self.log_warning(f"{len(failed)} records failed, they are read again on the next event")
+                else:
+                    self.tail_reader.commit(file_path, tail.state)
+            
+            # Verify both databases took the same rows, using the rows each insert
+            # returned instead of recounting both tables
+            if success_main and success_dev and not self._verify_write_results(main_result, dev_result):
+                return False
             
-            # Generate preview
-            html_path = generate_html_preview()
-            if html_path:
-                self.log_info(f"Updated preview: {html_path}")
+            # Only informational, the rows are already committed
+            try:
+                with Database() as zerodb, Database(db_name='zerodev') as zerodev:
+                    self.log_info(f"Updated record counts - zerodb: {zerodb.get_counters()['system_records']}, "
+                                  f"zerodev: {zerodev.get_counters()['system_records']}")
+            except Exception as e:
+                self.log_warning(f"Could not read record counts: {str(e)}")
+            
+            # Rebuild the preview (debounced, merged with other pending requests)
+            mark_preview_dirty("system_records")
             
             return success_main and success_dev
                 
@@ -346,205 +349,172 @@ class CSVSyncManager:
             traceback.print_exc()
             return False
 
-    def _update_database(self, df: pd.DataFrame, db_name: str) -> bool:
-        """Update specified database
+    def _verify_write_results(self, main_result: WriteResult, dev_result: WriteResult) -> bool:
+        """Compare the rows written to zerodb and zerodev
+        
+        A row inserted (RETURNING id) in one database and already present in
+        the other means the databases had diverged and are now caught up.
+        A row that failed in only one database is missing from it.
+        
+        Returns:
+            bool: False if a row was written to one database only
+        """
+        main_inserted = {record['index']: record for record in main_result.inserted}
+        dev_inserted = {record['index']: record for record in dev_result.inserted}
+        main_failed = {record['index']: record for record in main_result.failed}
+        dev_failed = {record['index']: record for record in dev_result.failed}
+        
+        for index in sorted(main_inserted.keys() ^ dev_inserted.keys()):
+            if index in main_failed or index in dev_failed:
+                continue
+            new_in, record = (('zerodb', main_inserted[index]) if index in main_inserted
+                              else ('zerodev', dev_inserted[index]))
+            self.log_warning(f"Record SerialNumber={record['serialnumber']} was new in {new_in} only, "
+                             f"the other database already had it")
+        
+        diverged = sorted(main_failed.keys() ^ dev_failed.keys())
+        if diverged:
+            self.log_error(f"Database sync failed! {len(diverged)} records were written to one database only")
+            for index in diverged:
+                failed_in, record = (('zerodb', main_failed[index]) if index in main_failed
+                                     else ('zerodev', dev_failed[index]))
+                self.log_error(f"  SerialNumber={record['serialnumber']} failed in {failed_in}")
+            return False
+        return True
+    
+    def _log_ingest_report(self, report: IngestReport):
+        """Log the per-file ingest report, failed rows at error level"""
+        log = self.log_error if report.has_failures else self.log_info
+        for line in report.summary_lines():
+            log(line)
+    
+    def _prepare_rows(self, df: pd.DataFrame):
+        """Normalize new CSV rows into insert tuples shared by both databases
         
         Args:
             df: DataFrame containing records
+            
+        Returns:
+            tuple: (timestamps, rows) in SYSTEM_RECORD_COLUMNS order
+        """
+        timestamps = record_timestamps(df)
+        missing_timestamps = int(pd.isna(df['created_at']).sum()) if 'created_at' in df.columns else len(df)
+        if missing_timestamps:
+            self.log_warning(f"Missing timestamp for {missing_timestamps} records, using current time")
+        records = normalize_system_records(df, timestamps)
+        return timestamps, to_insert_rows(records)
+    
+    def _ensure_partitions(self, db: Database, db_name: str) -> None:
+        """Create this and next month's partitions once per month, when system_records is partitioned"""
+        month = datetime.now().strftime('%Y-%m')
+        if self.partition_months.get(db_name) == month:
+            return
+        try:
+            created = ensure_partitions(db)
+            if created:
+                self.log_info(f"Created partitions in {db_name}: {', '.join(created)}")
+            self.partition_months[db_name] = month
+        except Exception as e:
+            # Rows still land in the default partition, retried on the next write
+            db.connection.rollback()
+            self.log_warning(f"Could not create partitions in {db_name}: {str(e)}")
+
+    def _update_database(self, rows: List[tuple], timestamps: pd.Series, db_name: str,
+                         report: Optional[IngestReport] = None) -> Optional[WriteResult]:
+        """Update specified database, run from the write pool
+        
+        Args:
+            rows: Normalized insert tuples from _prepare_rows
+            timestamps: Parsed timestamps of the rows
             db_name: Database name
+            report: Ingest report collecting the write result of each database
             
         Returns:
-            bool: Whether update was successful
+            Optional[WriteResult]: Write result, None if the update failed
         """
         try:
             self.log_info(f"Updating {db_name} database...")
-            records_processed = 0
-            latest_record_id = None
-            latest_record_sn = None
-            api_records = []  # Collect records for API upload
             
             with Database(db_name=db_name) as db:
-                for _, row in df.iterrows():
-                    try:
-                        serialnumber = str(row.get('SerialNumber', '')).strip()
-                        timestamp = row.get('created_at')
-                        
-                        # Simplify record processing output
-                        self.log_debug(f"Processing record: {serialnumber}")
-                        
-                        # Ensure timestamp consistency
-                        if pd.isna(timestamp):
-                            self.log_warning(f"Missing timestamp for SN: {serialnumber}, using current time")
-                            timestamp = pd.Timestamp.now()
-                        else:
-                            # Ensure timestamp is Timestamp type
-                            timestamp = pd.to_datetime(timestamp)
-                            # Remove time zone information to maintain consistency
-                            if timestamp.tzinfo is not None:
-                                timestamp = timestamp.tz_localize(None)
-                        
-                        self.log_info(f"Processing record in {db_name}: SerialNumber={serialnumber}, Timestamp={timestamp}")
-                        
-                        # Check if record already exists with same serial number and timestamp
-                        db.cursor.execute("""
-                            SELECT id FROM system_records 
-                            WHERE serialnumber = %s AND created_at = %s::timestamp
-                        """, (serialnumber, timestamp))
-                        
-                        existing_record = db.cursor.fetchone()
-                        if not existing_record:
-                            # Process disk data - keep original format
-                            disks_str = str(row.get('Disks', '')).strip() if pd.notna(row.get('Disks')) else ''
-                            
-                            # Process battery information
-                            battery_data = {
-                                'design_capacity': None,
-                                'full_charge_capacity': None,
-                                'cycle_count': None,
-                                'battery_health': None
-                            }
-                            
-                            # 直接處理電池數據，保留原始格式不轉換
-                            def process_battery_value(value):
-                                if pd.isna(value):
-                                    return None
-                                return str(value).strip()
-                            
-                            # 不再需要電池JSON數據
-                            # battery_json = {}
-                            
-                            # Design capacity - 保留原始格式
-                            design_capacity = process_battery_value(row.get('Design_Capacity'))
-                            
-                            # Actual capacity - 保留原始格式
-                            full_charge_capacity = process_battery_value(row.get('Full_Charge_Capacity'))
-                            
-                            # Cycle count - 保留原始格式
-                            cycle_count = process_battery_value(row.get('Cycle_Count'))
-                            
-                            # Battery health - 保留原始格式
-                            battery_health = process_battery_value(row.get('Battery_Health'))
-                            
-                            # Directly use original format, no conversion
-                            insert_data = {
-                                'serialnumber': serialnumber,
-                                'computername': str(row.get('ComputerName', '')).strip() if pd.notna(row.get('ComputerName')) else None,
-                                'manufacturer': str(row.get('Manufacturer', '')).strip(),
-                                'model': str(row.get('Model', '')).strip(),
-                                'systemsku': str(row.get('SystemSKU', '')).strip() if pd.notna(row.get('SystemSKU')) else None,
-                                'ram_gb': float(row.get('RAM_GB', 0)) if pd.notna(row.get('RAM_GB')) else 0,
-                                'disks': disks_str,  # Directly use original string, no conversion
-                                'created_at': row.get('original_timestamp') if pd.notna(row.get('original_timestamp')) else timestamp,
-                                'operatingsystem': str(row.get('OperatingSystem', '')).strip(),
-                                'cpu': str(row.get('CPU', '')).strip(),
-                                'resolution': str(row.get('Resolution', '')).strip() if pd.notna(row.get('Resolution')) else None,
-                                'graphicscard': str(row.get('GraphicsCard', '')).strip(),
-                                'touchscreen': str(row.get('TouchScreen', '')).strip() if pd.notna(row.get('TouchScreen')) else None,
-                                'design_capacity': design_capacity,
-                                'full_charge_capacity': full_charge_capacity,
-                                'cycle_count': cycle_count,
-                                'battery_health': battery_health
-                            }
-                            
-                            self.log_info(f"Inserting new record to {db_name}: {insert_data}")
-                            
-                            try:
-                                db.cursor.execute("""
-                                    INSERT INTO system_records (
-                                        serialnumber, computername, manufacturer, model,
-                                        systemsku, ram_gb, disks, created_at, is_current,
-                                        sync_status, operatingsystem, cpu, resolution,
-                                        graphicscard, touchscreen, design_capacity,
-                                        full_charge_capacity, cycle_count, battery_health
-                                    ) VALUES (
-                                        %(serialnumber)s, %(computername)s, %(manufacturer)s,
-                                        %(model)s, %(systemsku)s, %(ram_gb)s, %(disks)s,
-                                        %(created_at)s, true, 'pending', %(operatingsystem)s,
-                                        %(cpu)s, %(resolution)s, %(graphicscard)s,
-                                        %(touchscreen)s, %(design_capacity)s,
-                                        %(full_charge_capacity)s, %(cycle_count)s,
-                                        %(battery_health)s
-                                    ) RETURNING id
-                                """, insert_data)
-                                
-                                # Get ID of new inserted record
-                                new_record = db.cursor.fetchone()
-                                if new_record:
-                                    record_id = new_record['id']
-                                    latest_record_id = record_id
-                                    latest_record_sn = serialnumber
-                                    records_processed += 1
-                                    
-                                    # Collect records for API upload
-                                    api_records.append(insert_data)
-                                    
-                                    # Explicitly commit after each successful insert
-                                    db.connection.commit()
-                                    self.log_info(f"Successfully inserted record with ID: {record_id}")
-                                    
-                            except Exception as e:
-                                self.log_error(f"Error inserting record: {str(e)}")
-                                db.connection.rollback()
-                                continue
-                            
-                    except Exception as e:
-                        self.log_error(f"Record processing error: {str(e)}")
-                        db.connection.rollback()
-                        continue
-                
-                # Print label
-                if db_name == 'zerodb' and latest_record_id is not None:
-                    try:
-                        from print_label_html import print_label_by_id
-                        # Wait a short time to ensure the record is fully committed
-                        time.sleep(0.5)
-                        if print_label_by_id(latest_record_id):
-                            self.log_info(f"Label printed: {latest_record_sn}")
-                            self.last_printed_sn = latest_record_sn
-                            self.last_print_time = datetime.now()
-                        else:
-                            self.log_error(f"Label printing failed for ID: {latest_record_id}")
-                    except Exception as e:
-                        self.log_error(f"Printing error: {str(e)}")
+                self._ensure_partitions(db, db_name)
                 
-                # If there's new records, upload to API
-                if api_records and db_name == 'zerodb':  # Only upload to main database
-                    try:
-                        if not hasattr(self, 'api') or self.api is None:
-                            if not self.initialize_api():
-                                self.log_error("Failed to initialize API connection")
-                                return False
-                        
-                        # Prepare API request data
-                        request_data = prepare_request_data(api_records)
-                        
-                        # Send data to API
-                        response = self.api.send_data(request_data)
-                        if response.get('error'):
-                            self.log_error(f"API upload failed: {response.get('error')}")
-                        else:
-                            self.log_info(f"Successfully uploaded {len(api_records)} records to API")
-                            
-                    except Exception as e:
-                        self.log_error(f"Error uploading to API: {str(e)}")
-                
-                # Generate preview after all updates are complete
-                if records_processed > 0:
-                    try:
-                        html_path = generate_html_preview()
-                        if html_path:
-                            self.log_info(f"Updated preview: {html_path}")
-                        else:
-                            self.log_error("Failed to generate preview")
-                    except Exception as e:
-                        self.log_error(f"Error generating preview: {str(e)}")
+                # One COPY + INSERT ... SELECT for the whole batch, existing
+                # (serialnumber, created_at) rows are skipped by the database
+                writer = SystemRecordWriter(
+                    db,
+                    constants={'is_current': True, 'sync_status': 'pending'},
+                    mode=self.write_mode,
+                    commit_mode=self.commit_mode
+                )
+                result = writer.write(rows)
+            
+            if report is not None:
+                report.add_result(db_name, result, list(timestamps))
+            
+            for inserted in result.inserted:
+                index = inserted['index']
+                serialnumber = inserted['serialnumber']
+                if db_name == 'zerodb':
+                    # api_retry_manager pairs these lines with later "API upload failed" errors
+                    self.log_info(f"Processing record in {db_name}: SerialNumber={serialnumber}, Timestamp={timestamps.iloc[index]}")
+                    self.log_info(f"Inserted new record to {db_name}: {dict(zip(SYSTEM_RECORD_COLUMNS, rows[index]))}")
+                    self.log_info(f"Successfully inserted record with ID: {inserted['id']}")
+                else:
+                    self.log_info(f"Successfully inserted record in {db_name} with ID: {inserted['id']} (SerialNumber={serialnumber})")
+            
+            if result.duplicates:
+                self.log_info(f"Skipped {result.duplicates} existing records in {db_name}")
+            
+            self.log_info(f"Processed {len(result.inserted)} new records in {db_name}")
+            return result
                 
-                self.log_info(f"Processed {records_processed} new records")
-                return True
+        except Exception as e:
+            self.log_error(f"Database update error ({db_name}): {str(e)}")
+            return None
+    
+    def _handle_new_records(self, result: WriteResult, rows: List[tuple]):
+        """Print the label of the latest new record and upload the new records to the API
+        
+        Args:
+            result: zerodb write result
+            rows: Insert tuples the result indexes refer to
+        """
+        latest = result.latest
+        if latest is None:
+            return
+        
+        # Print label
+        try:
+            from print_label_html import print_label_by_id
+            if print_label_by_id(latest['id']):
+                self.log_info(f"Label printed: {latest['serialnumber']}")
+                self.last_printed_sn = latest['serialnumber']
+                self.last_print_time = datetime.now()
+            else:
+                self.log_error(f"Label printing failed for ID: {latest['id']}")
+        except Exception as e:
+            self.log_error(f"Printing error: {str(e)}")
+        
+        # Upload new records to API, only for the main database
+        api_records = [dict(zip(SYSTEM_RECORD_COLUMNS, rows[index])) for index in result.inserted_indexes]
+        try:
+            if not hasattr(self, 'api') or self.api is None:
+                if not self.initialize_api():
+                    self.log_error("Failed to initialize API connection")
+                    return
+            
+            # Prepare API request data
+            request_data = prepare_request_data(api_records)
+            
+            # Send data to API
+            response = self.api.send_data(request_data)
+            if response.get('error'):
+                self.log_error(f"API upload failed: {response.get('error')}")
+            else:
+                self.log_info(f"Successfully uploaded {len(api_records)} records to API")
                 
         except Exception as e:
-            self.log_error(f"Database update error: {str(e)}")
-            return False
+            self.log_error(f"Error uploading to API: {str(e)}")
     
     def process_product_keys(self, file_path: str) -> bool:
         """Process product keys CSV file
@@ -584,8 +554,9 @@ class CSVSyncManager:
             
             # Update database
             with Database() as db:
-                # Get existing records
-                db.cursor.execute("SELECT productkey_new FROM product_keys")
+                # Get existing records, only the keys present in this file
+                file_keys = [str(key).strip() for key in df['productkey'].dropna()] if 'productkey' in df.columns else []
+                db.cursor.execute("SELECT productkey_new FROM product_keys WHERE productkey_new = ANY(%s)", (file_keys,))
                 existing_keys = {r['productkey_new'] for r in db.cursor.fetchall()}
                 
                 records_processed = 0
@@ -628,10 +599,8 @@ class CSVSyncManager:
                 self.log_info(f"Updated: {records_updated} records")
                 self.log_info(f"Added: {records_added} new records")
                 
-                # Generate preview
-                html_path = generate_html_preview()
-                if html_path:
-                    self.log_info(f"Updated preview: {html_path}")
+                # Rebuild the preview (debounced, merged with other pending requests)
+                mark_preview_dirty("product_keys")
                 
                 return True
                 
@@ -644,56 +613,36 @@ class CSVSyncManager:
 class CSVHandler(FileSystemEventHandler):
     def __init__(self, manager: CSVSyncManager):
         self.manager = manager
-        self.is_processing = False
-        self.last_modified = 0
-        self.last_size = 0
-    
-    def wait_for_file_ready(self, file_path: str, timeout: int = 10) -> bool:
-        """Wait for file write completion"""
-        start_time = time.time()
-        while time.time() - start_time < timeout:
-            try:
-                current_size = os.path.getsize(file_path)
-                if current_size == self.last_size:
-                    time.sleep(1)
-                    if current_size == os.path.getsize(file_path):
-                        self.last_size = current_size
-                        return True
-                self.last_size = current_size
-            except Exception:
-                pass
-            time.sleep(0.1)
-        return False
+        self.last_signatures = {}  # (size, mtime) of each file when it was last processed
+        
+        # Events are queued per path and processed by one worker once the file is stable,
+        # the watchdog thread never blocks and writes during processing are not lost
+        self.queue = CoalescingEventQueue(self.process_file, name="csv_events")
+        self.queue.start()
     
     def on_modified(self, event):
         """File modification event processing"""
-        if self.is_processing:
-            return
-            
         if not event.is_directory:
-            try:
-                self.is_processing = True
-                
-                # Wait for file write completion
-                if not self.wait_for_file_ready(event.src_path):
-                    self.manager.log_warning("File write timeout")
-                    return
+            self.queue.submit(event.src_path)
+    
+    def process_file(self, file_path: str):
+        """Process a stable file, run from the queue worker"""
+        try:
+            stat = os.stat(file_path)
+            signature = (stat.st_size, stat.st_mtime)
+            if self.last_signatures.get(file_path) == signature:
+                return
+            self.last_signatures[file_path] = signature
+            self.manager.log_info(f"File update detected: {file_path}")
+            
+            # Process based on file type
+            if "system_records" in file_path:
+                self.manager.process_system_records(file_path)
+            elif "product_keys" in file_path:
+                self.manager.process_product_keys(file_path)
                 
-                current_modified = os.path.getmtime(event.src_path)
-                if current_modified > self.last_modified:
-                    self.last_modified = current_modified
-                    self.manager.log_info(f"File update detected: {event.src_path}")
-                    
-                    # Process based on file type
-                    if "system_records" in event.src_path:
-                        self.manager.process_system_records(event.src_path)
-                    elif "product_keys" in event.src_path:
-                        self.manager.process_product_keys(event.src_path)
-                    
-            except Exception as e:
-                self.manager.log_error(f"Error processing file: {str(e)}")
-            finally:
-                self.is_processing = False
+        except Exception as e:
+            self.manager.log_error(f"Error processing file: {str(e)}")
 
 def start_monitoring(base_path: str):
     """Start monitoring CSV files
@@ -716,6 +665,7 @@ def start_monitoring(base_path: str):
         print("\nMonitoring stopped")
     
     observer.join()
+    handler.queue.stop()
 
 if __name__ == "__main__":
     base_path = r"\\192.168.0.10\Files\03_IT\data"
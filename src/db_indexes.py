@@ -0,0 +1,373 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+熱點查詢的索引遷移與 EXPLAIN 檢查工具。
+
+    python db_indexes.py --migrate            在兩個資料庫建立 updated_at 欄位、觸發器和索引
+    python db_indexes.py --check              對每個熱點查詢執行 EXPLAIN (ANALYZE, BUFFERS)，
+                                              若有超過門檻的循序掃描則返回非零值
+"""
+
+import sys
+import json
+import logging
+import argparse
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+from sqldb import Database
+
+logger = logging.getLogger('db_indexes')
+
+TARGET_DATABASES = ('zerodb', 'zerodev')
+
+# get_updated_records 依賴 updated_at，由觸發器在每次 UPDATE 時更新
+UPDATED_AT_SQL = """
+    ALTER TABLE system_records ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ;
+    ALTER TABLE system_records ALTER COLUMN updated_at SET DEFAULT CURRENT_TIMESTAMP;
+
+    CREATE OR REPLACE FUNCTION system_records_set_updated_at() RETURNS trigger AS $$
+    BEGIN
+        NEW.updated_at = CURRENT_TIMESTAMP;
+        RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    DROP TRIGGER IF EXISTS system_records_updated_at ON system_records;
+    CREATE TRIGGER system_records_updated_at
+        BEFORE UPDATE ON system_records
+        FOR EACH ROW EXECUTE FUNCTION system_records_set_updated_at();
+"""
+
+# 索引名稱 -> 定義
+INDEXES = {
+    # get_records_to_sync: WHERE sync_status = 'pending' ORDER BY id LIMIT n
+    'idx_system_records_pending_id': "ON system_records (id) WHERE sync_status = 'pending'",
+    # get_updated_records: WHERE updated_at > %s ORDER BY updated_at DESC
+    'idx_system_records_updated_at': "ON system_records (updated_at)",
+    # get_sync_stats: 最近一次同步 ORDER BY last_sync_time DESC LIMIT 1
+    'idx_system_records_last_sync_time': "ON system_records (last_sync_time)",
+    # 預覽和匯出: ORDER BY created_at DESC, serialnumber
+    'idx_system_records_created_at_sn': "ON system_records (created_at DESC, serialnumber)",
+    # 記錄 API 的 keyset 分頁: WHERE (created_at, id) < (%s, %s) ORDER BY created_at DESC, id DESC
+    'idx_system_records_created_at_id': "ON system_records (created_at, id)",
+    'idx_system_records_latest_created_at_id': "ON system_records_latest (created_at, record_id)",
+    'idx_product_keys_created_at_id': "ON product_keys (created_at, id)",
+    # 預覽: 每個序號的最新記錄 ORDER BY created_at DESC NULLS LAST, serialnumber
+    'idx_system_records_latest_order': "ON system_records_latest (created_at DESC NULLS LAST, serialnumber) INCLUDE (record_id)",
+    # 預覽的產品金鑰: ORDER BY created_at DESC, computername
+    'idx_product_keys_created_at_computername': "ON product_keys (created_at DESC, computername) INCLUDE (id)",
+    # 讀取檔案中已存在的產品金鑰: WHERE productkey_new = ANY(%s)
+    'idx_product_keys_productkey': "ON product_keys (productkey_new)",
+}
+
+@dataclass
+class HotQuery:
+    """A query the application runs often, checked with EXPLAIN"""
+    name: str
+    sql: str
+    params: Optional[Tuple[Any, ...]] = None
+
+# 登記的熱點查詢，--check 時逐一檢查
+HOT_QUERIES = [
+    HotQuery('get_records_to_sync', """
+        SELECT id, serialnumber, created_at FROM system_records
+        WHERE sync_status = 'pending'
+        ORDER BY id
+        LIMIT 100
+    """),
+    HotQuery('get_updated_records', """
+        SELECT serialnumber, updated_at FROM system_records
+        WHERE updated_at > now() - interval '1 hour'
+        ORDER BY updated_at DESC
+    """),
+    HotQuery('get_sync_stats', """
+        SELECT sync_version, last_sync_time FROM system_records
+        WHERE last_sync_time IS NOT NULL
+        ORDER BY last_sync_time DESC
+        LIMIT 1
+    """),
+    HotQuery('preview_records', """
+        SELECT id, serialnumber, created_at FROM system_records
+        ORDER BY created_at DESC, serialnumber
+        LIMIT 50
+    """),
+    HotQuery('preview_latest_records', """
+        SELECT l.record_id, l.serialnumber, l.created_at FROM system_records_latest l
+        ORDER BY l.created_at DESC NULLS LAST, l.serialnumber
+        LIMIT 50
+    """),
+    HotQuery('api_records_page', """
+        SELECT r.id, r.created_at FROM system_records_latest l
+        JOIN system_records r ON r.id = l.record_id
+        WHERE l.created_at IS NOT NULL AND (l.created_at, l.record_id) < (%s::timestamp, %s)
+        ORDER BY l.created_at DESC, l.record_id DESC
+        LIMIT 51
+    """, ('2100-01-01 00:00:00', 0)),
+    HotQuery('api_records_history_page', """
+        SELECT r.id, r.created_at FROM system_records r
+        WHERE r.created_at IS NOT NULL AND (r.created_at, r.id) < (%s::timestamp, %s)
+        ORDER BY r.created_at DESC, r.id DESC
+        LIMIT 51
+    """, ('2100-01-01 00:00:00', 0)),
+    HotQuery('api_product_keys_page', """
+        SELECT k.id, k.created_at FROM product_keys k
+        WHERE k.created_at IS NOT NULL AND (k.created_at, k.id) < (%s::timestamp, %s)
+        ORDER BY k.created_at DESC, k.id DESC
+        LIMIT 51
+    """, ('2100-01-01 00:00:00', 0)),
+    HotQuery('get_latest_record', """
+        SELECT r.* FROM system_records_latest l
+        JOIN system_records r ON r.id = l.record_id
+        WHERE l.serialnumber = %s
+    """, ('',)),
+    HotQuery('record_by_key', """
+        SELECT id FROM system_records
+        WHERE serialnumber = %s AND created_at = %s::timestamp
+    """, ('', '2000-01-01 00:00:00')),
+    HotQuery('existing_product_keys', """
+        SELECT productkey_new FROM product_keys
+        WHERE productkey_new = ANY(%s)
+    """, ([''],)),
+]
+
+def create_index_sql(name: str, concurrently: bool = False) -> str:
+    """CREATE INDEX statement of a registered index"""
+    return (f"CREATE INDEX {'CONCURRENTLY ' if concurrently else ''}IF NOT EXISTS "
+            f"{name} {INDEXES[name]}")
+
+def index_table(name: str) -> str:
+    """Table of a registered index (the definition starts with "ON <table>")"""
+    return INDEXES[name].split()[1]
+
+def is_partitioned_table(db: Database, table: str) -> bool:
+    """Whether a table is partitioned (pg_class.relkind = 'p')"""
+    db.cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", (table,))
+    row = db.cursor.fetchone()
+    return row is not None and row['relkind'] == 'p'
+
+def drop_invalid_index(db: Database, name: str) -> None:
+    """Drop an index an interrupted CONCURRENTLY build left invalid (IF NOT EXISTS would skip it)"""
+    db.cursor.execute("""
+        SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE c.relname = %s AND NOT i.indisvalid
+    """, (name,))
+    if db.cursor.fetchone():
+        logger.warning(f"刪除無效索引: {name}")
+        db.cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+
+def create_index_concurrently(db: Database, name: str, definition: str) -> None:
+    """CREATE INDEX CONCURRENTLY of a plain table, needs autocommit"""
+    drop_invalid_index(db, name)
+    db.cursor.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} {definition}")
+
+def create_partitioned_index(db: Database, name: str, table: str) -> None:
+    """
+    Build a registered index on a partitioned table without blocking writes
+
+    CONCURRENTLY is not supported on partitioned tables. The index is
+    created invalid ON ONLY the parent, built concurrently on each partition
+    and attached; it becomes valid once every partition is attached.
+    Needs autocommit.
+
+    Args:
+        db: Database connection in autocommit mode
+        name: Registered index name
+        table: The partitioned table
+    """
+    definition = INDEXES[name]
+    # 父表上的索引在全部分區附加前是無效的，中斷後再次執行時保留它並繼續附加
+    db.cursor.execute(f"CREATE INDEX IF NOT EXISTS {name} {definition.replace('ON ', 'ON ONLY ', 1)}")
+
+    db.cursor.execute("""
+        SELECT c.relname AS partition,
+               EXISTS (
+                   SELECT 1 FROM pg_inherits ii
+                   WHERE ii.inhparent = to_regclass(%s)
+                     AND ii.inhrelid IN (SELECT indexrelid FROM pg_index WHERE indrelid = c.oid)
+               ) AS attached
+        FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass(%s)
+        ORDER BY c.relname
+    """, (name, table))
+    for partition in db.cursor.fetchall():
+        if partition['attached']:
+            continue
+        # 例如 idx_system_records_pending_id_y2025m01
+        suffix = partition['partition'].removeprefix(f"{table}_")
+        partition_index = f"{name}_{suffix}"[:63]
+        create_index_concurrently(db, partition_index,
+                                  definition.replace(f"ON {table} ", f"ON {partition['partition']} ", 1))
+        db.cursor.execute(f"ALTER INDEX {name} ATTACH PARTITION {partition_index}")
+
+def migrate(db_name):
+    """
+    在指定的資料庫中建立 updated_at 欄位、觸發器和所有登記的索引
+
+    索引使用 CREATE INDEX CONCURRENTLY 建立，不會阻擋寫入；
+    分區表的索引在每個分區上分別以 CONCURRENTLY 建立後附加到父表的索引。
+
+    Args:
+        db_name: 資料庫名稱
+
+    Returns:
+        bool: 操作是否成功
+    """
+    logger.info(f"正在處理資料庫: {db_name}")
+
+    try:
+        with Database(db_name=db_name) as db:
+            # 新欄位先用既有的時間填充，再建立觸發器
+            db.cursor.execute("""
+                SELECT 1 FROM information_schema.columns
+                WHERE table_name = 'system_records' AND column_name = 'updated_at'
+            """)
+            backfill = db.cursor.fetchone() is None
+            db.cursor.execute(UPDATED_AT_SQL)
+            if backfill:
+                db.cursor.execute("ALTER TABLE system_records DISABLE TRIGGER system_records_updated_at")
+                db.cursor.execute("UPDATE system_records SET updated_at = COALESCE(last_updated_at, created_at)")
+                logger.info(f"已填充 {db.cursor.rowcount} 筆記錄的 updated_at")
+                db.cursor.execute("ALTER TABLE system_records ENABLE TRIGGER system_records_updated_at")
+            db.connection.commit()
+
+            # CONCURRENTLY 不能在交易中執行
+            db.connection.autocommit = True
+            try:
+                for name in INDEXES:
+                    logger.info(f"建立索引: {name}")
+                    table = index_table(name)
+                    if not is_partitioned_table(db, table):
+                        create_index_concurrently(db, name, INDEXES[name])
+                        continue
+                    try:
+                        create_partitioned_index(db, name, table)
+                    except Exception as e:
+                        # 例如分區上已有同名的其他索引，改為一般方式建立（會阻擋寫入）
+                        logger.warning(f"{name}: 無法逐個分區建立索引 ({str(e)})，改用非 CONCURRENTLY 方式建立")
+                        db.cursor.execute(create_index_sql(name))
+            finally:
+                db.connection.autocommit = False
+
+            db.cursor.execute("ANALYZE system_records")
+            db.cursor.execute("ANALYZE product_keys")
+            db.cursor.execute("ANALYZE system_records_latest")
+            db.connection.commit()
+            logger.info(f"成功更新 {db_name} 資料庫的索引")
+            return True
+
+    except Exception as e:
+        logger.error(f"建立索引時發生錯誤: {str(e)}")
+        return False
+
+def sequential_scans(plan: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Seq Scan nodes of an EXPLAIN (FORMAT JSON) plan with the rows they read"""
+    scans = []
+    if plan.get('Node Type') == 'Seq Scan':
+        loops = plan.get('Actual Loops', 1)
+        # Actual Rows and Rows Removed by Filter are both averages per loop
+        rows = (plan.get('Actual Rows', 0) + plan.get('Rows Removed by Filter', 0)) * loops
+        scans.append({'relation': plan.get('Relation Name'), 'rows': rows,
+                      'buffers': plan.get('Shared Hit Blocks', 0) + plan.get('Shared Read Blocks', 0)})
+    for child in plan.get('Plans', []):
+        scans.extend(sequential_scans(child))
+    return scans
+
+def check(db_name, threshold):
+    """
+    對每個熱點查詢執行 EXPLAIN (ANALYZE, BUFFERS)，找出讀取超過門檻行數的循序掃描
+
+    Args:
+        db_name: 資料庫名稱
+        threshold: 允許循序掃描讀取的最大行數
+
+    Returns:
+        bool: 所有查詢是否都通過
+    """
+    logger.info(f"正在檢查資料庫: {db_name}")
+    passed = True
+
+    with Database(db_name=db_name) as db:
+        for query in HOT_QUERIES:
+            try:
+                db.cursor.execute(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {query.sql}", query.params)
+                explain = db.cursor.fetchone()['QUERY PLAN']
+                if isinstance(explain, str):
+                    explain = json.loads(explain)
+                result = explain[0]
+            except Exception as e:
+                logger.error(f"{query.name}: EXPLAIN 失敗: {str(e)}")
+                passed = False
+                continue
+            finally:
+                # 查詢只讀，不保留任何變更
+                db.connection.rollback()
+
+            scans = [scan for scan in sequential_scans(result['Plan']) if scan['rows'] > threshold]
+            if scans:
+                passed = False
+                for scan in scans:
+                    logger.error(f"{query.name}: 循序掃描 {scan['relation']} 讀取 {scan['rows']} 行 "
+                                 f"({scan['buffers']} buffers)，超過門檻 {threshold}")
+            else:
+                logger.info(f"{query.name}: OK ({result['Execution Time']:.2f} ms)")
+
+    return passed
+
+def parse_arguments():
+    """解析命令行參數"""
+    parser = argparse.ArgumentParser(description="熱點查詢索引遷移與檢查工具")
+
+    parser.add_argument("--migrate", action="store_true",
+                        help="建立 updated_at 欄位、觸發器和索引")
+
+    parser.add_argument("--check", action="store_true",
+                        help="以 EXPLAIN (ANALYZE, BUFFERS) 檢查熱點查詢是否使用索引")
+
+    parser.add_argument("--db", choices=TARGET_DATABASES,
+                        help="只處理指定的資料庫 (默認: 兩個資料庫)")
+
+    parser.add_argument("--threshold", type=int, default=1000,
+                        help="循序掃描允許讀取的最大行數 (默認: 1000)")
+
+    # 如果沒有參數，顯示幫助
+    if len(sys.argv) == 1:
+        parser.print_help()
+        sys.exit(1)
+
+    return parser.parse_args()
+
+def main():
+    """
+    主函數：遷移及/或檢查指定的資料庫
+    """
+    args = parse_arguments()
+    db_names = [args.db] if args.db else list(TARGET_DATABASES)
+
+    try:
+        success = True
+        if args.migrate:
+            for db_name in db_names:
+                if not migrate(db_name):
+                    logger.error(f"更新 {db_name} 失敗")
+                    success = False
+
+        if args.check:
+            for db_name in db_names:
+                if not check(db_name, args.threshold):
+                    logger.error(f"{db_name} 有熱點查詢未使用索引")
+                    success = False
+
+        return 0 if success else 1
+
+    except Exception as e:
+        logger.error(f"執行過程中發生錯誤: {str(e)}")
+        return 1
+
+if __name__ == "__main__":
+    # 設置日誌（只在直接執行時設置，被匯入時不影響應用程式的日誌）
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    sys.exit(main())
@@ -0,0 +1,139 @@
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger("csv_sync.events")
+
+@dataclass
+class PendingFile:
+    """A path waiting for its writes to settle"""
+    first_event: float                              # Time of the first event not yet processed
+    due: float                                      # When the next stability check runs
+    quiet: float                                    # Current stability window
+    signature: Optional[Tuple[int, float]] = None   # (size, mtime) at the last check
+    events: int = 1                                 # Events coalesced into this entry
+
+class CoalescingEventQueue:
+    def __init__(self, process: Callable[[str], Any], min_quiet: float = 0.25, max_quiet: float = 4.0,
+                 max_wait: float = 30.0, name: str = "file_events"):
+        """Per-path work queue for file system events, drained by one worker thread
+
+        Events only mark a path as pending, so the watchdog thread never
+        blocks and a burst of writes collapses into one processing pass.
+        A path is processed once its size and mtime stayed the same for the
+        stability window. The window doubles while the file keeps changing
+        (up to max_quiet) and the learned window is reused for the next
+        burst on that path. Events arriving while a path is processed queue
+        it again, so no update is dropped.
+
+        Args:
+            process: Called with the path from the worker thread
+            min_quiet: Shortest stability window in seconds
+            max_quiet: Longest stability window in seconds
+            max_wait: Process a path anyway after this many seconds of continuous writes
+            name: Worker thread name
+        """
+        self.process = process
+        self.min_quiet = min_quiet
+        self.max_quiet = max_quiet
+        self.max_wait = max_wait
+        self.name = name
+
+        self.pending: Dict[str, PendingFile] = {}
+        self.quiet: Dict[str, float] = {}  # Learned stability window per path
+        self.condition = threading.Condition()
+        self.running = False
+        self.worker: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """Start the worker thread"""
+        with self.condition:
+            if self.running:
+                return
+            self.running = True
+        self.worker = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self.worker.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stop the worker after the path being processed, pending paths are discarded"""
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        if self.worker is not None:
+            self.worker.join(timeout)
+
+    def submit(self, path: str) -> None:
+        """Mark a path as modified, called from the watchdog thread"""
+        now = time.monotonic()
+        with self.condition:
+            entry = self.pending.get(path)
+            if entry is None:
+                quiet = self.quiet.get(path, self.min_quiet)
+                self.pending[path] = PendingFile(first_event=now, due=now + quiet, quiet=quiet)
+            else:
+                entry.events += 1
+                entry.due = max(entry.due, now + entry.quiet)
+            self.condition.notify()
+
+    @staticmethod
+    def _signature(path: str) -> Optional[Tuple[int, float]]:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return stat.st_size, stat.st_mtime
+
+    def _next_due(self) -> Optional[str]:
+        """Wait until a pending path is due, returns None when stopped"""
+        with self.condition:
+            while self.running:
+                if not self.pending:
+                    self.condition.wait()
+                    continue
+                path, entry = min(self.pending.items(), key=lambda item: item[1].due)
+                delay = entry.due - time.monotonic()
+                if delay <= 0:
+                    return path
+                self.condition.wait(delay)
+        return None
+
+    def _run(self) -> None:
+        while True:
+            path = self._next_due()
+            if path is None:
+                return
+
+            # stat can be slow on the network share, keep it outside the lock
+            signature = self._signature(path)
+            now = time.monotonic()
+            with self.condition:
+                entry = self.pending.get(path)
+                if entry is None or entry.due > now:
+                    continue
+                if signature is None:
+                    # File removed or unreadable
+                    del self.pending[path]
+                    continue
+                if signature != entry.signature and now - entry.first_event < self.max_wait:
+                    # Still changing (or first check), back off while it keeps changing
+                    if entry.signature is not None:
+                        entry.quiet = min(entry.quiet * 2, self.max_quiet)
+                    entry.signature = signature
+                    entry.due = now + entry.quiet
+                    continue
+
+                # Stable: remember the window, a path that settled at once shrinks it again
+                if entry.quiet == self.quiet.get(path, self.min_quiet):
+                    entry.quiet = max(entry.quiet / 2, self.min_quiet)
+                self.quiet[path] = entry.quiet
+                del self.pending[path]
+                events = entry.events
+
+            logger.debug(f"Processing {path} ({events} events coalesced)")
+            try:
+                self.process(path)
+            except Exception as e:
+                logger.exception(f"Error processing {path}: {str(e)}")
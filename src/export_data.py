@@ -1,8 +1,20 @@
 from sqldb import Database
 import json
+import itertools
 from datetime import datetime
 import os
 import pandas as pd
+from partitioning import ensure_partition, is_partitioned, month_bounds, parse_month
+
+# 按月導出的欄位, id 由目標數據庫分配
+MONTH_EXPORT_COLUMNS = [
+    'serialnumber', 'computername', 'manufacturer', 'model',
+    'systemsku', 'operatingsystem', 'cpu', 'resolution', 'graphicscard',
+    'touchscreen', 'ram_gb', 'disks', 'design_capacity',
+    'full_charge_capacity', 'cycle_count', 'battery_health',
+    'created_at', 'is_current', 'sync_status', 'last_sync_time',
+    'sync_version', 'started_at'
+]
 
 def export_system_records(source_db='zerodb', target_db='zerodev'):
     """在兩個數據庫之間導出/導入 system_records 表數據"""
@@ -47,9 +59,9 @@ def export_system_records(source_db='zerodb', target_db='zerodev'):
                 print(f"最新記錄時間：{latest['created_at']}")
                 print(f"最新記錄序號：{latest['serialnumber']}")
             
-            # 獲取所有記錄
+            # 以伺服器端游標讀取記錄, 邊讀取邊導入
             print(f"正在從 {source_db} 數據庫讀取數據...")
-            source.cursor.execute("""
+            records = source.stream("""
                 SELECT 
                     id, serialnumber, computername, manufacturer, model,
                     systemsku, operatingsystem, cpu, resolution, graphicscard,
@@ -60,19 +72,16 @@ def export_system_records(source_db='zerodb', target_db='zerodev'):
                 FROM system_records 
                 ORDER BY id
             """)
-            records = source.cursor.fetchall()
-            
-            print(f"從 {source_db} 讀取到 {len(records)} 條記錄")
             
-            if len(records) == 0:
+            first_record = next(records, None)
+            if first_record is None:
                 print("警告：沒有找到任何記錄")
                 return False
             
-            # 顯示第一條記錄的示例（如果有）
-            if records:
-                print("\n第一條記錄示例：")
-                for key, value in records[0].items():
-                    print(f"{key}: {value}")
+            # 顯示第一條記錄的示例
+            print("\n第一條記錄示例：")
+            for key, value in first_record.items():
+                print(f"{key}: {value}")
             
             # 連接目標數據庫
             with Database(db_name=target_db) as target:
@@ -100,7 +109,9 @@ def export_system_records(source_db='zerodb', target_db='zerodev'):
                     print("正在導入記錄...")
                     records_count = 0
                     errors_count = 0
-                    for record in records:
+                    records_read = 0
+                    for record in itertools.chain([first_record], records):
+                        records_read += 1
                         try:
                             # 構建 INSERT 語句
                             columns = record.keys()
@@ -163,7 +174,7 @@ def export_system_records(source_db='zerodb', target_db='zerodev'):
                     target.cursor.execute("COMMIT")
                     
                     print(f"\n導入完成！")
-                    print(f"總共處理 {len(records)} 條記錄")
+                    print(f"總共處理 {records_read} 條記錄")
                     print(f"成功導入 {records_count} 條記錄")
                     print(f"失敗 {errors_count} 條記錄")
                     
@@ -185,6 +196,61 @@ def export_system_records(source_db='zerodb', target_db='zerodev'):
         traceback.print_exc()
         return False
 
+def export_month(source_db, target_db, month):
+    """只在兩個數據庫之間導出/導入一個月份的 system_records
+    
+    以 created_at 範圍篩選, 分區表只會讀寫該月份的分區; 目標數據庫中該月份的
+    記錄先刪除再以 COPY 串流寫入, 其他月份不受影響。
+    
+    Args:
+        source_db: 源數據庫名稱
+        target_db: 目標數據庫名稱
+        month: 月份（任一日期）
+    """
+    start, end = month_bounds(month)
+    columns_str = ', '.join(MONTH_EXPORT_COLUMNS)
+    try:
+        print(f"\n正在從 {source_db} 導出 {start:%Y-%m} 的數據到 {target_db}...")
+        
+        with Database(db_name=source_db) as source, Database(db_name=target_db) as target:
+            try:
+                if is_partitioned(target):
+                    ensure_partition(target, month)
+                
+                # 清除目標數據庫中該月份的記錄
+                target.cursor.execute("""
+                    DELETE FROM system_records
+                    WHERE created_at >= %s AND created_at < %s
+                """, (start, end))
+                print(f"已刪除 {target_db} 中 {target.cursor.rowcount} 條 {start:%Y-%m} 的記錄")
+                
+                # 以 COPY 串流複製, 不在記憶體中保留整個月份的數據
+                with source.cursor.copy(f"""
+                    COPY (
+                        SELECT {columns_str} FROM system_records
+                        WHERE created_at >= %s AND created_at < %s
+                        ORDER BY id
+                    ) TO STDOUT
+                """, (start, end)) as copy_out:
+                    with target.cursor.copy(f"COPY system_records ({columns_str}) FROM STDIN") as copy_in:
+                        for data in copy_out:
+                            copy_in.write(data)
+                records_count = target.cursor.rowcount
+                
+                target.connection.commit()
+                print(f"成功導入 {records_count} 條 {start:%Y-%m} 的記錄")
+                return True
+                
+            except Exception as e:
+                target.connection.rollback()
+                raise e
+            
+    except Exception as e:
+        print(f"導出過程中出錯: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return False
+
 def check_database(db_name):
     """檢查數據庫狀態"""
     try:
@@ -279,9 +345,10 @@ def show_menu():
         print("2. 從 zerodev 導入到 zerodb")
         print("3. 檢查 zerodb 狀態")
         print("4. 檢查 zerodev 狀態")
-        print("5. 退出")
+        print("5. 按月份導入 (只替換該月份的記錄)")
+        print("6. 退出")
         
-        choice = input("\n請選擇操作 (1-5): ")
+        choice = input("\n請選擇操作 (1-6): ")
         
         if choice == '1':
             confirm = input("\n警告：這將清空 zerodev 數據庫中的數據。是否繼續？(yes/no): ")
@@ -296,6 +363,20 @@ def show_menu():
         elif choice == '4':
             check_database('zerodev')
         elif choice == '5':
+            direction = input("\n方向 (1: zerodb -> zerodev, 2: zerodev -> zerodb): ")
+            if direction not in ['1', '2']:
+                print("\n無效的選擇，請重試。")
+                continue
+            source_db, target_db = ('zerodb', 'zerodev') if direction == '1' else ('zerodev', 'zerodb')
+            try:
+                month = parse_month(input("月份 (YYYY-MM): ").strip())
+            except ValueError:
+                print("\n無效的月份，請重試。")
+                continue
+            confirm = input(f"\n警告：這將替換 {target_db} 中 {month:%Y-%m} 的數據。是否繼續？(yes/no): ")
+            if confirm.lower() in ['yes', 'y']:
+                export_month(source_db, target_db, month)
+        elif choice == '6':
             print("\n退出程序...")
             break
         else:
@@ -6,8 +6,9 @@ from watchdog.events import FileSystemEventHandler
 import time
 from print_label_html import print_new_record
 from initdb import update_system_records, update_product_keys
-from html_preview import generate_html_preview
+from preview_scheduler import mark_preview_dirty
 from sqldb import Database
+from event_queue import CoalescingEventQueue
 
 class CSVMonitor:
     def __init__(self):
@@ -38,10 +39,8 @@ class CSVMonitor:
             # Update database
             if update_system_records(file_path):
                 print("Database updated successfully")
-                # Generate new preview after successful update
-                html_path = generate_html_preview()
-                if html_path:
-                    print(f"Preview updated: {html_path}")
+                # Rebuild the preview (debounced, merged with other pending requests)
+                mark_preview_dirty(file_path)
             else:
                 print("Failed to update database")
             
@@ -70,10 +69,8 @@ class CSVMonitor:
             # Update database
             if update_product_keys(file_path):
                 print("Database updated successfully")
-                # Generate new preview after successful update
-                html_path = generate_html_preview()
-                if html_path:
-                    print(f"Preview updated: {html_path}")
+                # Rebuild the preview (debounced, merged with other pending requests)
+                mark_preview_dirty(file_path)
             else:
                 print("Failed to update database")
             
@@ -90,40 +87,36 @@ class CSVMonitor:
         class FileHandler(FileSystemEventHandler):
             def __init__(self, monitor):
                 self.monitor = monitor
-                self.is_processing = False
-                self.last_modified = {}
+                self.last_signatures = {}
+                # Bursts of writes are coalesced per file and processed once the file is stable
+                self.queue = CoalescingEventQueue(self.process_file, name="file_monitor_events")
+                self.queue.start()
             
             def on_modified(self, event):
-                if self.is_processing or event.is_directory:
+                if event.is_directory:
                     return
                     
-                file_path = event.src_path
-                file_name = os.path.basename(file_path)
-                
+                file_name = os.path.basename(event.src_path)
                 if not (file_name.startswith(('system_records_', 'product_keys_')) and 
                         file_name.endswith('.csv')):
                     return
                 
-                try:
-                    self.is_processing = True
-                    
-                    # Add processing delay
-                    time.sleep(3)
-                    
-                    current_time = os.path.getmtime(file_path)
-                    if current_time <= self.last_modified.get(file_path, 0):
-                        return
-                    
-                    self.last_modified[file_path] = current_time
-                    print(f"\nProcessing file: {file_name}")
-                    
-                    if 'system_records' in file_name:
-                        self.monitor.process_system_records(file_path)
-                    elif 'product_keys' in file_name:
-                        self.monitor.process_product_keys(file_path)
-                        
-                finally:
-                    self.is_processing = False
+                self.queue.submit(event.src_path)
+            
+            def process_file(self, file_path):
+                stat = os.stat(file_path)
+                signature = (stat.st_size, stat.st_mtime)
+                if self.last_signatures.get(file_path) == signature:
+                    return
+                
+                self.last_signatures[file_path] = signature
+                file_name = os.path.basename(file_path)
+                print(f"\nProcessing file: {file_name}")
+                
+                if 'system_records' in file_name:
+                    self.monitor.process_system_records(file_path)
+                elif 'product_keys' in file_name:
+                    self.monitor.process_product_keys(file_path)
         
         # Start monitoring
         handler = FileHandler(self)
@@ -148,4 +141,5 @@ class CSVMonitor:
             self.observer.stop()
             print("\nMonitoring stopped")
             
-        self.observer.join()
\ No newline at end of file
+        self.observer.join()
+        handler.queue.stop()
\ No newline at end of file
@@ -0,0 +1,177 @@
+import os
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+from typing import Iterable, Optional, Tuple
+import pandas as pd
+from csv_reader import TailState
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+class IngestStateStore:
+    def __init__(self, db_path: Optional[str] = None, retention_days: int = 45):
+        """Local state of the CSV ingest
+
+        Keeps the read watermark of every monitored CSV file and the
+        (serialnumber, created_at) keys ingested recently, so new rows can be
+        found without loading every serial number from zerodb and zerodev.
+
+        Args:
+            db_path: SQLite file path, defaults to state/ingest_state.sqlite in the project root
+            retention_days: How long ingested keys are remembered
+        """
+        if db_path is None:
+            state_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "state")
+            if not os.path.exists(state_dir):
+                os.makedirs(state_dir)
+            db_path = os.path.join(state_dir, "ingest_state.sqlite")
+
+        self.db_path = db_path
+        self.retention = timedelta(days=retention_days)
+        self.last_prune = None
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(db_path, check_same_thread=False)
+        self._create_tables()
+
+    def _create_tables(self):
+        with self.lock, self.connection:
+            self.connection.executescript("""
+                CREATE TABLE IF NOT EXISTS file_watermarks (
+                    path TEXT PRIMARY KEY,
+                    offset INTEGER NOT NULL,
+                    header BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    inode INTEGER NOT NULL,
+                    mtime REAL NOT NULL,
+                    updated_at TEXT NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS seen_records (
+                    serialnumber TEXT NOT NULL,
+                    created_at TEXT NOT NULL,
+                    seen_at TEXT NOT NULL,
+                    PRIMARY KEY (serialnumber, created_at)
+                ) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS idx_seen_records_created_at
+                    ON seen_records(created_at);
+            """)
+
+    def close(self):
+        """Close the SQLite connection"""
+        self.connection.close()
+
+    # Watermarks
+
+    def load_watermark(self, path: str) -> Optional[TailState]:
+        """Get the stored read position of a CSV file"""
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT offset, header, size, inode, mtime FROM file_watermarks WHERE path = ?",
+                (path,)
+            ).fetchone()
+        if row is None:
+            return None
+        return TailState(offset=row[0], header=bytes(row[1]), size=row[2], inode=row[3], mtime=row[4])
+
+    def save_watermark(self, path: str, state: TailState) -> None:
+        """Store the read position of a CSV file"""
+        with self.lock, self.connection:
+            self.connection.execute("""
+                INSERT INTO file_watermarks (path, offset, header, size, inode, mtime, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (path) DO UPDATE SET
+                    offset = excluded.offset,
+                    header = excluded.header,
+                    size = excluded.size,
+                    inode = excluded.inode,
+                    mtime = excluded.mtime,
+                    updated_at = excluded.updated_at
+            """, (path, state.offset, state.header, state.size, state.inode, state.mtime,
+                  datetime.now().strftime(TIMESTAMP_FORMAT)))
+
+    def delete_watermark(self, path: str) -> None:
+        """Forget the read position of a CSV file"""
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM file_watermarks WHERE path = ?", (path,))
+
+    # Seen records
+
+    @staticmethod
+    def _key_frame(df: pd.DataFrame, sn_column: str, ts_column: str) -> pd.DataFrame:
+        """Build normalized (serialnumber, created_at) string keys"""
+        serials = df[sn_column].astype(str).str.strip() if sn_column in df.columns else pd.Series('', index=df.index)
+        timestamps = pd.to_datetime(df[ts_column], errors='coerce').dt.strftime(TIMESTAMP_FORMAT)
+        return pd.DataFrame({'serialnumber': serials, 'created_at': timestamps.fillna('')})
+
+    def filter_unseen(self, df: pd.DataFrame, sn_column: str = 'SerialNumber',
+                      ts_column: str = 'created_at') -> pd.DataFrame:
+        """Keep only the rows whose key has not been ingested yet
+
+        Keys are only remembered for the retention period, so rows older
+        than that are passed on and left to the database dedupe check.
+
+        Args:
+            df: DataFrame with serial number and parsed timestamp columns
+            sn_column: Serial number column
+            ts_column: Parsed timestamp column
+
+        Returns:
+            pd.DataFrame: Rows not seen before
+        """
+        if df.empty:
+            return df
+
+        keys = self._key_frame(df, sn_column, ts_column)
+        valid = keys['created_at'] != ''
+        if not valid.any():
+            return df
+
+        low = keys.loc[valid, 'created_at'].min()
+        high = keys.loc[valid, 'created_at'].max()
+        with self.lock:
+            seen = self.connection.execute(
+                "SELECT serialnumber, created_at FROM seen_records WHERE created_at BETWEEN ? AND ?",
+                (low, high)
+            ).fetchall()
+
+        seen_keys = {f"{sn}|{ts}" for sn, ts in seen}
+        is_seen = (keys['serialnumber'] + '|' + keys['created_at']).isin(seen_keys)
+        return df[~is_seen.values]
+
+    def mark_seen(self, df: pd.DataFrame, sn_column: str = 'SerialNumber',
+                  ts_column: str = 'created_at', failed: Iterable[int] = ()) -> None:
+        """Remember the keys of rows written to the databases
+
+        Args:
+            df: Rows passed to the database writes
+            sn_column: Serial number column
+            ts_column: Parsed timestamp column
+            failed: Positions in df of rows a database did not write (WriteResult.failed_indexes),
+                they are not remembered so filter_unseen passes them on again
+        """
+        if df.empty:
+            return
+        keys = self._key_frame(df, sn_column, ts_column)
+        written = ~pd.Series(range(len(df)), index=keys.index).isin(set(failed))
+        keys = keys[written & (keys['created_at'] != '')]
+        self.mark_seen_keys(keys.itertuples(index=False, name=None))
+
+    def mark_seen_keys(self, keys: Iterable[Tuple[str, str]]) -> None:
+        """Remember (serialnumber, created_at) keys"""
+        seen_at = datetime.now().strftime(TIMESTAMP_FORMAT)
+        with self.lock, self.connection:
+            self.connection.executemany("""
+                INSERT OR IGNORE INTO seen_records (serialnumber, created_at, seen_at)
+                VALUES (?, ?, ?)
+            """, ((sn, ts, seen_at) for sn, ts in keys))
+        self.prune()
+
+    def prune(self, force: bool = False) -> None:
+        """Drop keys older than the retention period, at most once an hour"""
+        now = datetime.now()
+        if not force and self.last_prune is not None and now - self.last_prune < timedelta(hours=1):
+            return
+        self.last_prune = now
+
+        cutoff = (now - self.retention).strftime(TIMESTAMP_FORMAT)
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM seen_records WHERE created_at < ?", (cutoff,))
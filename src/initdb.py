@@ -5,12 +5,22 @@ from typing import Optional
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 import time
-from html_preview import generate_html_preview
+from concurrent.futures import ThreadPoolExecutor
+from preview_scheduler import mark_preview_dirty
 import webbrowser
 from datetime import datetime
 from test_api import APIConnection, prepare_request_data
+from add_latest_records_table import LATEST_TABLE_SQL
+from add_battery_table import BATTERY_TABLE_SQL
+from add_record_counters import COUNTERS_TABLE_SQL
+from db_indexes import UPDATED_AT_SQL, INDEXES, create_index_sql
 import json
 from csv_sync_manager import start_monitoring
+from csv_cache import CSVCache
+from csv_reader import CSV_CHUNK_SIZE, iter_csv_chunks
+from record_normalizer import first_timestamp, text_column, to_insert_rows
+from timestamp_parser import TimestampParser
+from system_record_writer import SystemRecordWriter
 
 class DBUpdateHandler(FileSystemEventHandler):
     def __init__(self, target_file, update_function):
@@ -56,10 +66,8 @@ class DBUpdateHandler(FileSystemEventHandler):
                     time.sleep(2)
                     self.update_function(event.src_path)
                     
-                    # Update HTML preview
-                    html_path = generate_html_preview()
-                    if html_path:
-                        print(f"Updated preview: {html_path}")
+                    # Update HTML preview (debounced, merged with other pending requests)
+                    mark_preview_dirty(event.src_path)
                     
             except Exception as e:
                 print(f"Error processing file: {str(e)}")
@@ -67,27 +75,32 @@ class DBUpdateHandler(FileSystemEventHandler):
                 self.is_processing = False
 
 def update_both_databases(func):
-    """Decorator to update both databases"""
+    """Decorator to update both databases concurrently"""
+    def update_primary(*args, **kwargs):
+        return func(*args, **kwargs)
+    
+    def update_development(*args, **kwargs):
+        with Database(db_name='zerodev') as db:
+            return func(*args, db=db, **kwargs)
+    
     def wrapper(*args, **kwargs):
         results = []
         errors = []
         
-        # Update primary database
-        try:
-            result1 = func(*args, **kwargs)
-            results.append(('primary', result1))
-        except Exception as e:
-            print(f"Error updating primary database: {str(e)}")
-            errors.append(('primary', str(e)))
-        
-        # Update development database
-        try:
-            with Database(db_name='zerodev') as db:
-                result2 = func(*args, db=db, **kwargs)
-                results.append(('development', result2))
-        except Exception as e:
-            print(f"Error updating development database: {str(e)}")
-            errors.append(('development', str(e)))
+        # Both databases are written at the same time, one result per target.
+        # DataFrames are copied since the update functions normalize columns in place
+        dev_args = [arg.copy() if isinstance(arg, pd.DataFrame) else arg for arg in args]
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            futures = [
+                ('primary', executor.submit(update_primary, *args, **kwargs)),
+                ('development', executor.submit(update_development, *dev_args, **kwargs))
+            ]
+            for name, future in futures:
+                try:
+                    results.append((name, future.result()))
+                except Exception as e:
+                    print(f"Error updating {name} database: {str(e)}")
+                    errors.append((name, str(e)))
         
         # Print summary
         print("\nUpdate Summary:")
@@ -144,9 +157,10 @@ def update_product_keys(data, is_dataframe=False, db=None):
         df = df.rename(columns=column_map)
         
         with db:
-            # Get existing records
-            query = "SELECT productkey_new FROM product_keys"
-            db.cursor.execute(query)
+            # Get existing records, only the keys present in this file
+            file_keys = [str(key).strip() for key in df['productkey'].dropna()] if 'productkey' in df.columns else []
+            query = "SELECT productkey_new FROM product_keys WHERE productkey_new = ANY(%s)"
+            db.cursor.execute(query, (file_keys,))
             existing_keys = {r['productkey_new'] for r in db.cursor.fetchall()}
             
             # Process records
@@ -263,145 +277,134 @@ def create_api_connection():
         password=API_CONFIG['password']
     )
 
+# Version of _normalize_system_records_chunk, part of the CSV cache key:
+# bump it when the normalization changes so cached months are normalized again
+SYSTEM_RECORDS_NORMALIZER_VERSION = 'initdb.system_records.1'
+
+def _normalize_system_records_chunk(df, parser=None, key=None):
+    """Turn one chunk of CSV rows into the system_records values written by _write_system_records_chunk"""
+    # 處理時間戳: Timestamp 優先, 其次 Date, 都沒有則使用當前時間
+    timestamps = first_timestamp(df, ['Timestamp', 'Date'], parser, key)
+    
+    # 逐欄處理, 磁碟和電池資訊保持原始格式
+    return pd.DataFrame({
+        'serialnumber': text_column(df, 'SerialNumber'),
+        'manufacturer': text_column(df, 'Manufacturer'),
+        'model': text_column(df, 'Model'),
+        'systemsku': text_column(df, 'SystemSKU'),
+        'operatingsystem': text_column(df, 'OperatingSystem'),
+        'cpu': text_column(df, 'CPU'),
+        'graphicscard': text_column(df, 'GraphicsCard'),
+        'ram_gb': text_column(df, 'RAM_GB'),
+        'disks': text_column(df, 'Disks', ''),
+        'full_charge_capacity': text_column(df, 'Full_Charge_Capacity'),
+        'battery_health': text_column(df, 'Battery_Health'),
+        'touchscreen': text_column(df, 'TouchScreen', lower=True),
+        'created_at': timestamps.astype(object),
+        'started_at': timestamps.astype(object)
+    }, index=df.index)
+
+def _write_system_records_chunk(records, db, api=None):
+    """Bulk write one chunk of normalized system records and upload its new records to the API
+    
+    Returns:
+        int: Number of new records written
+    """
+    has_battery = records['full_charge_capacity'].notna() & records['battery_health'].notna()
+    
+    # COPY 整批資料後一次插入, 已存在相同序號和時間戳的記錄會被略過
+    writer = SystemRecordWriter(
+        db,
+        columns=list(records.columns),
+        constants={
+            'is_current': True,
+            'sync_status': 'pending',
+            'last_sync_time': None,
+            'sync_version': '1.0'
+        }
+    )
+    result = writer.write(to_insert_rows(records, list(records.columns)))
+    records_processed = len(result.inserted)
+    
+    for failed in result.failed:
+        print(f"Error processing record: {failed['error']}")
+    
+    # 準備API數據
+    api_items = []
+    for index in result.inserted_indexes:
+        record = records.iloc[index]
+        api_item = {
+            "serialnumber": record['serialnumber'],
+            "manufacturer": record['manufacturer'],
+            "model": record['model'],
+            "ram_gb": record['ram_gb'],
+            "disks": record['disks']  # 直接使用原始格式，不做轉換
+        }
+        
+        # 處理電池資訊
+        if has_battery.iloc[index]:
+            api_item["battery"] = {
+                "cycle_count": 0,
+                "design_capacity": record['full_charge_capacity'],
+                "health": record['battery_health']
+            }
+        
+        api_items.append(api_item)
+    
+    # 如果有新記錄要上傳到API
+    if api_items and api is not None and api.token:
+        try:
+            request_data = prepare_request_data(api_items)
+            response = api.send_data(request_data)
+            if response.get('success'):
+                print(f"Successfully uploaded {len(api_items)} records to API")
+            else:
+                print(f"API upload failed: {response.get('error', 'Unknown error')}")
+        except Exception as e:
+            print(f"Error uploading to API: {str(e)}")
+    
+    return records_processed
+
 @update_both_databases
-def update_system_records(data, is_dataframe=False, db=None):
-    """Update system records from CSV file or DataFrame and sync to API"""
+def update_system_records(data, is_dataframe=False, db=None, chunksize=CSV_CHUNK_SIZE):
+    """Update system records from CSV file or DataFrame and sync to API
+    
+    CSV files are read and written chunk by chunk, so memory use is bounded
+    by chunksize rows instead of the size of the file.
+    """
+    # Only the primary database uploads to the API, the zerodev write does not wait on it
+    upload_to_api = db is None
     if db is None:
         db = Database()
     try:
-        # Handle input data
+        # 時間格式每個檔案只偵測一次, 之後的區塊沿用
+        parser = TimestampParser()
+        
+        # Handle input data; closed months are loaded already normalized from the CSV cache
         if is_dataframe:
-            df = data
+            chunks = [_normalize_system_records_chunk(data, parser)]
         else:
-            df = pd.read_csv(data)  # data is file_path
             print(f"\nProcessing file: {data}")
-        
-        print(f"Records to process: {len(df)}")
+            chunks = iter_csv_chunks(  # data is file_path
+                data, chunksize, cache=CSVCache(),
+                normalize=lambda df: _normalize_system_records_chunk(df, parser, data),
+                version=SYSTEM_RECORDS_NORMALIZER_VERSION
+            )
         
         # 初始化API連接
-        api = create_api_connection()
-        if not api.login():
-            print("Warning: Failed to connect to API, will only update local database")
+        api = None
+        if upload_to_api:
+            api = create_api_connection()
+            if not api.login():
+                print("Warning: Failed to connect to API, will only update local database")
         
         with db:
+            records_read = 0
             records_processed = 0
-            api_items = []
-            
-            for _, row in df.iterrows():
-                try:
-                    db.cursor.execute("BEGIN")
-                    
-                    # 處理時間戳
-                    timestamp = None
-                    if 'Timestamp' in row and pd.notna(row['Timestamp']):
-                        try:
-                            timestamp = pd.to_datetime(row['Timestamp'])
-                        except:
-                            pass
-                    
-                    if timestamp is None and 'Date' in row and pd.notna(row['Date']):
-                        try:
-                            timestamp = pd.to_datetime(row['Date'])
-                        except:
-                            pass
-                    
-                    if timestamp is None:
-                        timestamp = datetime.now()
-                    
-                    # 檢查是否已存在相同序號和時間戳的記錄
-                    db.cursor.execute("""
-                        SELECT id FROM system_records 
-                        WHERE serialnumber = %(serialnumber)s AND created_at = %(created_at)s
-                    """, {
-                        'serialnumber': str(row.get('SerialNumber', '')).strip() if pd.notna(row.get('SerialNumber')) else None,
-                        'created_at': timestamp
-                    })
-                    
-                    existing_record = db.cursor.fetchone()
-                    
-                    if not existing_record:
-                        # 處理磁碟資訊
-                        disks_str = str(row.get('Disks', '')) if pd.notna(row.get('Disks')) else ''
-                        # 保持原始格式
-                        disks_data = disks_str
-                        
-                        # 準備API數據
-                        api_item = {
-                            "serialnumber": str(row.get('SerialNumber', '')).strip() if pd.notna(row.get('SerialNumber')) else None,
-                            "manufacturer": str(row.get('Manufacturer', '')).strip() if pd.notna(row.get('Manufacturer')) else None,
-                            "model": str(row.get('Model', '')).strip() if pd.notna(row.get('Model')) else None,
-                            "ram_gb": str(row.get('RAM_GB', '')).strip() if pd.notna(row.get('RAM_GB')) else None,
-                            "disks": disks_data  # 直接使用原始格式，不做轉換
-                        }
-                        
-                        # 處理電池資訊
-                        if pd.notna(row.get('Full_Charge_Capacity')) and pd.notna(row.get('Battery_Health')):
-                            api_item["battery"] = {
-                                "cycle_count": 0,
-                                "design_capacity": str(row.get('Full_Charge_Capacity', '')),
-                                "health": str(row.get('Battery_Health', ''))
-                            }
-                        
-                        api_items.append(api_item)
-                        
-                        # 更新本地數據庫
-                        params = {
-                            'serialnumber': str(row.get('SerialNumber', '')).strip() if pd.notna(row.get('SerialNumber')) else None,
-                            'manufacturer': str(row.get('Manufacturer', '')).strip() if pd.notna(row.get('Manufacturer')) else None,
-                            'model': str(row.get('Model', '')).strip() if pd.notna(row.get('Model')) else None,
-                            'systemsku': str(row.get('SystemSKU', '')).strip() if pd.notna(row.get('SystemSKU')) else None,
-                            'operatingsystem': str(row.get('OperatingSystem', '')).strip() if pd.notna(row.get('OperatingSystem')) else None,
-                            'cpu': str(row.get('CPU', '')).strip() if pd.notna(row.get('CPU')) else None,
-                            'graphicscard': str(row.get('GraphicsCard', '')).strip() if pd.notna(row.get('GraphicsCard')) else None,
-                            'ram_gb': str(row.get('RAM_GB', '')).strip() if pd.notna(row.get('RAM_GB')) else None,
-                            'disks': disks_data,  # 直接使用原始格式，不做 JSON 轉換
-                            'full_charge_capacity': str(row.get('Full_Charge_Capacity', '')).strip() if pd.notna(row.get('Full_Charge_Capacity')) else None,
-                            'battery_health': str(row.get('Battery_Health', '')).strip() if pd.notna(row.get('Battery_Health')) else None,
-                            'touchscreen': str(row.get('TouchScreen', '')).strip().lower() if pd.notna(row.get('TouchScreen')) else None,
-                            'created_at': timestamp,
-                            'is_current': True,
-                            'sync_status': 'pending',
-                            'last_sync_time': None,
-                            'sync_version': '1.0',
-                            'started_at': timestamp
-                        }
-                        
-                        db.cursor.execute("""
-                            INSERT INTO system_records (
-                                serialnumber, manufacturer, model, systemsku,
-                                operatingsystem, cpu, graphicscard, ram_gb,
-                                disks, full_charge_capacity, battery_health,
-                                touchscreen, created_at, is_current, sync_status,
-                                last_sync_time, sync_version, started_at
-                            ) VALUES (
-                                %(serialnumber)s, %(manufacturer)s, %(model)s, %(systemsku)s,
-                                %(operatingsystem)s, %(cpu)s, %(graphicscard)s, %(ram_gb)s,
-                                %(disks)s, %(full_charge_capacity)s, %(battery_health)s,
-                                %(touchscreen)s, %(created_at)s, %(is_current)s, %(sync_status)s,
-                                %(last_sync_time)s, %(sync_version)s, %(started_at)s
-                            )
-                        """, params)
-                        
-                        records_processed += 1
-                    
-                    db.cursor.execute("COMMIT")
-                    
-                except Exception as e:
-                    db.cursor.execute("ROLLBACK")
-                    print(f"Error processing record: {str(e)}")
-                    continue
-            
-            # 如果有新記錄要上傳到API
-            if api_items and api.token:
-                try:
-                    request_data = prepare_request_data(api_items)
-                    result = api.send_data(request_data)
-                    if result.get('success'):
-                        print(f"Successfully uploaded {len(api_items)} records to API")
-                    else:
-                        print(f"API upload failed: {result.get('error', 'Unknown error')}")
-                except Exception as e:
-                    print(f"Error uploading to API: {str(e)}")
+            for chunk_number, records in enumerate(chunks, 1):
+                records_read += len(records)
+                records_processed += _write_system_records_chunk(records, db, api)
+                print(f"Chunk {chunk_number}: {records_read} records read, {records_processed} new")
             
             print(f"\nProcessed {records_processed} new records")
             return records_processed > 0
@@ -418,6 +421,9 @@ def create_tables():
         # Drop existing tables with CASCADE
         db.execute_query("""
             DROP TABLE IF EXISTS system_records CASCADE;
+            DROP TABLE IF EXISTS system_records_latest CASCADE;
+            DROP TABLE IF EXISTS system_record_batteries CASCADE;
+            DROP TABLE IF EXISTS record_counters CASCADE;
             DROP TABLE IF EXISTS product_keys CASCADE;
         """)
         
@@ -449,9 +455,11 @@ def create_tables():
                 sync_version VARCHAR(10) DEFAULT '1.0',
                 started_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP,
                 last_updated_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
                 data_source VARCHAR(100),
                 validation_status VARCHAR(20) DEFAULT 'pending',
-                validation_message TEXT
+                validation_message TEXT,
+                CONSTRAINT system_records_unique_key UNIQUE (serialnumber, created_at)
             )
         """)
         
@@ -475,6 +483,20 @@ def create_tables():
             CREATE INDEX idx_product_keys_computername ON product_keys(computername);
         """)
         
+        # Latest record per serial number, maintained by triggers on system_records
+        db.execute_query(LATEST_TABLE_SQL)
+        
+        # Indexes of the hot queries (see db_indexes.py) and the updated_at trigger
+        db.execute_query(UPDATED_AT_SQL)
+        db.execute_query(";\n".join(create_index_sql(name) for name in INDEXES))
+        
+        # One numeric row per battery, filled by triggers on system_records
+        db.execute_query(BATTERY_TABLE_SQL)
+        
+        # Row counts of both tables, maintained by triggers
+        db.execute_query(COUNTERS_TABLE_SQL)
+        db.execute_query("SELECT record_counters_refresh()")
+        
         print("Database tables created/updated successfully")
 
 if __name__ == "__main__":
@@ -8,7 +8,7 @@ from datetime import datetime, timezone, timedelta
 from typing import Dict, List, Optional, Any
 from .logger import SyncLogger
 from .data_formatter import DataFormatter
-from sqldb import Database
+from sqldb import AsyncDatabase, close_async_pools, run_async
 import hashlib
 
 # 定義 UTC-5 時區
@@ -245,9 +245,9 @@ class InventorySync:
     async def sync(self) -> Dict:
         """執行同步操作"""
         try:
-            with Database() as db:
+            async with AsyncDatabase() as db:
                 # 獲取更新的記錄
-                records = db.get_updated_records(self.last_sync_time)
+                records = await db.get_updated_records(self.last_sync_time)
                 
                 if not records:
                     self.logger.info("No updates found")
@@ -276,7 +276,7 @@ class InventorySync:
                         WHERE serialnumber = ANY(%s)
                     """
                     serialnumbers = [record.get('serialnumber') for record in normalized_records]
-                    db.execute_query(update_query, (result.get('sync_version', '1.0'), serialnumbers))
+                    await db.execute_query(update_query, (result.get('sync_version', '1.0'), serialnumbers))
                     
                     self.last_sync_time = datetime.now(UTC_MINUS_5)
                     self.logger.info(f"Successfully synced {len(records)} records")
@@ -372,7 +372,14 @@ class InventorySync:
 async def run_sync(env: str = "dev"):
     """運行同步的便捷函數"""
     sync_manager = InventorySync(env)
-    return await sync_manager.sync()
+    try:
+        return await sync_manager.sync()
+    finally:
+        await close_async_pools()
+
+def main(env: str = "dev"):
+    """Entry point: run run_sync() on an event loop psycopg supports"""
+    return run_async(run_sync(env))
 
 if __name__ == "__main__":
-    asyncio.run(run_sync()) 
\ No newline at end of file
+    main()
\ No newline at end of file
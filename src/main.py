@@ -6,6 +6,8 @@ import webbrowser
 from html_preview import generate_html_preview
 import os
 from print_label_html import app as label_blueprint, init_basic_auth
+from records_api import app as records_blueprint
+from template_env import precompile_templates
 from threading import Thread
 
 # Create Flask apppy
@@ -17,15 +19,21 @@ app = Flask(__name__,
 # Initialize basic auth
 init_basic_auth(app)
 
-# Register blueprint
+# Register blueprints
 app.register_blueprint(label_blueprint)
+app.register_blueprint(records_blueprint)
 
 # 確保靜態文件夾存在
 os.makedirs(app.static_folder, exist_ok=True)
 
 @app.route('/')
+def serve_records():
+    """Serve the records page, which reads one page at a time from /api/records"""
+    return send_from_directory(app.static_folder, 'records.html')
+
+@app.route('/preview')
 def serve_preview():
-    """Serve the preview HTML file"""
+    """Serve the generated preview HTML file (full snapshot of both databases)"""
     preview_path = os.path.join(os.path.dirname(__file__), 'preview.html')
     return send_file(preview_path)
 
@@ -60,6 +68,10 @@ def initialize_database():
         print("\nTables already exist, skipping creation")
 
 def main():
+    # Compile the preview and label templates before the first preview/print needs them
+    if os.getenv('PRECOMPILE_TEMPLATES', '1') == '1':
+        precompile_templates()
+    
     # Initialize database
     initialize_database()
     
@@ -0,0 +1,442 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+system_records 按月分區（可選）。
+
+以 created_at 做 RANGE 分區，每月一個分區表（system_records_y2025m01），
+不在任何月份範圍內的記錄寫入 system_records_default。舊月份可以直接分離並歸檔，
+當月的查詢和 VACUUM 只處理當月的分區。
+
+    python partitioning.py --migrate              將現有的 system_records 轉換為分區表（原表保留為 system_records_flat）
+    python partitioning.py --ensure               建立本月和下個月的分區
+    python partitioning.py --detach 2024-01       分離指定月份的分區（資料保留在獨立的表中，可匯出或刪除）
+    python partitioning.py --status               顯示各分區的記錄數
+"""
+
+import sys
+import logging
+import argparse
+from datetime import datetime
+from typing import List, Optional, Tuple
+from sqldb import Database
+from add_latest_records_table import LATEST_TABLE_SQL
+from add_battery_table import BATTERY_TABLE_SQL, BATTERY_BACKFILL_SQL
+from add_record_counters import COUNTERS_TABLE_SQL
+from db_indexes import UPDATED_AT_SQL, INDEXES, create_index_sql
+
+logger = logging.getLogger('partitioning')
+
+TARGET_DATABASES = ('zerodb', 'zerodev')
+DEFAULT_PARTITION = 'system_records_default'
+
+def month_start(value: datetime) -> datetime:
+    """First moment of the month of a date"""
+    return datetime(value.year, value.month, 1)
+
+def add_months(month: datetime, count: int) -> datetime:
+    """First day of the month count months after month"""
+    index = month.year * 12 + month.month - 1 + count
+    return datetime(index // 12, index % 12 + 1, 1)
+
+def month_bounds(month: datetime) -> Tuple[datetime, datetime]:
+    """[start, end) of a month"""
+    start = month_start(month)
+    return start, add_months(start, 1)
+
+def partition_name(month: datetime) -> str:
+    """Partition table of a month, e.g. system_records_y2025m01"""
+    return f"system_records_y{month.year:04d}m{month.month:02d}"
+
+def parse_month(value: str) -> datetime:
+    """Month given as YYYY-MM"""
+    return datetime.strptime(value, '%Y-%m')
+
+def is_partitioned(db: Database) -> bool:
+    """Whether system_records uses the partitioned layout"""
+    db.cursor.execute("""
+        SELECT 1 FROM pg_partitioned_table
+        WHERE partrelid = to_regclass('system_records')
+    """)
+    return db.cursor.fetchone() is not None
+
+def partition_exists(db: Database, month: datetime) -> bool:
+    db.cursor.execute("SELECT to_regclass(%s) IS NOT NULL AS exists", (partition_name(month),))
+    return db.cursor.fetchone()['exists']
+
+def ensure_partition(db: Database, month: datetime) -> bool:
+    """
+    Create the partition of a month if it is missing, without committing
+
+    Rows of the month already written to the default partition are moved
+    into the new partition before it is attached. system_records stays
+    locked against writes until the transaction ends, so a concurrent
+    ingest cannot add rows of the month to the default partition between
+    the move and the attach.
+
+    Args:
+        db: Connected Database, system_records must be partitioned
+        month: Any date in the month
+
+    Returns:
+        bool: True if the partition was created
+    """
+    if partition_exists(db, month):
+        return False
+
+    # 鎖表後再檢查一次，另一個連線可能已經建立了分區
+    db.cursor.execute("LOCK TABLE system_records IN SHARE ROW EXCLUSIVE MODE")
+    if partition_exists(db, month):
+        return False
+
+    name = partition_name(month)
+    start, end = month_bounds(month)
+    db.cursor.execute(f"""
+        CREATE TABLE {name} (LIKE system_records INCLUDING DEFAULTS INCLUDING CONSTRAINTS)
+    """)
+    # The check constraint lets ATTACH skip scanning the new partition
+    db.cursor.execute(f"""
+        ALTER TABLE {name} ADD CONSTRAINT {name}_range
+        CHECK (created_at IS NOT NULL AND created_at >= '{start:%Y-%m-%d}' AND created_at < '{end:%Y-%m-%d}')
+    """)
+    db.cursor.execute(f"""
+        WITH moved AS (
+            DELETE FROM {DEFAULT_PARTITION}
+            WHERE created_at >= %s AND created_at < %s
+            RETURNING *
+        )
+        INSERT INTO {name} SELECT * FROM moved
+    """, (start, end))
+    if db.cursor.rowcount:
+        logger.info(f"已從 {DEFAULT_PARTITION} 移動 {db.cursor.rowcount} 筆記錄到 {name}")
+    db.cursor.execute(f"""
+        ALTER TABLE system_records ATTACH PARTITION {name}
+        FOR VALUES FROM ('{start:%Y-%m-%d}') TO ('{end:%Y-%m-%d}')
+    """)
+    db.cursor.execute(f"ALTER TABLE {name} DROP CONSTRAINT {name}_range")
+    logger.info(f"已建立分區 {name}")
+    return True
+
+def ensure_partitions(db: Database, months_ahead: int = 1, now: Optional[datetime] = None) -> List[str]:
+    """
+    Create the partitions of the current month and the next months_ahead months, then commit
+
+    Does nothing when system_records is not partitioned.
+
+    Returns:
+        list: Names of the created partitions
+    """
+    if not is_partitioned(db):
+        return []
+
+    current = month_start(now or datetime.now())
+    created = []
+    for offset in range(months_ahead + 1):
+        month = add_months(current, offset)
+        if ensure_partition(db, month):
+            created.append(partition_name(month))
+    db.connection.commit()
+    return created
+
+def refresh_latest(db: Database, table: str) -> None:
+    """Recompute system_records_latest for the serial numbers whose latest record is in table
+
+    Attaching, detaching and copying partitions do not fire the triggers on
+    system_records, so the affected serial numbers are recomputed here.
+    """
+    db.cursor.execute(f"""
+        SELECT array_agg(DISTINCT l.serialnumber) AS serials
+        FROM system_records_latest l
+        JOIN {table} t ON t.id = l.record_id AND t.serialnumber = l.serialnumber
+    """)
+    serials = db.cursor.fetchone()['serials']
+    if not serials:
+        return
+    db.cursor.execute("DELETE FROM system_records_latest WHERE serialnumber = ANY(%s)", (serials,))
+    db.cursor.execute("""
+        INSERT INTO system_records_latest (serialnumber, record_id, created_at)
+        SELECT DISTINCT ON (serialnumber) serialnumber, id, created_at
+        FROM system_records
+        WHERE serialnumber = ANY(%s)
+        ORDER BY serialnumber, created_at DESC NULLS LAST, id DESC
+    """, (serials,))
+
+def convert_to_partitioned(db_name, keep_backup=True):
+    """
+    將指定資料庫的 system_records 轉換為按月分區的表
+
+    原表改名為 system_records_flat 作為備份，確認無誤後可手動刪除。
+    記錄的 ID 保持不變，system_records_latest 不需要重建。
+    沒有 created_at 的記錄使用 started_at 作為分區鍵。
+
+    Args:
+        db_name: 資料庫名稱
+        keep_backup: 保留原表 system_records_flat，False 時轉換後刪除
+
+    Returns:
+        bool: 操作是否成功
+    """
+    logger.info(f"正在處理資料庫: {db_name}")
+
+    try:
+        with Database(db_name=db_name) as db:
+            if is_partitioned(db):
+                logger.info(f"{db_name} 的 system_records 已經是分區表，跳過")
+                return True
+
+            db.cursor.execute("SELECT to_regclass('system_records_flat') IS NOT NULL AS exists")
+            if db.cursor.fetchone()['exists']:
+                logger.error(f"{db_name} 已有 system_records_flat，請先刪除或改名之前的備份")
+                return False
+
+            db.cursor.execute("LOCK TABLE system_records IN ACCESS EXCLUSIVE MODE")
+            db.cursor.execute("ALTER TABLE system_records RENAME TO system_records_flat")
+
+            # 索引和約束名稱在 schema 中唯一，原表的改名後新表才能使用相同名稱
+            db.cursor.execute("""
+                SELECT indexrelid::regclass::text AS name FROM pg_index
+                WHERE indrelid = 'system_records_flat'::regclass
+            """)
+            for index in db.cursor.fetchall():
+                db.cursor.execute(f"ALTER INDEX {index['name']} RENAME TO {index['name'][:58]}_flat")
+
+            # 序列改由新表擁有，刪除備份表時不會一併刪除
+            db.cursor.execute("ALTER SEQUENCE system_records_id_seq OWNED BY NONE")
+            db.cursor.execute("""
+                CREATE TABLE system_records (
+                    LIKE system_records_flat INCLUDING DEFAULTS INCLUDING GENERATED INCLUDING STORAGE
+                ) PARTITION BY RANGE (created_at)
+            """)
+            # 分區表的主鍵和唯一鍵必須包含分區鍵
+            db.cursor.execute("""
+                ALTER TABLE system_records ADD CONSTRAINT system_records_pkey PRIMARY KEY (id, created_at);
+                ALTER TABLE system_records ADD CONSTRAINT system_records_unique_key UNIQUE (serialnumber, created_at);
+                CREATE INDEX idx_system_records_serialnumber ON system_records(serialnumber);
+                CREATE INDEX idx_system_records_computername ON system_records(computername);
+            """)
+            db.cursor.execute(UPDATED_AT_SQL)
+            db.cursor.execute(";\n".join(create_index_sql(name) for name in INDEXES))
+            db.cursor.execute("ALTER SEQUENCE system_records_id_seq OWNED BY system_records.id")
+
+            # 為現有資料的每個月份以及本月、下個月建立分區
+            db.cursor.execute(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF system_records DEFAULT")
+            db.cursor.execute("""
+                SELECT DISTINCT date_trunc('month', COALESCE(created_at, started_at::timestamp)) AS month
+                FROM system_records_flat
+            """)
+            months = {record['month'] for record in db.cursor.fetchall()}
+            current = month_start(datetime.now())
+            months.update({current, add_months(current, 1)})
+            for month in sorted(months):
+                start, end = month_bounds(month)
+                db.cursor.execute(f"""
+                    CREATE TABLE {partition_name(month)} PARTITION OF system_records
+                    FOR VALUES FROM ('{start:%Y-%m-%d}') TO ('{end:%Y-%m-%d}')
+                """)
+            logger.info(f"已建立 {len(months)} 個月份分區")
+
+            # 複製資料（觸發器尚未建立，記錄 ID 不變所以 system_records_latest 仍然有效）
+            db.cursor.execute("""
+                SELECT column_name FROM information_schema.columns
+                WHERE table_schema = 'public' AND table_name = 'system_records_flat'
+                ORDER BY ordinal_position
+            """)
+            columns = [record['column_name'] for record in db.cursor.fetchall()]
+            values = ['COALESCE(created_at, started_at::timestamp)' if column == 'created_at' else column
+                      for column in columns]
+            db.cursor.execute(f"""
+                INSERT INTO system_records ({', '.join(columns)})
+                SELECT {', '.join(values)} FROM system_records_flat
+            """)
+            logger.info(f"已複製 {db.cursor.rowcount} 筆記錄")
+
+            # 觸發器移到新表，備份表的寫入不再影響 system_records_latest 和 system_record_batteries
+            db.cursor.execute(LATEST_TABLE_SQL)
+            db.cursor.execute("SELECT to_regclass('system_record_batteries') IS NOT NULL AS exists")
+            has_batteries = db.cursor.fetchone()['exists']
+            db.cursor.execute(BATTERY_TABLE_SQL)
+            if not has_batteries:
+                db.cursor.execute(BATTERY_BACKFILL_SQL)
+            db.cursor.execute("SELECT to_regclass('record_counters') IS NOT NULL AS exists")
+            has_counters = db.cursor.fetchone()['exists']
+            db.cursor.execute(COUNTERS_TABLE_SQL)
+            if not has_counters:
+                db.cursor.execute("SELECT record_counters_refresh()")
+            db.cursor.execute("""
+                DROP TRIGGER IF EXISTS system_records_latest_insert ON system_records_flat;
+                DROP TRIGGER IF EXISTS system_records_latest_update ON system_records_flat;
+                DROP TRIGGER IF EXISTS system_records_latest_delete ON system_records_flat;
+                DROP TRIGGER IF EXISTS system_records_latest_truncate ON system_records_flat;
+                DROP TRIGGER IF EXISTS system_record_batteries_insert ON system_records_flat;
+                DROP TRIGGER IF EXISTS system_record_batteries_update ON system_records_flat;
+                DROP TRIGGER IF EXISTS system_record_batteries_delete ON system_records_flat;
+                DROP TRIGGER IF EXISTS system_record_batteries_truncate ON system_records_flat;
+                DROP TRIGGER IF EXISTS system_records_counters_insert ON system_records_flat;
+                DROP TRIGGER IF EXISTS system_records_counters_update ON system_records_flat;
+                DROP TRIGGER IF EXISTS system_records_counters_delete ON system_records_flat;
+                DROP TRIGGER IF EXISTS system_records_counters_truncate ON system_records_flat;
+                DROP TRIGGER IF EXISTS system_records_updated_at ON system_records_flat;
+            """)
+            if not keep_backup:
+                db.cursor.execute("DROP TABLE system_records_flat")
+
+            db.connection.commit()
+            db.cursor.execute("ANALYZE system_records")
+            db.connection.commit()
+            logger.info(f"成功將 {db_name} 的 system_records 轉換為分區表"
+                        f"{'，原表保留為 system_records_flat' if keep_backup else ''}")
+            return True
+
+    except Exception as e:
+        logger.error(f"轉換分區表時發生錯誤: {str(e)}")
+        return False
+
+def ensure_next_partitions(db_name, months_ahead=1):
+    """
+    在指定的資料庫中建立本月及之後 months_ahead 個月的分區
+
+    Args:
+        db_name: 資料庫名稱
+        months_ahead: 預先建立的月份數
+
+    Returns:
+        bool: 操作是否成功
+    """
+    try:
+        with Database(db_name=db_name) as db:
+            if not is_partitioned(db):
+                logger.warning(f"{db_name} 的 system_records 不是分區表，跳過")
+                return True
+            created = ensure_partitions(db, months_ahead)
+            logger.info(f"{db_name}: 新建分區 {', '.join(created) if created else '無'}")
+            return True
+
+    except Exception as e:
+        logger.error(f"建立分區時發生錯誤: {str(e)}")
+        return False
+
+def detach_month(db_name, month):
+    """
+    分離指定月份的分區
+
+    分區表保留為獨立的表，可用 pg_dump 匯出歸檔後刪除。
+    最新記錄在該月份的序號會重新計算，該月份的電池記錄從 system_record_batteries 刪除
+    （可由分區表的電池欄位重建），記錄計數重新計算。
+
+    Args:
+        db_name: 資料庫名稱
+        month: 月份（任一日期）
+
+    Returns:
+        bool: 操作是否成功
+    """
+    name = partition_name(month)
+    logger.info(f"正在分離 {db_name} 的分區 {name}")
+
+    try:
+        with Database(db_name=db_name) as db:
+            if not is_partitioned(db) or not partition_exists(db, month):
+                logger.error(f"{db_name} 沒有分區 {name}")
+                return False
+
+            db.cursor.execute(f"ALTER TABLE system_records DETACH PARTITION {name}")
+            refresh_latest(db, name)
+            db.cursor.execute("SELECT to_regclass('system_record_batteries') IS NOT NULL AS exists")
+            if db.cursor.fetchone()['exists']:
+                db.cursor.execute(f"""
+                    DELETE FROM system_record_batteries b USING {name} t WHERE b.record_id = t.id
+                """)
+            db.cursor.execute("SELECT to_regclass('record_counters') IS NOT NULL AS exists")
+            if db.cursor.fetchone()['exists']:
+                db.cursor.execute("SELECT record_counters_refresh()")
+            db.connection.commit()
+
+            db.cursor.execute(f"SELECT COUNT(*) AS count FROM {name}")
+            logger.info(f"已分離 {name}（{db.cursor.fetchone()['count']} 筆記錄）")
+            return True
+
+    except Exception as e:
+        logger.error(f"分離分區時發生錯誤: {str(e)}")
+        return False
+
+def show_status(db_name):
+    """顯示各分區的記錄數（依統計資訊估算）"""
+    with Database(db_name=db_name) as db:
+        if not is_partitioned(db):
+            print(f"{db_name}: system_records 不是分區表")
+            return
+
+        db.cursor.execute("""
+            SELECT c.relname AS name, c.reltuples::bigint AS rows,
+                   pg_get_expr(c.relpartbound, c.oid) AS bounds
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = 'system_records'::regclass
+            ORDER BY c.relname
+        """)
+        print(f"\n{db_name}:")
+        for partition in db.cursor.fetchall():
+            rows = partition['rows'] if partition['rows'] >= 0 else '?'
+            print(f"- {partition['name']}: {rows} rows, {partition['bounds']}")
+
+def parse_arguments():
+    """解析命令行參數"""
+    parser = argparse.ArgumentParser(description="system_records 按月分區工具")
+
+    parser.add_argument("--migrate", action="store_true",
+                        help="將 system_records 轉換為按月分區的表")
+
+    parser.add_argument("--ensure", action="store_true",
+                        help="建立本月和之後月份的分區")
+
+    parser.add_argument("--months-ahead", type=int, default=1,
+                        help="預先建立的月份數 (默認: 1)")
+
+    parser.add_argument("--detach", type=parse_month, metavar="YYYY-MM",
+                        help="分離指定月份的分區")
+
+    parser.add_argument("--status", action="store_true",
+                        help="顯示各分區的記錄數")
+
+    parser.add_argument("--db", choices=TARGET_DATABASES,
+                        help="只處理指定的資料庫 (默認: 兩個資料庫)")
+
+    # 如果沒有參數，顯示幫助
+    if len(sys.argv) == 1:
+        parser.print_help()
+        sys.exit(1)
+
+    return parser.parse_args()
+
+def main():
+    """
+    主函數：對指定的資料庫執行分區操作
+    """
+    args = parse_arguments()
+    db_names = [args.db] if args.db else list(TARGET_DATABASES)
+
+    try:
+        success = True
+        for db_name in db_names:
+            if args.migrate and not convert_to_partitioned(db_name):
+                success = False
+            if args.ensure and not ensure_next_partitions(db_name, args.months_ahead):
+                success = False
+            if args.detach and not detach_month(db_name, args.detach):
+                success = False
+            if args.status:
+                show_status(db_name)
+
+        return 0 if success else 1
+
+    except Exception as e:
+        logger.error(f"執行過程中發生錯誤: {str(e)}")
+        return 1
+
+if __name__ == "__main__":
+    # 設置日誌（只在直接執行時設置，被匯入時不影響應用程式的日誌）
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    sys.exit(main())
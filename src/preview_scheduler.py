@@ -0,0 +1,106 @@
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Optional
+from html_preview import generate_html_preview
+
+logger = logging.getLogger("csv_sync.preview")
+
+# 兩次重新生成預覽之間至少相隔的秒數
+PREVIEW_DEBOUNCE = float(os.getenv('PREVIEW_DEBOUNCE', '1.0'))
+
+class PreviewScheduler:
+    def __init__(self, rebuild: Callable[[], Any], debounce: float = PREVIEW_DEBOUNCE,
+                 name: str = "preview_rebuild"):
+        """Debounced preview rebuilds, run by one worker thread
+
+        Code paths that change the data only mark the preview dirty, so an
+        ingest writing to both databases or a burst of file events no
+        longer regenerates the preview once per step. The first mark
+        schedules a rebuild debounce seconds later and every mark until then
+        is merged into it. At most one rebuild starts per debounce window;
+        marks arriving while a rebuild runs schedule the next one, so no
+        change is left out of the preview.
+
+        Args:
+            rebuild: Called from the worker thread, returns the preview path (or None on failure)
+            debounce: Seconds between the first mark and the rebuild, and between two rebuilds
+            name: Worker thread name
+        """
+        self.rebuild = rebuild
+        self.debounce = debounce
+        self.name = name
+
+        self.due: Optional[float] = None        # When the pending rebuild runs, None when clean
+        self.marks = 0                          # Marks merged into the pending rebuild
+        self.condition = threading.Condition()
+        self.running = False
+        self.worker: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """Start the worker thread"""
+        with self.condition:
+            if self.running:
+                return
+            self.running = True
+        self.worker = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self.worker.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stop the worker after the rebuild in progress, a pending rebuild is discarded"""
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        if self.worker is not None:
+            self.worker.join(timeout)
+
+    def mark_dirty(self, reason: str = "") -> None:
+        """Request a preview rebuild, starting the worker on first use"""
+        self.start()
+        now = time.monotonic()
+        with self.condition:
+            if self.due is None:
+                # Also keeps a mark made during a rebuild at least debounce after its start
+                self.due = now + self.debounce
+            self.marks += 1
+            self.condition.notify()
+        logger.debug(f"Preview marked dirty{f' ({reason})' if reason else ''}")
+
+    def _next_due(self) -> Optional[int]:
+        """Wait until the pending rebuild is due, returns the merged marks or None when stopped"""
+        with self.condition:
+            while self.running:
+                if self.due is None:
+                    self.condition.wait()
+                    continue
+                delay = self.due - time.monotonic()
+                if delay <= 0:
+                    marks = self.marks
+                    self.due = None
+                    self.marks = 0
+                    return marks
+                self.condition.wait(delay)
+        return None
+
+    def _run(self) -> None:
+        while True:
+            marks = self._next_due()
+            if marks is None:
+                return
+
+            try:
+                html_path = self.rebuild()
+                if html_path:
+                    logger.info(f"Updated preview: {html_path} ({marks} requests merged)")
+                else:
+                    logger.error("Failed to update preview")
+            except Exception as e:
+                logger.exception(f"Error updating preview: {str(e)}")
+
+# 整個程式共用一個排程器
+preview_scheduler = PreviewScheduler(generate_html_preview)
+
+def mark_preview_dirty(reason: str = "") -> None:
+    """Schedule a rebuild of preview.html (see PreviewScheduler)"""
+    preview_scheduler.mark_dirty(reason)
@@ -4,7 +4,7 @@ import time
 import tempfile
 import win32print
 import subprocess
-from jinja2 import Template
+from template_env import get_template
 import re
 import webbrowser
 from reportlab.lib.pagesizes import inch
@@ -40,46 +40,7 @@ class LabelPrinterHTML:
         
     def create_html(self, data):
         """創建 HTML 標籤"""
-        html_template = """
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <meta charset="utf-8">
-            <style>
-                @page {
-                    size: {{ width }}mm {{ height }}mm;
-                    margin: 0;
-                }
-                body {
-                    width: {{ width }}mm;
-                    height: {{ height }}mm;
-                    margin: 0;
-                    padding: 0;
-                    font-family: Arial, sans-serif;
-                }
-                .label {
-                    padding: 20px 10px;
-                }
-                .field {
-                    font-size: 10pt;
-                    line-height: 1.1;
-                    margin: 0;
-                    padding: 0;
-                }
-            </style>
-        </head>
-        <body>
-            <div class="label">
-                {% for field, value in data %}
-                <p class="field">{{ field }}: {{ value }}</p>
-                {% endfor %}
-            </div>
-            <button onclick="reprintLabel('{{ serial_number }}')">Reprint Label</button>
-        </body>
-        </html>
-        """
-        
-        template = Template(html_template)
+        template = get_template('label.html')
         return template.render(
             width=self.label_width,
             height=self.label_height,
@@ -0,0 +1,122 @@
+from typing import List, Optional, Sequence
+import pandas as pd
+from timestamp_parser import TimestampParser, parse_timestamps
+
+# Insert column order for system_records rows coming from the intake CSV
+SYSTEM_RECORD_COLUMNS = [
+    'serialnumber', 'computername', 'manufacturer', 'model',
+    'systemsku', 'ram_gb', 'disks', 'created_at',
+    'operatingsystem', 'cpu', 'resolution', 'graphicscard',
+    'touchscreen', 'design_capacity', 'full_charge_capacity',
+    'cycle_count', 'battery_health'
+]
+
+def text_column(df: pd.DataFrame, column: str, default: Optional[str] = None,
+                lower: bool = False) -> pd.Series:
+    """Strip a CSV column as text, NA values become default
+
+    Args:
+        df: Source DataFrame
+        column: CSV column name
+        default: Value used for NA and for a missing column
+        lower: Whether to lowercase the values
+
+    Returns:
+        pd.Series: Object series of str or default
+    """
+    if column not in df.columns:
+        return pd.Series([default] * len(df), index=df.index, dtype=object)
+
+    values = df[column]
+    missing = values.isna()
+    text = values.astype(str).str.strip()
+    if lower:
+        text = text.str.lower()
+    text = text.astype(object)
+    text[missing] = default
+    return text
+
+def numeric_column(df: pd.DataFrame, column: str, default: Optional[float] = 0.0) -> pd.Series:
+    """Coerce a CSV column to float, NA and invalid values become default"""
+    if column not in df.columns:
+        return pd.Series([default] * len(df), index=df.index, dtype=object)
+
+    values = pd.to_numeric(df[column], errors='coerce').astype(float).astype(object)
+    values[values.isna()] = default
+    return values
+
+def record_timestamps(df: pd.DataFrame, column: str = 'created_at') -> pd.Series:
+    """Naive pandas timestamps of the rows, missing ones set to the current time"""
+    if column not in df.columns:
+        return pd.Series([pd.Timestamp.now()] * len(df), index=df.index)
+
+    timestamps = pd.to_datetime(df[column], errors='coerce')
+    if timestamps.dt.tz is not None:
+        timestamps = timestamps.dt.tz_localize(None)
+    return timestamps.fillna(pd.Timestamp.now())
+
+def first_timestamp(df: pd.DataFrame, columns: Sequence[str], parser: Optional[TimestampParser] = None,
+                    key: Optional[str] = None) -> pd.Series:
+    """Naive timestamps from the first of columns that parses, missing ones set to the current time
+
+    Args:
+        df: CSV rows
+        columns: Timestamp columns in order of preference
+        parser: Optional TimestampParser reusing the format detected for key across chunks
+        key: File the rows come from, used as parser cache key
+    """
+    timestamps = pd.Series(pd.NaT, index=df.index, dtype='datetime64[ns]')
+    for column in columns:
+        missing = timestamps.isna()
+        if column not in df.columns or not missing.any():
+            continue
+        # One format is detected per column and applied in a single vectorized call
+        if parser is not None:
+            timestamps[missing] = parser.parse(df.loc[missing, column], key=(key, column))
+        else:
+            timestamps[missing] = parse_timestamps(df.loc[missing, column])
+    return timestamps.fillna(pd.Timestamp.now())
+
+def normalize_system_records(df: pd.DataFrame, timestamps: Optional[pd.Series] = None) -> pd.DataFrame:
+    """Normalize intake CSV rows into system_records insert values
+
+    Works column by column instead of per row: text is stripped, NA values
+    become None, RAM_GB is coerced to float and battery values keep their
+    raw text (dual battery machines use "44000, 40000").
+
+    Args:
+        df: CSV rows with parsed created_at and original_timestamp columns
+        timestamps: Result of record_timestamps(df), computed when not given
+
+    Returns:
+        pd.DataFrame: One column per entry of SYSTEM_RECORD_COLUMNS
+    """
+    if timestamps is None:
+        timestamps = record_timestamps(df)
+    created_at = text_column(df, 'original_timestamp')
+    missing_created_at = created_at.isna()
+    created_at[missing_created_at] = timestamps[missing_created_at]
+
+    return pd.DataFrame({
+        'serialnumber': text_column(df, 'SerialNumber', ''),
+        'computername': text_column(df, 'ComputerName'),
+        'manufacturer': text_column(df, 'Manufacturer'),
+        'model': text_column(df, 'Model'),
+        'systemsku': text_column(df, 'SystemSKU'),
+        'ram_gb': numeric_column(df, 'RAM_GB'),
+        'disks': text_column(df, 'Disks', ''),  # Keep original disk string
+        'created_at': created_at,
+        'operatingsystem': text_column(df, 'OperatingSystem'),
+        'cpu': text_column(df, 'CPU'),
+        'resolution': text_column(df, 'Resolution'),
+        'graphicscard': text_column(df, 'GraphicsCard'),
+        'touchscreen': text_column(df, 'TouchScreen'),
+        'design_capacity': text_column(df, 'Design_Capacity'),
+        'full_charge_capacity': text_column(df, 'Full_Charge_Capacity'),
+        'cycle_count': text_column(df, 'Cycle_Count'),
+        'battery_health': text_column(df, 'Battery_Health')
+    }, index=df.index, columns=SYSTEM_RECORD_COLUMNS)
+
+def to_insert_rows(records: pd.DataFrame, columns: List[str] = SYSTEM_RECORD_COLUMNS) -> List[tuple]:
+    """Turn normalized records into insert tuples in column order"""
+    return list(records[columns].itertuples(index=False, name=None))
@@ -0,0 +1,288 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+分頁記錄 API，預覽頁面 (static/records.html) 每次只讀取一頁記錄。
+
+    GET /api/records        每個序號的最新記錄 (history=1 時為全部記錄)
+    GET /api/product_keys   產品金鑰
+
+參數:
+    db       zerodb (默認) 或 zerodev
+    limit    每頁筆數 (默認 50，最多 500)
+    cursor   上一頁返回的 next_cursor
+    columns  以逗號分隔的欄位，只返回這些欄位 (默認: 全部顯示欄位)
+    format   raw (默認) 或 display (與預覽相同的格式化文字)
+    q, field, fuzzy   /api/records 的搜尋: 在 field 欄位中搜尋 q，fuzzy=1 時依序匹配每個字元
+    batteries         /api/records 設為 1 時，每筆記錄附帶 system_record_batteries 的數值電池資料
+
+total 為記錄計數器的總數（history=1 時為全部記錄，否則為序號數），
+搜尋時不返回 total，計數器不反映搜尋條件。
+
+分頁使用 (created_at, id) 的 keyset 條件，由索引直接定位到下一頁的位置，
+每次請求的成本只取決於頁面大小，不取決於記錄總數。
+沒有 created_at 的記錄排在最後，按 id 由新到舊分頁。
+"""
+
+import json
+import base64
+import logging
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from flask import Blueprint, request, jsonify
+from sqldb import Database
+from html_preview import format_value, PREVIEW_RECORD_COLUMNS, PREVIEW_KEY_COLUMNS
+
+logger = logging.getLogger('records_api')
+
+app = Blueprint('records_api', __name__)
+
+TARGET_DATABASES = ('zerodb', 'zerodev')
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+
+# 可返回的欄位（同時是欄位投影的白名單），與預覽表格相同
+RECORD_COLUMNS = PREVIEW_RECORD_COLUMNS
+PRODUCT_KEY_COLUMNS = PREVIEW_KEY_COLUMNS
+
+# 預覽頁面的搜尋欄位
+SEARCH_FIELDS = ('serialnumber', 'systemsku', 'model')
+
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# 每個序號的最新記錄，system_records_latest 上的 (created_at, record_id) 索引提供排序和定位
+LATEST_PAGE_SQL = """
+    SELECT r.id, r.created_at{columns}
+    FROM system_records_latest l
+    JOIN system_records r ON r.id = l.record_id
+    WHERE {conditions}
+    ORDER BY l.created_at DESC, l.record_id DESC
+    LIMIT %s
+"""
+
+HISTORY_PAGE_SQL = """
+    SELECT r.id, r.created_at{columns}
+    FROM system_records r
+    WHERE {conditions}
+    ORDER BY r.created_at DESC, r.id DESC
+    LIMIT %s
+"""
+
+PRODUCT_KEYS_PAGE_SQL = """
+    SELECT k.id, k.created_at{columns}
+    FROM product_keys k
+    WHERE {conditions}
+    ORDER BY k.created_at DESC, k.id DESC
+    LIMIT %s
+"""
+
+class BadRequest(ValueError):
+    """Invalid request parameter, answered with 400"""
+
+def encode_cursor(record: Dict) -> str:
+    """Opaque cursor of the last record of a page"""
+    created_at = record['created_at'].isoformat() if record['created_at'] is not None else None
+    key = [created_at, record['id']]
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode().rstrip('=')
+
+def decode_cursor(cursor: str) -> Tuple[Optional[datetime], int]:
+    """(created_at, id) of a cursor returned by encode_cursor, created_at is None for undated records"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, record_id = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(created_at) if created_at is not None else None, int(record_id)
+    except Exception:
+        raise BadRequest('Invalid cursor')
+
+def page_arguments(columns: Sequence[str]) -> Dict[str, Any]:
+    """Parse the paging parameters shared by both endpoints"""
+    db_name = request.args.get('db', 'zerodb')
+    if db_name not in TARGET_DATABASES:
+        raise BadRequest(f"Unknown database: {db_name}")
+
+    try:
+        limit = int(request.args.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        raise BadRequest('limit must be an integer')
+    if limit < 1:
+        raise BadRequest('limit must be positive')
+
+    selected = list(columns)
+    if request.args.get('columns'):
+        selected = [column.strip() for column in request.args['columns'].split(',') if column.strip()]
+        unknown = [column for column in selected if column not in columns]
+        if unknown:
+            raise BadRequest(f"Unknown columns: {', '.join(unknown)}")
+
+    output_format = request.args.get('format', 'raw')
+    if output_format not in ('raw', 'display'):
+        raise BadRequest('format must be raw or display')
+
+    cursor = request.args.get('cursor')
+    return {
+        'db_name': db_name,
+        'limit': min(limit, MAX_LIMIT),
+        'columns': selected,
+        'display': output_format == 'display',
+        'after': decode_cursor(cursor) if cursor else None,
+    }
+
+def search_pattern(term: str, fuzzy: bool) -> str:
+    """ILIKE pattern of a search term, fuzzy matches the characters in order"""
+    escaped = [c if c not in '\\%_' else '\\' + c for c in term]
+    if fuzzy:
+        return '%' + '%'.join(escaped) + '%'
+    return '%' + ''.join(escaped) + '%'
+
+def serialize(record: Dict, columns: Sequence[str], display: bool) -> Dict:
+    """JSON-safe record with the selected columns"""
+    result = {}
+    for column in columns:
+        value = record[column]
+        if isinstance(value, datetime):
+            value = value.strftime(TIME_FORMAT)
+        elif display:
+            value = format_value(value, column)
+        elif isinstance(value, Decimal):
+            value = float(value)
+        result[column] = value
+    return result
+
+def serialize_batteries(batteries: Sequence[Dict]) -> List[Dict]:
+    """JSON-safe battery rows of one record, in battery_index order"""
+    return [{
+        'design_capacity': battery['design_capacity'],
+        'full_charge_capacity': battery['full_charge_capacity'],
+        'cycle_count': battery['cycle_count'],
+        'health': float(battery['health']) if battery['health'] is not None else None,
+    } for battery in batteries]
+
+def fetch_page(db: Database, query: str, alias: str, key: Tuple[str, str], args: Dict[str, Any],
+               conditions: Optional[List[str]] = None, params: Optional[List] = None) -> Tuple[List[Dict], Optional[str]]:
+    """
+    Read one page of a keyset paged query
+
+    Records with a created_at come first, newest first. Records without one
+    follow, newest id first; both parts are read with the (created_at, id)
+    index, a page crossing from one part to the other reads both.
+
+    Args:
+        db: Database connection
+        query: One of the *_PAGE_SQL templates
+        alias: Alias of the table the selected columns come from
+        key: The created_at and id columns the query is ordered by, e.g. ('l.created_at', 'l.record_id')
+        args: Parsed page_arguments
+        conditions: Extra WHERE conditions
+        params: Parameters of the extra conditions
+
+    Returns:
+        tuple: Records of the page and the cursor of the next page (None on the last page)
+    """
+    created_at, row_id = key
+    after = args['after']
+    # 多讀一筆判斷是否還有下一頁
+    wanted = args['limit'] + 1
+
+    # id 和 created_at 總是讀取，用於產生 cursor
+    columns = ''.join(f", {alias}.{column}" for column in args['columns'] if column != 'created_at')
+
+    def read(part: List[str], part_params: List, limit: int) -> List[Dict]:
+        where = ' AND '.join(list(conditions or []) + part)
+        db.cursor.execute(query.format(columns=columns, conditions=where),
+                          (*(params or []), *part_params, limit))
+        return db.cursor.fetchall()
+
+    records = []
+    if after is None or after[0] is not None:
+        part = [f"{created_at} IS NOT NULL"]
+        part_params = []
+        if after is not None:
+            part.append(f"({created_at}, {row_id}) < (%s, %s)")
+            part_params.extend(after)
+        records = read(part, part_params, wanted)
+
+    if len(records) < wanted:
+        part = [f"{created_at} IS NULL"]
+        part_params = []
+        if after is not None and after[0] is None:
+            part.append(f"{row_id} < %s")
+            part_params.append(after[1])
+        records += read(part, part_params, wanted - len(records))
+
+    next_cursor = None
+    if len(records) > args['limit']:
+        records = records[:args['limit']]
+        next_cursor = encode_cursor(records[-1])
+    return records, next_cursor
+
+def error_response(e: Exception):
+    """JSON error answer, 400 for invalid parameters, other errors are logged and answered with 500"""
+    if isinstance(e, BadRequest):
+        return jsonify({'success': False, 'message': str(e)}), 400
+    logger.exception(f"Error in records API: {str(e)}")
+    return jsonify({'success': False, 'message': 'Internal server error'}), 500
+
+@app.route('/api/records')
+def records_route():
+    try:
+        args = page_arguments(RECORD_COLUMNS)
+        history = request.args.get('history') == '1'
+
+        conditions, params = [], []
+        term = request.args.get('q', '').strip()
+        if term:
+            field = request.args.get('field', 'serialnumber')
+            if field not in SEARCH_FIELDS:
+                raise BadRequest(f"Unknown search field: {field}")
+            conditions.append(f"r.{field} ILIKE %s")
+            params.append(search_pattern(term, request.args.get('fuzzy') == '1'))
+
+        with Database(db_name=args['db_name']) as db:
+            if history:
+                records, next_cursor = fetch_page(db, HISTORY_PAGE_SQL, 'r', ('r.created_at', 'r.id'),
+                                                  args, conditions, params)
+            else:
+                records, next_cursor = fetch_page(db, LATEST_PAGE_SQL, 'r', ('l.created_at', 'l.record_id'),
+                                                  args, conditions, params)
+            counters = db.get_counters()
+            # 一次查詢讀取整頁記錄的電池
+            batteries = (db.get_batteries([record['id'] for record in records])
+                         if request.args.get('batteries') == '1' else None)
+
+        result = {
+            'success': True,
+            'db': args['db_name'],
+            'records': [serialize(record, args['columns'], args['display']) for record in records],
+            'next_cursor': next_cursor,
+        }
+        if batteries is not None:
+            for record, serialized in zip(records, result['records']):
+                serialized['batteries'] = serialize_batteries(batteries.get(record['id'], []))
+        if not term:
+            result['total'] = counters['system_records'] if history else counters['latest']
+        return jsonify(result)
+
+    except Exception as e:
+        return error_response(e)
+
+@app.route('/api/product_keys')
+def product_keys_route():
+    try:
+        args = page_arguments(PRODUCT_KEY_COLUMNS)
+
+        with Database(db_name=args['db_name']) as db:
+            records, next_cursor = fetch_page(db, PRODUCT_KEYS_PAGE_SQL, 'k', ('k.created_at', 'k.id'), args)
+            total = db.get_counters()['product_keys']
+
+        return jsonify({
+            'success': True,
+            'db': args['db_name'],
+            'records': [serialize(record, args['columns'], args['display']) for record in records],
+            'next_cursor': next_cursor,
+            'total': total,
+        })
+
+    except Exception as e:
+        return error_response(e)
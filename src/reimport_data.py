@@ -5,15 +5,24 @@ import re
 from sqldb import Database
 from initdb import create_tables, update_system_records, update_product_keys
 from html_preview import generate_html_preview
+from csv_cache import CSVCache
+from csv_reader import CSV_CHUNK_SIZE, iter_csv_chunks
+from record_normalizer import numeric_column, text_column, to_insert_rows
+from system_record_writer import SystemRecordWriter
+from csv_cache import file_month
+from partitioning import convert_to_partitioned, ensure_partition, is_partitioned, month_bounds
 import json
 
+# 歷史月份的 CSV 解析後保存在本地, 避免重複從網路磁碟讀取
+csv_cache = CSVCache()
+
 def read_system_records(file_path):
     """
     讀取系統記錄CSV文件並進行初始數據處理
     """
     try:
-        # 直接讀取 CSV，保持原始格式
-        df = pd.read_csv(
+        # 直接讀取 CSV，保持原始格式; 已結束的月份從本地快取載入
+        df = csv_cache.read(
             file_path,
             encoding='utf-8',
             dtype=str,  # 全部當作字符串讀入
@@ -26,6 +35,60 @@ def read_system_records(file_path):
         traceback.print_exc()
         return None
 
+# Version of normalize_system_records_chunk, part of the CSV cache key:
+# bump it when the normalization changes so cached months are normalized again
+SYSTEM_RECORDS_NORMALIZER_VERSION = 'reimport_data.system_records.1'
+
+def normalize_system_records_chunk(df):
+    """
+    將一個區塊的 CSV 記錄轉換為 system_records 的欄位值, 已結束的月份快取轉換後的結果
+    """
+    # 處理 resolution 欄位, 只保留數字部分
+    resolution = text_column(df, 'Resolution').str.extract(r'(\d+)x(\d+)')
+    resolution_value = (resolution[0] + 'x' + resolution[1]).astype(object)
+    resolution_value[resolution[0].isna()] = None
+
+    # created_at 保持原始文字, 優先 Timestamp, 其次 Date
+    created_at = text_column(df, 'Timestamp')
+    created_at = created_at.where(created_at.notna(), text_column(df, 'Date'))
+    created_at[created_at.isna()] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+    # 逐欄處理, 磁盤數據完全保持原始格式
+    return pd.DataFrame({
+        'serialnumber': text_column(df, 'SerialNumber'),
+        'computername': text_column(df, 'ComputerName'),
+        'manufacturer': text_column(df, 'Manufacturer'),
+        'model': text_column(df, 'Model'),
+        'systemsku': text_column(df, 'SystemSKU'),
+        'operatingsystem': text_column(df, 'OperatingSystem'),
+        'cpu': text_column(df, 'CPU'),
+        'resolution': resolution_value,
+        'graphicscard': text_column(df, 'GraphicsCard'),
+        'ram_gb': text_column(df, 'RAM_GB'),
+        'disks': text_column(df, 'Disks', ''),
+        'design_capacity': numeric_column(df, 'Design_Capacity').map(int),
+        'full_charge_capacity': numeric_column(df, 'Full_Charge_Capacity').map(int),
+        'cycle_count': numeric_column(df, 'Cycle_Count').map(int),
+        'battery_health': numeric_column(df, 'Battery_Health'),
+        'touchscreen': text_column(df, 'TouchScreen', 'unknown', lower=True),  # 空值設為 "unknown"
+        'created_at': created_at
+    }, index=df.index)
+
+def read_system_records_chunks(file_path, chunksize=CSV_CHUNK_SIZE):
+    """
+    分塊讀取並轉換系統記錄CSV文件, 每次只在記憶體中保留一個區塊
+    """
+    return iter_csv_chunks(
+        file_path,
+        chunksize=chunksize,
+        cache=csv_cache,
+        normalize=normalize_system_records_chunk,
+        version=SYSTEM_RECORDS_NORMALIZER_VERSION,
+        encoding='utf-8',
+        dtype=str,  # 全部當作字符串讀入
+        na_values=['', 'N/A', 'NULL', '#N/A', '#VALUE!']
+    )
+
 def parse_disk_capacity(capacity_str):
     """
     解析磁盤容量字符串並轉換為GB
@@ -158,8 +221,7 @@ def process_system_records(file_path):
         print(f"當前連接的數據庫: {current_db}")
         
         # 檢查表中的現有記錄
-        db.cursor.execute("SELECT COUNT(*) as count FROM system_records")
-        existing_count = db.cursor.fetchone()['count']
+        existing_count = db.get_counters()['system_records']
         print(f"數據庫中現有記錄數: {existing_count}")
     
     return df
@@ -227,9 +289,17 @@ def clear_and_reimport():
     
     print("\nStarting database cleanup and reimport process...")
     
-    # Recreate tables (this will drop existing tables)
+    # Recreate tables (this will drop existing tables), keeping the partitioned layout if used
+    with Database() as db:
+        partitioned = is_partitioned(db)
     print("\nRecreating database tables...")
     create_tables()
+    if partitioned:
+        print("Recreating monthly partitions...")
+        with Database() as db:
+            # 備份的舊表也屬於要清除的數據
+            db.execute_query("DROP TABLE IF EXISTS system_records_flat")
+        convert_to_partitioned('zerodb', keep_backup=False)
     
     # Get all CSV files
     all_files = os.listdir(base_path)
@@ -252,15 +322,18 @@ def clear_and_reimport():
         file_path = os.path.join(base_path, file)
         print(f"\nImporting {file}...")
         try:
-            # 使用改進的數據處理流程
-            df = process_system_records(file_path)
-            if df is not None:
-                total_csv_records += len(df)
-                if update_system_records(df, is_dataframe=True):
-                    total_records += len(df)
-                    print(f"Successfully imported {len(df)} records from {file}")
-                else:
-                    print(f"Failed to import {file}")
+            # 分塊讀取和寫入, 記憶體用量取決於區塊大小而非檔案大小
+            file_csv_records = 0
+            file_records = 0
+            for chunk_number, records in enumerate(read_system_records_chunks(file_path), 1):
+                file_csv_records += len(records)
+                if update_system_records(records, is_dataframe=True):
+                    file_records += len(records)
+                print(f"  Chunk {chunk_number}: {file_csv_records} records read, {file_records} imported")
+            
+            total_csv_records += file_csv_records
+            total_records += file_records
+            print(f"Imported {file_records} of {file_csv_records} records from {file}")
         except Exception as e:
             print(f"Error processing {file}: {str(e)}")
             import traceback
@@ -310,16 +383,80 @@ def clear_and_reimport():
     
     print("\nDatabase reimport completed!")
 
+# 依 system_records_latest 重新計算指定序號的 is_current
+REFRESH_IS_CURRENT_SQL = """
+    UPDATE system_records r
+    SET is_current = (r.id = l.record_id)
+    FROM system_records_latest l
+    WHERE l.serialnumber = r.serialnumber
+      AND r.serialnumber = ANY(%s)
+      AND r.is_current IS DISTINCT FROM (r.id = l.record_id)
+"""
+
+def reimport_month(file_path):
+    """Replace the records of one monthly CSV file, other months are kept
+    
+    The month's rows are deleted (only its partition is touched when
+    system_records is partitioned) and the file is imported again. The
+    imported rows do not demote other records, because later months may hold
+    newer records of the same serial numbers; is_current of every affected
+    serial number is recomputed from system_records_latest afterwards.
+    """
+    month = file_month(file_path)
+    if month is None:
+        print(f"Cannot tell the month of {os.path.basename(file_path)}")
+        return False
+    start, end = month_bounds(month)
+    
+    print(f"\nReimporting {start:%Y-%m} from {os.path.basename(file_path)}...")
+    try:
+        with Database() as db:
+            if is_partitioned(db):
+                ensure_partition(db, month)
+            db.cursor.execute("""
+                DELETE FROM system_records
+                WHERE created_at >= %s AND created_at < %s
+                RETURNING serialnumber
+            """, (start, end))
+            deleted = db.cursor.fetchall()
+            serialnumbers = {record['serialnumber'] for record in deleted if record['serialnumber']}
+            print(f"Deleted {len(deleted)} records of {start:%Y-%m}")
+            db.connection.commit()
+        
+        file_csv_records = 0
+        file_records = 0
+        for chunk_number, records in enumerate(read_system_records_chunks(file_path), 1):
+            file_csv_records += len(records)
+            if update_system_records(records, is_dataframe=True, mark_previous_not_current=False):
+                file_records += len(records)
+            print(f"  Chunk {chunk_number}: {file_csv_records} records read, {file_records} imported")
+        
+        print(f"Imported {file_records} of {file_csv_records} records from {os.path.basename(file_path)}")
+        
+        # 只有每個序號的最新記錄（可能在其他月份）是當前記錄
+        with Database() as db:
+            db.cursor.execute("""
+                SELECT DISTINCT serialnumber FROM system_records
+                WHERE created_at >= %s AND created_at < %s AND serialnumber IS NOT NULL
+            """, (start, end))
+            serialnumbers.update(record['serialnumber'] for record in db.cursor.fetchall())
+            db.cursor.execute(REFRESH_IS_CURRENT_SQL, (list(serialnumbers),))
+            print(f"Updated is_current of {db.cursor.rowcount} records")
+            db.connection.commit()
+        return True
+    except Exception as e:
+        print(f"Error reimporting {file_path}: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return False
+
 def check_database_status():
     """Check current database status"""
     with Database() as db:
-        # Check system records
-        db.cursor.execute("SELECT COUNT(*) as count FROM system_records")
-        system_count = db.cursor.fetchone()['count']
-        
-        # Check product keys
-        db.cursor.execute("SELECT COUNT(*) as count FROM product_keys")
-        product_count = db.cursor.fetchone()['count']
+        # Record counts kept by the record_counters triggers
+        counters = db.get_counters()
+        system_count = counters['system_records']
+        product_count = counters['product_keys']
         
         # Check TouchScreen values distribution
         db.cursor.execute("""
@@ -338,109 +475,30 @@ def check_database_status():
         for stat in touchscreen_stats:
             print(f"'{stat['touchscreen']}': {stat['count']} records")
 
-def update_system_records(df, is_dataframe=False, db=None):
-    """Update system records table with changes from CSV file or DataFrame"""
+def update_system_records(records, is_dataframe=False, db=None, mark_previous_not_current=True):
+    """Write system records normalized by normalize_system_records_chunk
+    
+    Args:
+        records: Chunk returned by read_system_records_chunks
+        mark_previous_not_current: Set is_current = FALSE on the other records of the
+            imported serial numbers (only correct when the rows are the newest ones)
+    """
     if db is None:
         db = Database()
     try:
         with db:
-            records_processed = 0
+            # COPY 整批資料後一次插入, 並將相同序號的舊記錄標記為非當前
+            writer = SystemRecordWriter(
+                db,
+                columns=list(records.columns),
+                constants={'is_current': True},
+                mark_previous_not_current=mark_previous_not_current
+            )
+            result = writer.write(to_insert_rows(records, list(records.columns)))
+            records_processed = len(result.inserted)
             
-            for _, row in df.iterrows():
-                try:
-                    db.cursor.execute("BEGIN")
-                    
-                    # 將相同序號的舊記錄標記為非當前
-                    if row.get('SerialNumber'):
-                        db.cursor.execute("""
-                            UPDATE system_records 
-                            SET is_current = FALSE 
-                            WHERE serialnumber = %(serialnumber)s
-                        """, {'serialnumber': row.get('SerialNumber')})
-                    
-                    # 處理數值型欄位
-                    try:
-                        design_capacity = int(float(row.get('Design_Capacity', 0)))
-                    except (ValueError, TypeError):
-                        design_capacity = 0
-                        
-                    try:
-                        full_charge_capacity = int(float(row.get('Full_Charge_Capacity', 0)))
-                    except (ValueError, TypeError):
-                        full_charge_capacity = 0
-                        
-                    try:
-                        cycle_count = int(float(row.get('Cycle_Count', 0)))
-                    except (ValueError, TypeError):
-                        cycle_count = 0
-                        
-                    try:
-                        battery_health = float(row.get('Battery_Health', 0))
-                    except (ValueError, TypeError):
-                        battery_health = 0
-                    
-                    # 處理磁盤數據 - 完全保持原始格式
-                    disks_str = str(row.get('Disks', '')).strip() if pd.notna(row.get('Disks')) else ''
-                    disks_data = disks_str  # 直接使用原始格式，不做任何轉換或修改
-                    
-                    # 處理 touchscreen 欄位，如果為空則設為 "unknown"
-                    touchscreen_value = str(row.get('TouchScreen', '')).strip().lower() if pd.notna(row.get('TouchScreen')) else "unknown"
-                    
-                    # 處理 resolution 欄位
-                    resolution_value = str(row.get('Resolution', '')).strip() if pd.notna(row.get('Resolution')) else None
-                    if resolution_value:
-                        # 提取數字部分
-                        match = re.search(r'(\d+)x(\d+)', resolution_value)
-                        if match:
-                            resolution_value = f"{match.group(1)}x{match.group(2)}"
-                        else:
-                            resolution_value = None
-                    
-                    # 插入新記錄，保持原始數據
-                    params = {
-                        'serialnumber': str(row.get('SerialNumber', '')).strip() if pd.notna(row.get('SerialNumber')) else None,
-                        'computername': str(row.get('ComputerName', '')).strip() if pd.notna(row.get('ComputerName')) else None,
-                        'manufacturer': str(row.get('Manufacturer', '')).strip() if pd.notna(row.get('Manufacturer')) else None,
-                        'model': str(row.get('Model', '')).strip() if pd.notna(row.get('Model')) else None,
-                        'systemsku': str(row.get('SystemSKU', '')).strip() if pd.notna(row.get('SystemSKU')) else None,
-                        'operatingsystem': str(row.get('OperatingSystem', '')).strip() if pd.notna(row.get('OperatingSystem')) else None,
-                        'cpu': str(row.get('CPU', '')).strip() if pd.notna(row.get('CPU')) else None,
-                        'resolution': resolution_value,
-                        'graphicscard': str(row.get('GraphicsCard', '')).strip() if pd.notna(row.get('GraphicsCard')) else None,
-                        'ram_gb': str(row.get('RAM_GB', '')).strip() if pd.notna(row.get('RAM_GB')) else None,
-                        'disks': disks_data,
-                        'design_capacity': design_capacity,
-                        'full_charge_capacity': full_charge_capacity,
-                        'cycle_count': cycle_count,
-                        'battery_health': battery_health,
-                        'touchscreen': touchscreen_value,
-                        'created_at': row.get('Timestamp') or row.get('Date') or datetime.now(),
-                        'is_current': True
-                    }
-                    
-                    db.cursor.execute("""
-                        INSERT INTO system_records (
-                            serialnumber, computername, manufacturer, model,
-                            systemsku, operatingsystem, cpu, resolution,
-                            graphicscard, ram_gb, disks, design_capacity,
-                            full_charge_capacity, cycle_count, battery_health,
-                            touchscreen, created_at, is_current
-                        ) VALUES (
-                            %(serialnumber)s, %(computername)s, %(manufacturer)s, %(model)s,
-                            %(systemsku)s, %(operatingsystem)s, %(cpu)s, %(resolution)s,
-                            %(graphicscard)s, %(ram_gb)s, %(disks)s, %(design_capacity)s,
-                            %(full_charge_capacity)s, %(cycle_count)s, %(battery_health)s,
-                            %(touchscreen)s, %(created_at)s, %(is_current)s
-                        )
-                    """, params)
-                    
-                    records_processed += 1
-                    db.cursor.execute("COMMIT")
-                    
-                except Exception as e:
-                    db.cursor.execute("ROLLBACK")
-                    print(f"Error processing record: {str(e)}")
-                    continue
+            for failed in result.failed:
+                print(f"Error processing record: {failed['error']}")
             
             print(f"Records processed: {records_processed}")
             return records_processed > 0
@@ -512,9 +570,10 @@ if __name__ == "__main__":
         print("\nDatabase Management Tool")
         print("1. Clear database and reimport all data")
         print("2. Check database status")
-        print("3. Exit")
+        print("3. Reimport one month")
+        print("4. Exit")
         
-        choice = input("\nEnter your choice (1-3): ")
+        choice = input("\nEnter your choice (1-4): ")
         
         if choice == '1':
             confirm = input("\nWARNING: This will delete all existing data. Continue? (yes/no): ")
@@ -523,6 +582,12 @@ if __name__ == "__main__":
         elif choice == '2':
             check_database_status()
         elif choice == '3':
+            file_name = input("\nCSV file (e.g. system_records_Jan2025.csv): ").strip()
+            file_path = os.path.join(r"\\192.168.0.10\Files\03_IT\data", file_name)
+            confirm = input(f"\nWARNING: This will replace the records of {file_name}. Continue? (yes/no): ")
+            if confirm.lower() in ['yes', 'y']:
+                reimport_month(file_path)
+        elif choice == '4':
             print("\nExiting...")
             break
         else:
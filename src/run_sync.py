@@ -7,14 +7,14 @@ import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from sqldb import Database
+from sqldb import AsyncDatabase, close_async_pools, run_async
 from inventory_sync.sync_manager import InventorySync
 from sync_manager import SystemRecordSyncManager, SyncTask
 
-async def update_database_schema(db: Database):
+async def update_database_schema(db: AsyncDatabase):
     """更新數據庫結構以支持同步功能"""
     try:
-        with db:
+        async with db:
             # 添加同步相關欄位
             query = """
                 ALTER TABLE system_records 
@@ -23,7 +23,7 @@ async def update_database_schema(db: Database):
                     ADD COLUMN IF NOT EXISTS sync_version NUMERIC DEFAULT 1.0,
                     ADD COLUMN IF NOT EXISTS started_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP;
             """
-            db.cursor.execute(query)
+            await db.cursor.execute(query)
             
             # 創建索引
             index_queries = [
@@ -46,9 +46,9 @@ async def update_database_schema(db: Database):
             ]
             
             for query in index_queries:
-                db.cursor.execute(query)
+                await db.cursor.execute(query)
             
-            db.connection.commit()
+            await db.connection.commit()
             
             logging.info("Database schema updated successfully")
             return True
@@ -67,7 +67,7 @@ async def main():
     try:
         # 初始化數據庫連接
         logger.info("Initializing database connection...")
-        db = Database()
+        db = AsyncDatabase()
         
         # 更新數據庫結構
         logger.info("Updating database schema...")
@@ -102,6 +102,12 @@ async def main():
         sync_task.stop()
     except Exception as e:
         logger.error(f"Unexpected error: {str(e)}", exc_info=True)
+    finally:
+        await close_async_pools()
+
+def run():
+    """Entry point: run main() on an event loop psycopg supports"""
+    return run_async(main())
 
 if __name__ == "__main__":
-    asyncio.run(main()) 
\ No newline at end of file
+    run() 
\ No newline at end of file
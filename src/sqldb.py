@@ -1,47 +1,257 @@
+import sys
+import asyncio
 import psycopg
 from psycopg.rows import dict_row
+from psycopg.pq import TransactionStatus
+from psycopg_pool import AsyncConnectionPool, ConnectionPool
 import os
-from typing import Optional, Any, Dict, List
+import atexit
+import threading
+import itertools
+import contextvars
+from typing import Optional, Any, Coroutine, Dict, Iterator, List, Sequence, TypeVar, Union
 from datetime import datetime
 
+# 每個數據庫名稱一個進程內共用的連接池, 第一次使用時建立
+_pools: Dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+_async_pools: Dict[str, AsyncConnectionPool] = {}
+
+# Names of the server-side cursors opened by Database.stream
+_stream_ids = itertools.count(1)
+
+# Rows fetched per round trip when streaming
+STREAM_ITERSIZE = 2000
+
+# Queries shared by Database and AsyncDatabase
+LATEST_RECORD_SQL = """
+    SELECT {columns}
+    FROM system_records_latest l
+    JOIN system_records r ON r.id = l.record_id
+    WHERE l.serialnumber = %s
+"""
+
+# Newest record of every serial number, in the order of the preview (html_preview.py)
+LATEST_RECORDS_SQL = """
+    SELECT {columns}
+    FROM system_records_latest l
+    JOIN system_records r ON r.id = l.record_id
+    ORDER BY l.created_at DESC NULLS LAST, l.serialnumber
+"""
+
+RECORD_BY_SN_COLUMNS = """
+    r.serialnumber as "SerialNumber",
+    r.manufacturer as "Manufacturer",
+    r.model as "Model",
+    r.systemsku as "SystemSKU",
+    r.operatingsystem as "OperatingSystem",
+    r.cpu as "CPU",
+    r.graphicscard as "GraphicsCard",
+    r.ram_gb as "RAM_GB",
+    r.disks as "Disks",
+    r.full_charge_capacity as "Full_Charge_Capacity",
+    r.battery_health as "Battery_Health",
+    r.touchscreen as "TouchScreen"
+"""
+
+UPDATED_RECORDS_SQL = """
+    SELECT 
+        serialnumber,
+        manufacturer,
+        model,
+        ram_gb,
+        disks,
+        full_charge_capacity,
+        battery_health,
+        updated_at
+    FROM system_records 
+    WHERE updated_at > %s
+    ORDER BY updated_at DESC
+"""
+
+def db_config(db_name: str) -> Dict[str, str]:
+    """Connection parameters of a database"""
+    return {
+        'host': os.getenv('DB_HOST', '192.168.0.10'),
+        'dbname': db_name,
+        'user': os.getenv('DB_USER', 'zero'),
+        'password': os.getenv('DB_PASSWORD', 'zero')
+    }
+
+def connection_string(config: Dict[str, str]) -> str:
+    """Connection string of connection parameters"""
+    return " ".join(f"{key}={value}" for key, value in config.items())
+
+# record_counters is maintained by triggers (see add_record_counters.py)
+COUNTERS_SQL = "SELECT name, count FROM record_counters"
+
+def _counters(rows: Sequence[Dict]) -> Dict[str, Any]:
+    """Shape record_counters rows for get_counters"""
+    counts = {row['name']: row['count'] for row in rows}
+    by_status = {name.split(':', 1)[1]: count for name, count in counts.items()
+                 if name.startswith('system_records:')}
+    return {
+        'system_records': counts.get('system_records', 0),
+        'latest': counts.get('system_records_latest', 0),
+        'product_keys': counts.get('product_keys', 0),
+        'pending': by_status.get('pending', 0),
+        'synced': by_status.get('synced', 0),
+        'by_status': by_status
+    }
+
+def _decimals_to_float(record: Dict, keys: Sequence[str]) -> Dict:
+    """Convert Decimal values to float for JSON serialization"""
+    for key in keys:
+        if key in record and record[key] is not None:
+            record[key] = float(record[key])
+    return record
+
+def _reset_connection(connection: psycopg.Connection) -> None:
+    """Restore defaults on a connection returned to the pool"""
+    connection.autocommit = False
+
+def get_pool(db_name: str, conninfo: str) -> ConnectionPool:
+    """Get the connection pool of a database, creating it on first use
+
+    Sizes come from DB_POOL_MIN / DB_POOL_MAX. Idle connections are closed
+    after DB_POOL_MAX_IDLE seconds and checked before being handed out.
+    """
+    with _pools_lock:
+        pool = _pools.get(db_name)
+        if pool is None:
+            pool = ConnectionPool(
+                conninfo,
+                min_size=int(os.getenv('DB_POOL_MIN', '1')),
+                max_size=int(os.getenv('DB_POOL_MAX', '10')),
+                max_idle=float(os.getenv('DB_POOL_MAX_IDLE', '600')),
+                timeout=float(os.getenv('DB_POOL_TIMEOUT', '30')),
+                check=ConnectionPool.check_connection,
+                reset=_reset_connection,
+                name=db_name,
+                open=True
+            )
+            _pools[db_name] = pool
+        return pool
+
+def close_pools() -> None:
+    """Close every connection pool"""
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
+
+atexit.register(close_pools)
+
+async def _reset_async_connection(connection: psycopg.AsyncConnection) -> None:
+    """Restore defaults on a connection returned to an async pool"""
+    await connection.set_autocommit(False)
+
+async def get_async_pool(db_name: str, conninfo: str) -> AsyncConnectionPool:
+    """Get the async connection pool of a database, creating it on first use
+
+    Uses the same DB_POOL_* settings as get_pool. The pool belongs to the
+    event loop that created it.
+    """
+    pool = _async_pools.get(db_name)
+    if pool is None:
+        pool = AsyncConnectionPool(
+            conninfo,
+            min_size=int(os.getenv('DB_POOL_MIN', '1')),
+            max_size=int(os.getenv('DB_POOL_MAX', '10')),
+            max_idle=float(os.getenv('DB_POOL_MAX_IDLE', '600')),
+            timeout=float(os.getenv('DB_POOL_TIMEOUT', '30')),
+            check=AsyncConnectionPool.check_connection,
+            reset=_reset_async_connection,
+            name=f"{db_name}_async",
+            open=False
+        )
+        _async_pools[db_name] = pool
+    # Opening an open pool is a no-op
+    await pool.open()
+    return pool
+
+async def close_async_pools() -> None:
+    """Close every async connection pool, call before the event loop ends"""
+    pools = list(_async_pools.values())
+    _async_pools.clear()
+    for pool in pools:
+        await pool.close()
+
+T = TypeVar('T')
+
+def run_async(main: Coroutine[Any, Any, T]) -> T:
+    """Run the main coroutine of an async entry point (asyncio.run)
+    
+    On Windows asyncio.run uses the ProactorEventLoop, on which psycopg
+    refuses to open async connections, so every AsyncConnectionPool.getconn
+    would time out. The selector loop is used there instead.
+    """
+    if sys.platform == 'win32':
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+    return asyncio.run(main)
+
 class Database:
     def __init__(self, db_name: str = 'zerodb'):
         """Initialize database connection parameters"""
-        self.connection = None
-        self.cursor = None
+        self.db_name = db_name
+        # Connection and cursor are checked out per thread, so one instance can be
+        # shared by the Flask threads and the watcher thread
+        self._local = threading.local()
         # 新增: 支援多數據庫配置
         self.db_configs = {
-            'zerodb': {
-                'host': os.getenv('DB_HOST', '192.168.0.10'),
-                'dbname': 'zerodb',
-                'user': os.getenv('DB_USER', 'zero'),
-                'password': os.getenv('DB_PASSWORD', 'zero')
-            },
-            'zerodev': {  # 新數據庫配置
-                'host': os.getenv('DB_HOST', '192.168.0.10'),
-                'dbname': 'zerodev',
-                'user': os.getenv('DB_USER', 'zero'),
-                'password': os.getenv('DB_PASSWORD', 'zero')
-            }
+            'zerodb': db_config('zerodb'),
+            'zerodev': db_config('zerodev')  # 新數據庫配置
         }
         self.config = self.db_configs[db_name]
 
+    @property
+    def connection(self) -> Optional[psycopg.Connection]:
+        return getattr(self._local, 'connection', None)
+
+    @property
+    def cursor(self) -> Optional[psycopg.Cursor]:
+        return getattr(self._local, 'cursor', None)
+
     def connect(self) -> None:
-        """Establish connection to the PostgreSQL database"""
-        try:
-            # Create connection string
-            conn_string = " ".join(f"{key}={value}" for key, value in self.config.items())
-            self.connection = psycopg.connect(conn_string)
-            self.cursor = self.connection.cursor(row_factory=dict_row)
-        except Exception as e:
-            raise Exception(f"Error connecting to PostgreSQL: {str(e)}")
+        """Check out a pooled connection for the current thread
+
+        Nested connect calls (e.g. a ``with db:`` inside another one) reuse
+        the connection already checked out by the thread.
+        """
+        state = self._local
+        depth = getattr(state, 'depth', 0)
+        if depth == 0:
+            try:
+                state.pool = get_pool(self.db_name, connection_string(self.config))
+                state.connection = state.pool.getconn()
+                state.cursor = state.connection.cursor(row_factory=dict_row)
+            except Exception as e:
+                state.connection = None
+                state.cursor = None
+                raise Exception(f"Error connecting to PostgreSQL: {str(e)}")
+        state.depth = depth + 1
 
     def disconnect(self) -> None:
-        """Close database connection and cursor"""
-        if self.cursor:
-            self.cursor.close()
-        if self.connection:
-            self.connection.close()
+        """Return the thread's connection to the pool, discarding uncommitted work"""
+        state = self._local
+        depth = getattr(state, 'depth', 0)
+        if depth > 1:
+            state.depth = depth - 1
+            return
+        state.depth = 0
+
+        connection, cursor = self.connection, self.cursor
+        state.connection = None
+        state.cursor = None
+        if cursor:
+            cursor.close()
+        if connection:
+            try:
+                if connection.info.transaction_status != TransactionStatus.IDLE:
+                    connection.rollback()
+            except Exception:
+                pass  # Broken connections are discarded by the pool
+            state.pool.putconn(connection)
 
     def __enter__(self):
         """Context manager entry"""
@@ -67,36 +277,128 @@ class Database:
             self.connection.rollback()
             raise Exception(f"Query execution failed: {str(e)}")
 
+    def execute_pipeline(self, query: str, params_seq: Sequence[Any]) -> List[Union[List[Dict], Exception]]:
+        """
+        Execute a query once per parameter set in pipeline mode
+        
+        Every statement of the batch is sent before waiting for results, so
+        the network round trip is paid once per batch instead of once per
+        statement. Each statement runs in its own savepoint: a failing one
+        is rolled back alone and the rest of the batch is sent again from
+        the next statement. The caller commits.
+        
+        Args:
+            query: SQL query string
+            params_seq: Parameters of each execution
+            
+        Returns:
+            list: Fetched rows of each execution, or the exception it raised
+        """
+        params_seq = list(params_seq)
+        results: List[Union[List[Dict], Exception]] = [[] for _ in params_seq]
+        start = 0
+        while start < len(params_seq):
+            cursors = []
+            error = None
+            try:
+                with self.connection.pipeline() as pipeline:
+                    for params in params_seq[start:]:
+                        self.connection.execute("SAVEPOINT pipeline_row")
+                        cursor = self.connection.cursor(row_factory=dict_row)
+                        cursor.execute(query, params)
+                        cursors.append(cursor)
+                        self.connection.execute("RELEASE SAVEPOINT pipeline_row")
+                    pipeline.sync()
+            except psycopg.Error as e:
+                error = e
+            
+            # Statements after a failure in the pipeline have no result
+            failed = None
+            for offset, cursor in enumerate(cursors):
+                if cursor.pgresult is None:
+                    failed = start + offset
+                    break
+                results[start + offset] = cursor.fetchall() if cursor.description else []
+            
+            if error is None:
+                break
+            if failed is None:
+                raise error
+            results[failed] = error
+            self.connection.execute("ROLLBACK TO SAVEPOINT pipeline_row")
+            self.connection.execute("RELEASE SAVEPOINT pipeline_row")
+            start = failed + 1
+        return results
+
+    def stream(self, query: str, params: Optional[tuple] = None,
+               itersize: int = STREAM_ITERSIZE) -> Iterator[Dict]:
+        """
+        Execute a query with a named server-side cursor and yield its rows
+        
+        Rows are fetched itersize at a time while the caller consumes them,
+        so a full-table read neither holds the whole result in memory nor
+        waits for the last row before the first one is processed. The
+        cursor lives in the current transaction: do not commit or roll back
+        this connection until the iteration is finished (use another
+        Database connection for writes). Closing the generator early closes
+        the cursor.
+        
+        Args:
+            query: SQL query string
+            params: Query parameters (optional)
+            itersize: Rows fetched per round trip
+            
+        Yields:
+            dict: Each row of the result
+        """
+        name = f"stream_{os.getpid()}_{next(_stream_ids)}"
+        with self.connection.cursor(name=name, row_factory=dict_row) as cursor:
+            cursor.itersize = itersize
+            cursor.execute(query, params)
+            yield from cursor
+
+    def get_latest_record(self, serial_number: str, columns: str = "r.*") -> Optional[Dict]:
+        """
+        Get the newest system record of a serial number
+        
+        Args:
+            serial_number: Serial number
+            columns: Select list, columns of system_records aliased as r
+            
+        Returns:
+            dict: The record, None if the serial number is unknown
+        """
+        self.cursor.execute(LATEST_RECORD_SQL.format(columns=columns), (serial_number,))
+        return self.cursor.fetchone()
+
+    def get_batteries(self, record_ids: Sequence[int]) -> Dict[int, List[Dict]]:
+        """
+        Get the numeric battery rows of records (see add_battery_table.py)
+        
+        Args:
+            record_ids: System record IDs
+            
+        Returns:
+            dict: Record ID -> batteries ordered by battery_index, records without battery data are absent
+        """
+        self.cursor.execute("""
+            SELECT record_id, battery_index, design_capacity, full_charge_capacity, cycle_count, health
+            FROM system_record_batteries
+            WHERE record_id = ANY(%s)
+            ORDER BY record_id, battery_index
+        """, (list(record_ids),))
+        batteries: Dict[int, List[Dict]] = {}
+        for battery in self.cursor.fetchall():
+            batteries.setdefault(battery['record_id'], []).append(battery)
+        return batteries
+
     def get_record_by_sn(self, serial_number):
         """Get a record by serial number"""
         try:
-            self.cursor.execute("""
-                SELECT 
-                    serialnumber as "SerialNumber",
-                    manufacturer as "Manufacturer",
-                    model as "Model",
-                    systemsku as "SystemSKU",
-                    operatingsystem as "OperatingSystem",
-                    cpu as "CPU",
-                    graphicscard as "GraphicsCard",
-                    ram_gb as "RAM_GB",
-                    disks as "Disks",
-                    full_charge_capacity as "Full_Charge_Capacity",
-                    battery_health as "Battery_Health",
-                    touchscreen as "TouchScreen"
-                FROM system_records 
-                WHERE serialnumber = %s 
-                ORDER BY created_at DESC 
-                LIMIT 1
-            """, (serial_number,))
-            record = self.cursor.fetchone()
+            record = self.get_latest_record(serial_number, RECORD_BY_SN_COLUMNS)
             if record:
                 # Convert Decimal types to float for JSON serialization
-                record_dict = dict(record)
-                for key in ['Full_Charge_Capacity', 'Battery_Health']:
-                    if key in record_dict and record_dict[key] is not None:
-                        record_dict[key] = float(record_dict[key])
-                return record_dict
+                return _decimals_to_float(dict(record), ['Full_Charge_Capacity', 'Battery_Health'])
             return None
         except Exception as e:
             print(f"Error getting record by SN: {str(e)}")
@@ -104,32 +406,27 @@ class Database:
             traceback.print_exc()
             return None
 
+    def get_counters(self) -> Dict[str, Any]:
+        """
+        Get the row counts kept by the record_counters triggers
+        
+        Returns:
+            dict: system_records, latest (serial numbers in system_records_latest),
+                product_keys, pending and synced counts,
+                and by_status with the system_records count of every sync_status
+        """
+        self.cursor.execute(COUNTERS_SQL)
+        return _counters(self.cursor.fetchall())
+
     def get_updated_records(self, last_sync_time: Optional[datetime] = None) -> List[Dict]:
         """獲取上次同步後更新的記錄"""
         try:
-            query = """
-                SELECT 
-                    serialnumber,
-                    manufacturer,
-                    model,
-                    ram_gb,
-                    disks,
-                    full_charge_capacity,
-                    battery_health,
-                    updated_at
-                FROM system_records 
-                WHERE updated_at > %s
-                ORDER BY updated_at DESC
-            """
-            
-            self.cursor.execute(query, (last_sync_time or datetime.min,))
+            self.cursor.execute(UPDATED_RECORDS_SQL, (last_sync_time or datetime.min,))
             records = self.cursor.fetchall()
             
             # Convert Decimal types to float for JSON serialization
             for record in records:
-                for key in ['full_charge_capacity', 'battery_health']:
-                    if key in record and record[key] is not None:
-                        record[key] = float(record[key])
+                _decimals_to_float(record, ['full_charge_capacity', 'battery_health'])
             
             return records
         except Exception as e:
@@ -137,3 +434,129 @@ class Database:
             import traceback
             traceback.print_exc()
             return []
+
+class _AsyncState:
+    """Connection checked out by one asyncio task"""
+    def __init__(self, pool: AsyncConnectionPool, connection: psycopg.AsyncConnection):
+        self.pool = pool
+        self.connection = connection
+        self.cursor = connection.cursor(row_factory=dict_row)
+        self.depth = 1
+
+class AsyncDatabase:
+    def __init__(self, db_name: str = 'zerodb'):
+        """Asyncio counterpart of Database, for the async sync services
+
+        Connections come from a per-database AsyncConnectionPool and are
+        checked out per task (the state lives in a context variable), so one
+        instance can be shared by concurrent tasks and queries no longer
+        block the event loop.
+
+        Args:
+            db_name: Database name
+        """
+        self.db_name = db_name
+        self.config = db_config(db_name)
+        self._state: contextvars.ContextVar[Optional[_AsyncState]] = contextvars.ContextVar(
+            f"async_db_{db_name}_{id(self)}", default=None
+        )
+
+    @property
+    def connection(self) -> Optional[psycopg.AsyncConnection]:
+        state = self._state.get()
+        return state.connection if state else None
+
+    @property
+    def cursor(self) -> Optional[psycopg.AsyncCursor]:
+        state = self._state.get()
+        return state.cursor if state else None
+
+    async def connect(self) -> None:
+        """Check out a pooled connection for the current task, nested calls reuse it"""
+        state = self._state.get()
+        if state is not None:
+            state.depth += 1
+            return
+        try:
+            pool = await get_async_pool(self.db_name, connection_string(self.config))
+            connection = await pool.getconn()
+        except Exception as e:
+            raise Exception(f"Error connecting to PostgreSQL: {str(e)}")
+        self._state.set(_AsyncState(pool, connection))
+
+    async def disconnect(self) -> None:
+        """Return the task's connection to the pool, discarding uncommitted work"""
+        state = self._state.get()
+        if state is None:
+            return
+        if state.depth > 1:
+            state.depth -= 1
+            return
+        self._state.set(None)
+
+        await state.cursor.close()
+        try:
+            if state.connection.info.transaction_status != TransactionStatus.IDLE:
+                await state.connection.rollback()
+        except Exception:
+            pass  # Broken connections are discarded by the pool
+        await state.pool.putconn(state.connection)
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.disconnect()
+
+    async def execute_query(self, query: str, params: Optional[tuple] = None) -> None:
+        """
+        Execute a SQL query and commit
+        
+        Args:
+            query: SQL query string
+            params: Query parameters (optional)
+        """
+        try:
+            await self.cursor.execute(query, params)
+            await self.connection.commit()
+        except Exception as e:
+            await self.connection.rollback()
+            raise Exception(f"Query execution failed: {str(e)}")
+
+    async def get_latest_record(self, serial_number: str, columns: str = "r.*") -> Optional[Dict]:
+        """Get the newest system record of a serial number, see Database.get_latest_record"""
+        await self.cursor.execute(LATEST_RECORD_SQL.format(columns=columns), (serial_number,))
+        return await self.cursor.fetchone()
+
+    async def get_record_by_sn(self, serial_number):
+        """Get a record by serial number"""
+        try:
+            record = await self.get_latest_record(serial_number, RECORD_BY_SN_COLUMNS)
+            if record:
+                return _decimals_to_float(dict(record), ['Full_Charge_Capacity', 'Battery_Health'])
+            return None
+        except Exception as e:
+            print(f"Error getting record by SN: {str(e)}")
+            import traceback
+            traceback.print_exc()
+            return None
+
+    async def get_counters(self) -> Dict[str, Any]:
+        """Get the row counts kept by the record_counters triggers, see Database.get_counters"""
+        await self.cursor.execute(COUNTERS_SQL)
+        return _counters(await self.cursor.fetchall())
+
+    async def get_updated_records(self, last_sync_time: Optional[datetime] = None) -> List[Dict]:
+        """獲取上次同步後更新的記錄"""
+        try:
+            await self.cursor.execute(UPDATED_RECORDS_SQL, (last_sync_time or datetime.min,))
+            records = await self.cursor.fetchall()
+            for record in records:
+                _decimals_to_float(record, ['full_charge_capacity', 'battery_health'])
+            return records
+        except Exception as e:
+            print(f"Error getting updated records: {str(e)}")
+            import traceback
+            traceback.print_exc()
+            return []
@@ -87,9 +87,9 @@ def sync_databases():
             """)
             target_db.connection.commit()
             
-            # 2. 獲取源數據庫的所有記錄
+            # 2. 以伺服器端游標讀取源數據庫的記錄, 邊讀取邊寫入目標數據庫
             print(f"讀取 {source_name} 的記錄...")
-            source_db.cursor.execute("""
+            records = source_db.stream("""
                 SELECT 
                     serialnumber, manufacturer, model, systemsku,
                     operatingsystem, cpu, resolution, graphicscard,
@@ -100,7 +100,6 @@ def sync_databases():
                 FROM system_records 
                 ORDER BY id
             """)
-            records = source_db.cursor.fetchall()
             
             # 3. 清空目標數據庫
             print(f"清空 {target_name} 的 system_records 表...")
@@ -129,6 +128,7 @@ def sync_databases():
                             %(created_at)s, %(is_current)s, %(sync_status)s, %(last_sync_time)s,
                             %(sync_version)s, %(started_at)s
                         )
+                        ON CONFLICT (serialnumber, created_at) DO NOTHING
                     """, record)
                     records_processed += 1
                     
@@ -3,7 +3,7 @@ import logging
 from datetime import datetime, timezone
 from typing import Dict, List, Optional
 from dataclasses import dataclass
-from sqldb import Database
+from sqldb import AsyncDatabase
 from inventory_sync.sync_manager import InventorySync
 import json
 
@@ -16,7 +16,7 @@ class SyncStats:
     last_sync_time: Optional[datetime]
 
 class SystemRecordSyncManager:
-    def __init__(self, db: Database, api: InventorySync):
+    def __init__(self, db: AsyncDatabase, api: InventorySync):
         self.db = db
         self.api = api
         self.logger = logging.getLogger("sync_manager")
@@ -32,30 +32,38 @@ class SystemRecordSyncManager:
         self.logger.addHandler(handler)
         self.logger.setLevel(logging.INFO)
 
-    def get_sync_stats(self) -> SyncStats:
-        """獲取同步統計信息"""
+    async def get_sync_stats(self) -> SyncStats:
+        """獲取同步統計信息
+        
+        記錄數來自觸發器維護的計數器，最近一次同步的版本和時間由 last_sync_time 索引取得，
+        不需要掃描整張表。
+        """
         query = """
-            SELECT 
-                COUNT(*) as total_records,
-                COUNT(*) FILTER (WHERE sync_status = 'synced') as synced_records,
-                COUNT(*) FILTER (WHERE sync_status = 'pending') as pending_records,
-                COALESCE(MAX(sync_version), 0.0) as latest_version,
-                MAX(last_sync_time) as last_sync_time
+            SELECT sync_version, last_sync_time
             FROM system_records
+            WHERE last_sync_time IS NOT NULL
+            ORDER BY last_sync_time DESC
+            LIMIT 1
         """
-        with self.db:
-            self.db.cursor.execute(query)
-            stats = self.db.cursor.fetchone()
+        async with self.db:
+            counters = await self.db.get_counters()
+            await self.db.cursor.execute(query)
+            last_sync = await self.db.cursor.fetchone()
             return SyncStats(
-                total_records=stats['total_records'],
-                synced_records=stats['synced_records'],
-                pending_records=stats['pending_records'],
-                latest_version=float(stats['latest_version']),
-                last_sync_time=stats['last_sync_time']
+                total_records=counters['system_records'],
+                synced_records=counters['synced'],
+                pending_records=counters['pending'],
+                latest_version=float(last_sync['sync_version'] or 0.0) if last_sync else 0.0,
+                last_sync_time=last_sync['last_sync_time'] if last_sync else None
             )
 
-    def get_records_to_sync(self, batch_size: int = 100) -> List[Dict]:
-        """獲取需要同步的記錄"""
+    async def get_records_to_sync(self, batch_size: int = 100, after_id: int = 0) -> List[Dict]:
+        """獲取需要同步的記錄
+        
+        Args:
+            batch_size: 每批記錄數
+            after_id: 只取 ID 大於此值的記錄, 讓下一批可以在上一批上傳時先讀取
+        """
         query = """
             SELECT 
                 id,
@@ -77,14 +85,14 @@ class SystemRecordSyncManager:
                 battery_health,
                 created_at
             FROM system_records
-            WHERE sync_status = 'pending'
+            WHERE sync_status = 'pending' AND id > %s
             ORDER BY id
             LIMIT %s
             FOR UPDATE SKIP LOCKED
         """
-        with self.db:
-            self.db.cursor.execute(query, (batch_size,))
-            records = self.db.cursor.fetchall()
+        async with self.db:
+            await self.db.cursor.execute(query, (after_id, batch_size))
+            records = await self.db.cursor.fetchall()
             
             # 轉換記錄格式
             formatted_records = []
@@ -118,7 +126,7 @@ class SystemRecordSyncManager:
             
             return formatted_records
 
-    def update_synced_records(self, record_ids: List[int], new_version: str):
+    async def update_synced_records(self, record_ids: List[int], new_version: str):
         """更新已同步記錄的狀態
         
         Args:
@@ -132,8 +140,8 @@ class SystemRecordSyncManager:
                 last_sync_time = NOW()
             WHERE id = ANY(%s)
         """
-        with self.db:
-            self.db.cursor.execute(query, (new_version, record_ids))
+        async with self.db:
+            await self.db.execute_query(query, (new_version, record_ids))
             self.logger.info(f"Updated {len(record_ids)} records to version {new_version}")
 
     async def sync_batch(self, records: List[Dict]) -> Dict:
@@ -150,7 +158,7 @@ class SystemRecordSyncManager:
             
             if response.get('success'):
                 # 更新已同步記錄的狀態
-                self.update_synced_records(
+                await self.update_synced_records(
                     record_ids=[r['id'] for r in records],
                     new_version=response['sync_version']
                 )
@@ -173,14 +181,16 @@ class SystemRecordSyncManager:
         """執行完整同步過程"""
         try:
             total_synced = 0
-            while True:
-                # 獲取待同步記錄
-                records = self.get_records_to_sync()
-                if not records:
-                    break
-
-                # 同步這批記錄
-                result = await self.sync_batch(records)
+            # 獲取待同步記錄
+            records = await self.get_records_to_sync()
+            while records:
+                # 上傳這批記錄的同時讀取下一批
+                next_records = asyncio.create_task(self.get_records_to_sync(after_id=records[-1]['id']))
+                try:
+                    result = await self.sync_batch(records)
+                except BaseException:
+                    next_records.cancel()
+                    raise
                 if result['success']:
                     total_synced += result['synced_count']
                     self.logger.info(
@@ -188,12 +198,14 @@ class SystemRecordSyncManager:
                         f"New version: {result['new_version']}"
                     )
                 else:
+                    next_records.cancel()
                     raise Exception(result.get('error', 'Sync failed'))
+                records = await next_records
 
             return {
                 'success': True,
                 'total_synced': total_synced,
-                'final_stats': self.get_sync_stats().__dict__
+                'final_stats': (await self.get_sync_stats()).__dict__
             }
 
         except Exception as e:
@@ -207,7 +219,7 @@ class SystemRecordSyncManager:
         """驗證同步狀態"""
         try:
             # 獲取本地狀態
-            local_stats = self.get_sync_stats()
+            local_stats = await self.get_sync_stats()
             
             # 生成批次ID
             batch_id = f"STATUS_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
@@ -0,0 +1,283 @@
+import logging
+import os
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Set
+from sqldb import Database
+from record_normalizer import SYSTEM_RECORD_COLUMNS
+
+logger = logging.getLogger("csv_sync.writer")
+
+WRITE_MODES = ('bulk', 'row')
+COMMIT_MODES = ('batch', 'row')
+
+@dataclass
+class WriteResult:
+    """Outcome of writing a batch of system records"""
+    inserted: List[Dict[str, Any]] = field(default_factory=list)  # {'index', 'id', 'serialnumber'} in input order
+    duplicates: int = 0   # Rows already present (or repeated within the batch)
+    failed: List[Dict[str, Any]] = field(default_factory=list)    # {'index', 'serialnumber', 'error'}
+    mode: str = 'bulk'    # Mode that actually wrote the batch
+
+    @property
+    def inserted_indexes(self) -> List[int]:
+        return [record['index'] for record in self.inserted]
+
+    @property
+    def failed_indexes(self) -> Set[int]:
+        return {record['index'] for record in self.failed}
+
+    @property
+    def latest(self) -> Optional[Dict[str, Any]]:
+        """Last inserted record in input order"""
+        return self.inserted[-1] if self.inserted else None
+
+@dataclass
+class IngestReport:
+    """Per-file summary of an ingest run across the target databases"""
+    file_path: str
+    rows_read: int = 0
+    new_rows: int = 0
+    results: Dict[str, WriteResult] = field(default_factory=dict)
+    failed_rows: Dict[str, List[Dict[str, Any]]] = field(default_factory=dict)  # db_name -> failed rows
+
+    def add_result(self, db_name: str, result: WriteResult, timestamps: Optional[Sequence] = None) -> None:
+        """Record the write result of one database, resolving the failed rows' timestamps"""
+        self.results[db_name] = result
+        self.failed_rows[db_name] = [
+            dict(failed, created_at=timestamps[failed['index']] if timestamps is not None else None)
+            for failed in result.failed
+        ]
+
+    @property
+    def has_failures(self) -> bool:
+        return any(self.failed_rows.values())
+
+    def summary_lines(self) -> List[str]:
+        """Human readable report, one line per database and failed row"""
+        lines = [f"Ingest report for {os.path.basename(self.file_path)}: "
+                 f"{self.rows_read} rows read, {self.new_rows} new"]
+        for db_name, result in self.results.items():
+            lines.append(f"  {db_name}: {len(result.inserted)} inserted, {result.duplicates} existing, "
+                         f"{len(result.failed)} failed ({result.mode} mode)")
+            for failed in self.failed_rows.get(db_name, []):
+                lines.append(f"    row {failed['index']}: SerialNumber={failed['serialnumber']}, "
+                             f"Timestamp={failed['created_at']}: {failed['error'].splitlines()[0]}")
+        return lines
+
+class SystemRecordWriter:
+    def __init__(self, db: Database, columns: Sequence[str] = SYSTEM_RECORD_COLUMNS,
+                 constants: Optional[Dict[str, Any]] = None, mode: str = 'bulk',
+                 commit_mode: str = 'batch', mark_previous_not_current: bool = False):
+        """Insert normalized rows into system_records, skipping existing (serialnumber, created_at)
+
+        Existing records are skipped by the unique key on (serialnumber,
+        created_at) with ON CONFLICT DO NOTHING (see add_record_unique_key.py),
+        so concurrent writers cannot insert the same record twice.
+
+        In bulk mode the batch is COPY'd into a temp staging table and
+        written with a single INSERT ... SELECT, so N rows cost a constant
+        number of round trips. Row mode checks and
+        inserts one row at a time and is used as the fallback when the bulk
+        statement fails (one bad value fails the whole COPY).
+
+        Args:
+            db: Connected Database
+            columns: Column of each value in the rows, must include serialnumber and created_at
+            constants: Extra columns with the same value for every row, e.g. {'is_current': True}
+            mode: 'bulk' or 'row'
+            commit_mode: Row mode pipelines the batch with a savepoint per row and commits
+                once ('batch'), or commits after every insert ('row')
+            mark_previous_not_current: Set is_current = FALSE on older records of the same serial numbers
+        """
+        if mode not in WRITE_MODES:
+            raise ValueError(f"Unknown write mode: {mode}")
+        if commit_mode not in COMMIT_MODES:
+            raise ValueError(f"Unknown commit mode: {commit_mode}")
+        if 'serialnumber' not in columns or 'created_at' not in columns:
+            raise ValueError("columns must include serialnumber and created_at")
+
+        self.db = db
+        self.constants = dict(constants or {})
+        self.columns = list(columns) + list(self.constants)
+        self.mode = mode
+        self.commit_mode = commit_mode
+        self.mark_previous_not_current = mark_previous_not_current
+
+        self.sn_position = self.columns.index('serialnumber')
+        self.ts_position = self.columns.index('created_at')
+
+    def _with_constants(self, rows: Sequence[tuple]) -> List[tuple]:
+        extra = tuple(self.constants.values())
+        return [tuple(row) + extra for row in rows]
+
+    def write(self, rows: Sequence[tuple]) -> WriteResult:
+        """Write the rows, returning the ids of the inserted ones
+
+        Args:
+            rows: Value tuples in the order of the columns given to the writer
+
+        Returns:
+            WriteResult: Inserted records, duplicate count and failed rows
+        """
+        if not rows:
+            return WriteResult(mode=self.mode)
+
+        rows = self._with_constants(rows)
+        if self.mode == 'bulk':
+            try:
+                return self._write_bulk(rows)
+            except Exception as e:
+                self.db.connection.rollback()
+                logger.warning(f"Bulk insert failed, retrying row by row: {str(e)}")
+        return self._write_rows(rows)
+
+    def _write_bulk(self, rows: List[tuple]) -> WriteResult:
+        """COPY into a staging table, then insert the rows not yet present"""
+        cols = ', '.join(self.columns)
+        cursor = self.db.cursor
+
+        # Staging table takes the column types only (no defaults or constraints),
+        # so values are parsed exactly as a direct INSERT would parse them
+        cursor.execute(f"""
+            CREATE TEMP TABLE system_records_staging ON COMMIT DROP AS
+            SELECT 0 AS ord, {cols} FROM system_records WITH NO DATA
+        """)
+        with cursor.copy(f"COPY system_records_staging (ord, {cols}) FROM STDIN") as copy:
+            for index, row in enumerate(rows):
+                copy.write_row((index,) + row)
+
+        # Keep the first occurrence of each key and insert in CSV order,
+        # so ids follow the file order as they did with per-row inserts
+        cursor.execute(f"""
+            WITH batch AS (
+                SELECT DISTINCT ON (serialnumber, created_at) *
+                FROM system_records_staging
+                ORDER BY serialnumber, created_at, ord
+            ), inserted AS (
+                INSERT INTO system_records ({cols})
+                SELECT {cols}
+                FROM batch b
+                ORDER BY b.ord
+                ON CONFLICT (serialnumber, created_at) DO NOTHING
+                RETURNING id, serialnumber, created_at
+            )
+            SELECT b.ord AS index, i.id, i.serialnumber
+            FROM inserted i
+            JOIN batch b
+              ON b.serialnumber IS NOT DISTINCT FROM i.serialnumber
+             AND b.created_at IS NOT DISTINCT FROM i.created_at
+            ORDER BY b.ord
+        """)
+        inserted = cursor.fetchall()
+
+        if self.mark_previous_not_current and inserted:
+            # Only the last inserted record of each serial number stays current
+            latest = {}
+            for record in inserted:
+                latest[record['serialnumber']] = record['id']
+            cursor.execute("""
+                UPDATE system_records
+                SET is_current = FALSE
+                WHERE serialnumber = ANY(%s) AND id <> ALL(%s) AND is_current
+            """, ([sn for sn in latest if sn is not None], list(latest.values())))
+
+        self.db.connection.commit()
+        return WriteResult(
+            inserted=[dict(record) for record in inserted],
+            duplicates=len(rows) - len(inserted),
+            mode='bulk'
+        )
+
+    def _write_rows(self, rows: List[tuple]) -> WriteResult:
+        """Check and insert one row at a time, each row getting its own RETURNING id
+
+        With commit_mode 'batch' the rows are sent in pipeline mode with a
+        savepoint per row and committed once, so a bad row is rolled back
+        alone. With 'row' every insert is committed on its own.
+        """
+        if self.commit_mode == 'batch':
+            return self._write_pipelined(rows)
+
+        cols = ', '.join(self.columns)
+        placeholders = ', '.join(['%s'] * len(self.columns))
+        cursor = self.db.cursor
+        result = WriteResult(mode='row')
+
+        for index, row in enumerate(rows):
+            serialnumber = row[self.sn_position]
+            try:
+                cursor.execute(f"""
+                    INSERT INTO system_records ({cols})
+                    VALUES ({placeholders})
+                    ON CONFLICT (serialnumber, created_at) DO NOTHING
+                    RETURNING id
+                """, row)
+                inserted = cursor.fetchone()
+                if not inserted:
+                    result.duplicates += 1
+                    continue
+                record_id = inserted['id']
+
+                if self.mark_previous_not_current and serialnumber:
+                    cursor.execute("""
+                        UPDATE system_records
+                        SET is_current = FALSE
+                        WHERE serialnumber = %s AND id <> %s AND is_current
+                    """, (serialnumber, record_id))
+
+                self.db.connection.commit()
+                result.inserted.append({'index': index, 'id': record_id, 'serialnumber': serialnumber})
+
+            except Exception as e:
+                self.db.connection.rollback()
+                result.failed.append({'index': index, 'serialnumber': serialnumber, 'error': str(e)})
+
+        return result
+
+    def _write_pipelined(self, rows: List[tuple]) -> WriteResult:
+        """Dedupe, insert and status update of every row in one pipelined batch"""
+        cols = ', '.join(self.columns)
+        placeholders = ', '.join(['%s'] * len(self.columns))
+
+        # The is_current update runs in the same statement as the insert,
+        # so no row needs a result before the next one can be sent
+        update = ""
+        if self.mark_previous_not_current:
+            update = """, previous AS (
+                    UPDATE system_records r
+                    SET is_current = FALSE
+                    FROM inserted i
+                    WHERE r.serialnumber = i.serialnumber AND r.id <> i.id AND r.is_current
+                )"""
+        query = f"""
+            WITH inserted AS (
+                INSERT INTO system_records ({cols})
+                VALUES ({placeholders})
+                ON CONFLICT (serialnumber, created_at) DO NOTHING
+                RETURNING id, serialnumber
+            ){update}
+            SELECT id FROM inserted
+        """
+        result = WriteResult(mode='row')
+
+        try:
+            outcomes = self.db.execute_pipeline(query, rows)
+            for index, (row, outcome) in enumerate(zip(rows, outcomes)):
+                serialnumber = row[self.sn_position]
+                if isinstance(outcome, Exception):
+                    result.failed.append({'index': index, 'serialnumber': serialnumber, 'error': str(outcome)})
+                elif outcome:
+                    result.inserted.append({'index': index, 'id': outcome[0]['id'], 'serialnumber': serialnumber})
+                else:
+                    result.duplicates += 1
+            self.db.connection.commit()
+        except Exception as e:
+            # Nothing of the batch was written, rows that failed on their own keep their error
+            self.db.connection.rollback()
+            errors = {failed['index']: failed['error'] for failed in result.failed}
+            result = WriteResult(failed=[
+                {'index': index, 'serialnumber': row[self.sn_position], 'error': errors.get(index, str(e))}
+                for index, row in enumerate(rows)
+            ], mode='row')
+
+        return result
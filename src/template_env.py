@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+預覽和標籤共用的 Jinja 模板環境。
+
+模板放在 src/templates，第一次使用時編譯一次，之後由 Environment 保留編譯結果；
+編譯後的 bytecode 另外存放在 cache/jinja，重新啟動程式時不必再次編譯。
+啟動時呼叫 precompile_templates() 可以預先載入全部模板，
+第一次預覽和第一次打印標籤就不需要等待編譯（main.py 和 app.py 啟動時會預先編譯，
+設定環境變數 PRECOMPILE_TEMPLATES=0 則改為第一次使用時才編譯）。
+"""
+
+import os
+import threading
+from typing import Optional
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, Template
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(__file__), 'templates')
+
+# 預設為專案根目錄的 cache/jinja（與 csv_cache 相同的 cache 目錄）
+BYTECODE_CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'cache', 'jinja')
+
+# precompile_templates 預先載入的模板
+TEMPLATES = ('preview.html', 'label.html')
+
+_environment: Optional[Environment] = None
+_environment_lock = threading.Lock()
+
+def get_environment() -> Environment:
+    """Get the shared template environment, creating it on first use"""
+    global _environment
+    with _environment_lock:
+        if _environment is None:
+            bytecode_cache = None
+            try:
+                os.makedirs(BYTECODE_CACHE_DIR, exist_ok=True)
+                bytecode_cache = FileSystemBytecodeCache(BYTECODE_CACHE_DIR)
+            except OSError as e:
+                # 無法寫入快取目錄時仍可使用，只是每次啟動都要編譯
+                print(f"Template bytecode cache disabled: {str(e)}")
+            # 模板不會在執行期間修改，不需要檢查檔案是否更新
+            _environment = Environment(
+                loader=FileSystemLoader(TEMPLATE_DIR),
+                bytecode_cache=bytecode_cache,
+                auto_reload=False,
+            )
+        return _environment
+
+def get_template(name: str) -> Template:
+    """Get a compiled template of src/templates"""
+    return get_environment().get_template(name)
+
+def precompile_templates() -> None:
+    """Compile all templates now instead of on their first use"""
+    for name in TEMPLATES:
+        get_template(name)
@@ -0,0 +1,53 @@
+import os
+import sys
+import asyncio
+import psycopg
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import run_sync
+from inventory_sync import sync_manager as inventory_sync_manager
+
+class FakeProactorEventLoop(asyncio.SelectorEventLoop):
+    """Stands in for the Windows default loop psycopg rejects"""
+
+class FakeProactorPolicy(asyncio.DefaultEventLoopPolicy):
+    def new_event_loop(self):
+        return FakeProactorEventLoop()
+
+@pytest.fixture
+def windows_loops(monkeypatch):
+    """Simulate the Windows event loops: Proactor by default, selector loop via WindowsSelectorEventLoopPolicy"""
+    monkeypatch.setattr(sys, 'platform', 'win32')
+    monkeypatch.setattr(asyncio, 'ProactorEventLoop', FakeProactorEventLoop, raising=False)
+    monkeypatch.setattr(asyncio, 'WindowsSelectorEventLoopPolicy', asyncio.DefaultEventLoopPolicy, raising=False)
+    asyncio.set_event_loop_policy(FakeProactorPolicy())
+    yield
+    asyncio.set_event_loop_policy(None)
+
+async def connect_attempt():
+    """Open an async connection to a server that does not exist
+
+    psycopg checks the event loop before connecting: on the Proactor loop
+    it raises InterfaceError, on a usable loop the connection itself fails.
+    """
+    with pytest.raises(psycopg.OperationalError):
+        await psycopg.AsyncConnection.connect("host=/nonexistent port=1 dbname=x connect_timeout=1")
+    return type(asyncio.get_running_loop())
+
+def test_proactor_loop_is_rejected(windows_loops):
+    async def attempt():
+        with pytest.raises(psycopg.InterfaceError):
+            await psycopg.AsyncConnection.connect("host=/nonexistent port=1 dbname=x connect_timeout=1")
+    asyncio.run(attempt())
+
+def test_run_sync_entry_point_uses_selector_loop(windows_loops, monkeypatch):
+    monkeypatch.setattr(run_sync, 'main', connect_attempt)
+    loop_type = run_sync.run()
+    assert not issubclass(loop_type, FakeProactorEventLoop)
+
+def test_inventory_sync_entry_point_uses_selector_loop(windows_loops, monkeypatch):
+    monkeypatch.setattr(inventory_sync_manager, 'run_sync', lambda env: connect_attempt())
+    loop_type = inventory_sync_manager.main()
+    assert not issubclass(loop_type, FakeProactorEventLoop)
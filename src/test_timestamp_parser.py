@@ -0,0 +1,28 @@
+import os
+import sys
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from timestamp_parser import detect_format, parse_timestamps, parse_with_format
+
+def test_detected_format_parses_every_row():
+    values = pd.Series(['03/05/2025 10:00', '03/05/2025 14:30', None])
+    assert detect_format(values) == '%m/%d/%Y %H:%M'
+    parsed, fallback_count = parse_with_format(values, detect_format(values))
+    assert fallback_count == 0
+    assert list(parsed[:2]) == [pd.Timestamp('2025-03-05 10:00'), pd.Timestamp('2025-03-05 14:30')]
+    assert pd.isna(parsed[2])
+
+def test_fallback_keeps_wall_clock_time_of_offsets():
+    values = pd.Series(['2025-03-05 10:00:00', '2025-03-05 10:00:00+08:00', '2025-03-05T23:30:00-05:00', 'junk'])
+    parsed, fallback_count = parse_with_format(values, '%Y-%m-%d %H:%M:%S')
+    assert fallback_count == 3
+    assert parsed.dtype == 'datetime64[ns]'
+    assert list(parsed[:3]) == [pd.Timestamp('2025-03-05 10:00'), pd.Timestamp('2025-03-05 10:00'),
+                                pd.Timestamp('2025-03-05 23:30')]
+    assert pd.isna(parsed[3])
+
+def test_column_with_offsets_only():
+    parsed = parse_timestamps(pd.Series(['2025-03-05 10:00:00+08:00']))
+    assert parsed[0] == pd.Timestamp('2025-03-05 10:00')
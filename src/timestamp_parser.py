@@ -0,0 +1,130 @@
+from typing import Dict, Hashable, Optional, Sequence, Tuple
+import pandas as pd
+
+# Formats seen in the intake CSVs, in order of preference when a sample fits several
+TIMESTAMP_FORMATS = [
+    '%m/%d/%Y %H:%M',
+    '%m/%d/%Y %H:%M:%S',
+    '%m/%d/%Y %I:%M:%S %p',
+    '%m/%d/%Y %I:%M %p',
+    '%Y-%m-%d %H:%M:%S',
+    '%Y-%m-%d %H:%M',
+    '%Y-%m-%dT%H:%M:%S',
+    '%Y/%m/%d %H:%M:%S',
+    '%d/%m/%Y %H:%M',
+    '%d/%m/%Y %H:%M:%S',
+    '%m/%d/%Y',
+    '%Y-%m-%d',
+]
+
+def _clean(values: pd.Series) -> pd.Series:
+    """Stripped text values, NA kept as NA"""
+    return values.astype('string').str.strip().replace('', pd.NA)
+
+def _parse_wall_clock(value: str) -> pd.Timestamp:
+    """Parse one value of any format, an offset is dropped and the written wall-clock time kept"""
+    timestamp = pd.to_datetime(value, errors='coerce')
+    if timestamp is not pd.NaT and timestamp.tzinfo is not None:
+        timestamp = timestamp.tz_localize(None)
+    return timestamp
+
+def detect_format(values: pd.Series, sample_size: int = 200,
+                  formats: Sequence[str] = TIMESTAMP_FORMATS) -> Optional[str]:
+    """Infer the timestamp format of a column from a sample of its values
+
+    Args:
+        values: Raw timestamp strings
+        sample_size: Number of non-empty values tried against each format
+        formats: Candidate strftime formats
+
+    Returns:
+        Optional[str]: Format parsing the most sample values, None if none fits
+    """
+    sample = _clean(values).dropna().head(sample_size)
+    if sample.empty:
+        return None
+
+    best_format, best_count = None, 0
+    for fmt in formats:
+        parsed = pd.to_datetime(sample, format=fmt, errors='coerce')
+        count = int(parsed.notna().sum())
+        if count > best_count:
+            best_format, best_count = fmt, count
+            if count == len(sample):
+                break
+    return best_format
+
+def parse_with_format(values: pd.Series, fmt: Optional[str]) -> Tuple[pd.Series, int]:
+    """Parse a column with one explicit format, falling back only for the rows that fail
+
+    Args:
+        values: Raw timestamp strings
+        fmt: strftime format, None to use the mixed parser for every row
+
+    Returns:
+        tuple: (naive datetime64 series with NaT for unparseable rows, number of rows that needed the fallback)
+    """
+    text = _clean(values)
+    if fmt is not None:
+        parsed = pd.to_datetime(text, format=fmt, errors='coerce')
+    else:
+        parsed = pd.Series(pd.NaT, index=text.index, dtype='datetime64[ns]')
+
+    failed = parsed.isna() & text.notna()
+    fallback_count = int(failed.sum())
+    if fallback_count:
+        parsed[failed] = pd.to_datetime(text[failed].map(_parse_wall_clock))
+    return parsed, fallback_count
+
+def parse_timestamps(values: pd.Series) -> pd.Series:
+    """Detect the format of a column and parse it in one vectorized call"""
+    parsed, _ = parse_with_format(values, detect_format(values))
+    return parsed
+
+class TimestampParser:
+    def __init__(self, sample_size: int = 200, max_fallback_ratio: float = 0.5):
+        """Timestamp parser caching the detected format per file
+
+        Each intake CSV uses one format, so the format is detected once from
+        a sample and reused for every later read of the same file, as long
+        as its fingerprint (e.g. inode and header line) is unchanged.
+
+        Args:
+            sample_size: Number of values used to detect a format
+            max_fallback_ratio: Drop the cached format when more rows than this need the fallback
+        """
+        self.sample_size = sample_size
+        self.max_fallback_ratio = max_fallback_ratio
+        self.formats: Dict[Hashable, Tuple[Hashable, Optional[str]]] = {}
+        self.last_fallback_count = 0
+
+    def format_for(self, values: pd.Series, key: Hashable = None, fingerprint: Hashable = None) -> Optional[str]:
+        """Cached format of a file, detected from values when missing or stale"""
+        cached = self.formats.get(key) if key is not None else None
+        if cached is not None and cached[0] == fingerprint:
+            return cached[1]
+
+        fmt = detect_format(values, self.sample_size)
+        if key is not None and fmt is not None:
+            self.formats[key] = (fingerprint, fmt)
+        return fmt
+
+    def parse(self, values: pd.Series, key: Hashable = None, fingerprint: Hashable = None) -> pd.Series:
+        """Parse a timestamp column using the cached format of its file
+
+        Args:
+            values: Raw timestamp strings
+            key: Cache key, usually the file path
+            fingerprint: Value identifying the file version, the format is detected again when it changes
+
+        Returns:
+            pd.Series: Naive timestamps, NaT for rows no format could parse
+        """
+        fmt = self.format_for(values, key, fingerprint)
+        parsed, self.last_fallback_count = parse_with_format(values, fmt)
+
+        # The file no longer matches its cached format, detect again next time
+        present = int(values.notna().sum())
+        if key is not None and present and self.last_fallback_count > present * self.max_fallback_ratio:
+            self.formats.pop(key, None)
+        return parsed